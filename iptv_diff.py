@@ -0,0 +1,218 @@
+import argparse
+import json
+import sys
+import time
+
+from iptv_json_cmcc import ModelCache, load_converter
+
+# 比较的频道属性
+CHANNEL_FIELDS = ('title', 'channelnum', 'icon', 'timeshiftAvailable', 'lookbackAvailable', 'isCharge')
+# 比较的流地址字段
+STREAM_FIELDS = ('zteurl', 'hwurl')
+
+
+def load_channels(json_file, cache=None):
+    """加载并整理频道数据，两种JSON格式均可"""
+    return load_converter(json_file, cache).channels
+
+
+def _bitrate_type(phychannel):
+    return str(phychannel.get('bitrateType') or '').strip()
+
+
+def _stream_addresses(phychannel):
+    """物理频道的组播地址集合（ip:port），与JSON格式无关"""
+    params = phychannel.get('params') or {}
+    urls = ((params.get(field) or '').strip() for field in STREAM_FIELDS)
+    return {url.split('://', 1)[-1].lstrip('@') for url in urls if url}
+
+
+def _same_code(old_phychannel, new_phychannel):
+    return bool(old_phychannel.get('code')) and old_phychannel.get('code') == new_phychannel.get('code')
+
+
+def _same_stream(old_phychannel, new_phychannel):
+    old_type = _bitrate_type(old_phychannel)
+    new_type = _bitrate_type(new_phychannel)
+    if old_type and new_type and old_type != new_type:
+        return False
+    return not _stream_addresses(old_phychannel).isdisjoint(_stream_addresses(new_phychannel))
+
+
+def _same_bitrate_type(old_phychannel, new_phychannel):
+    return _bitrate_type(old_phychannel) == _bitrate_type(new_phychannel)
+
+
+def _match_phychannels(old_phychannels, new_phychannels):
+    """配对同一频道的新旧物理频道，返回 (配对列表, 未配对的旧物理频道, 未配对的新物理频道)
+
+    依次按物理频道code、共同的组播地址（画质代码相同或一方缺少画质代码）和画质代码配对。
+    getAllChannel.json格式的物理频道没有code和画质代码，按组播地址仍能与getAllChannel2.json中
+    对应的物理频道配对，数据源切换格式时不会被报告为全部画质删除再新增。每个频道只有几个物理频道，逐个比较即可。
+    """
+    old_left = list(old_phychannels)
+    new_left = list(new_phychannels)
+    pairs = []
+    for same in (_same_code, _same_stream, _same_bitrate_type):
+        for new_phychannel in list(new_left):
+            for position, old_phychannel in enumerate(old_left):
+                if same(old_phychannel, new_phychannel):
+                    pairs.append((old_left.pop(position), new_phychannel))
+                    new_left.remove(new_phychannel)
+                    break
+    return pairs, old_left, new_left
+
+
+def _channel_summary(channel):
+    return {'code': channel.get('code', ''), 'title': channel.get('title', ''), 'channelnum': channel.get('channelnum', '')}
+
+
+def _variant_summary(channel_code, title, phychannel):
+    params = phychannel.get('params') or {}
+    return {
+        'channel_code': channel_code,
+        'title': title,
+        'phychannel_code': phychannel.get('code', ''),
+        'bitrateType': phychannel.get('bitrateType', ''),
+        'bitrateTypeName': phychannel.get('bitrateTypeName', ''),
+        'zteurl': (params.get('zteurl') or '').strip(),
+        'hwurl': (params.get('hwurl') or '').strip()
+    }
+
+
+def _diff_phychannels(channel_code, title, old_phychannels, new_phychannels, report):
+    """比较同一频道下的物理频道，配对后只比较流地址"""
+    pairs, removed, added = _match_phychannels(old_phychannels, new_phychannels)
+    for phychannel in added:
+        report['variants_added'].append(_variant_summary(channel_code, title, phychannel))
+
+    for old_phychannel, phychannel in pairs:
+        if old_phychannel == phychannel:
+            continue
+        old_params = old_phychannel.get('params') or {}
+        params = phychannel.get('params') or {}
+        for field in STREAM_FIELDS:
+            old_url = (old_params.get(field) or '').strip()
+            new_url = (params.get(field) or '').strip()
+            if old_url != new_url:
+                report['streams_moved'].append({
+                    'channel_code': channel_code,
+                    'title': title,
+                    'phychannel_code': phychannel.get('code', ''),
+                    'bitrateTypeName': phychannel.get('bitrateTypeName', ''),
+                    'field': field,
+                    'old': old_url,
+                    'new': new_url
+                })
+
+    for phychannel in removed:
+        report['variants_removed'].append(_variant_summary(channel_code, title, phychannel))
+
+
+def diff_channels(old_channels, new_channels):
+    """比较两份整理后的频道数据，按频道code建立哈希表后各遍历一次，返回可序列化为JSON的报告
+
+    内容完全相同的频道只做一次字典比较，物理频道只在所属频道有变化时才逐个比较。
+    """
+    old_map = {channel.get('code', ''): channel for channel in old_channels}
+    new_map = {channel.get('code', ''): channel for channel in new_channels}
+
+    report = {
+        'channels_added': [],
+        'channels_removed': [],
+        'channels_changed': [],
+        'streams_moved': [],
+        'variants_added': [],
+        'variants_removed': []
+    }
+
+    for code, channel in new_map.items():
+        old_channel = old_map.get(code)
+        if old_channel is None:
+            report['channels_added'].append(_channel_summary(channel))
+            continue
+        if old_channel == channel:
+            continue
+        changes = {}
+        for field in CHANNEL_FIELDS:
+            old_value = old_channel.get(field, '')
+            new_value = channel.get(field, '')
+            if old_value != new_value:
+                changes[field] = [old_value, new_value]
+        if changes:
+            report['channels_changed'].append(dict(_channel_summary(channel), changes=changes))
+        if old_channel['phychannels'] != channel['phychannels']:
+            _diff_phychannels(code, channel.get('title', ''), old_channel['phychannels'], channel['phychannels'], report)
+
+    for code, channel in old_map.items():
+        if code not in new_map:
+            report['channels_removed'].append(_channel_summary(channel))
+
+    report['summary'] = {name: len(items) for name, items in report.items()}
+    report['summary']['old_channels'] = len(old_map)
+    report['summary']['new_channels'] = len(new_map)
+    return report
+
+
+def format_summary(report):
+    """生成可读的变化摘要"""
+    summary = report['summary']
+    lines = [
+        f"频道数: {summary['old_channels']} -> {summary['new_channels']}",
+        f"新增频道 {summary['channels_added']} 个，删除频道 {summary['channels_removed']} 个，"
+        f"属性变化 {summary['channels_changed']} 个，流地址变化 {summary['streams_moved']} 处，"
+        f"新增画质 {summary['variants_added']} 个，删除画质 {summary['variants_removed']} 个"
+    ]
+    for item in report['channels_added']:
+        lines.append(f"  + {item['title']} ({item['channelnum']}) [{item['code']}]")
+    for item in report['channels_removed']:
+        lines.append(f"  - {item['title']} ({item['channelnum']}) [{item['code']}]")
+    for item in report['channels_changed']:
+        changes = ', '.join(f"{field}: {old!r} -> {new!r}" for field, (old, new) in item['changes'].items())
+        lines.append(f"  * {item['title']}: {changes}")
+    for item in report['streams_moved']:
+        lines.append(f"  ~ {item['title']} ({item['bitrateTypeName'] or '未知'}) {item['field']}: {item['old'] or '-'} -> {item['new'] or '-'}")
+    for item in report['variants_added']:
+        lines.append(f"  + {item['title']} 新增画质 {item['bitrateTypeName'] or '未知'} [{item['phychannel_code']}]")
+    for item in report['variants_removed']:
+        lines.append(f"  - {item['title']} 删除画质 {item['bitrateTypeName'] or '未知'} [{item['phychannel_code']}]")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较两份频道JSON文件的变化")
+    parser.add_argument('old_file', help='旧的频道JSON文件')
+    parser.add_argument('new_file', help='新的频道JSON文件')
+    parser.add_argument('--json', metavar='FILE', help='输出JSON格式的变化报告（- 表示标准输出）')
+    parser.add_argument('--quiet', action='store_true', help='不输出可读摘要')
+    parser.add_argument('--no-cache', action='store_true', help='不使用频道数据缓存')
+    args = parser.parse_args(argv)
+
+    cache = None if args.no_cache else ModelCache()
+    start = time.perf_counter()
+    old_channels = load_channels(args.old_file, cache)
+    new_channels = load_channels(args.new_file, cache)
+    loaded = time.perf_counter()
+    report = diff_channels(old_channels, new_channels)
+    report['old_file'] = args.old_file
+    report['new_file'] = args.new_file
+    finished = time.perf_counter()
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write('\n')
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if not args.quiet and args.json != '-':
+        print(format_summary(report))
+        print(f"加载耗时 {loaded - start:.3f}s，比较耗时 {finished - loaded:.3f}s")
+
+    changed = any(report['summary'][name] for name in
+                  ('channels_added', 'channels_removed', 'channels_changed', 'streams_moved',
+                   'variants_added', 'variants_removed'))
+    return 1 if changed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from iptv_json_cmcc import QUALITY_OPTIONS
+from iptv_stream import TS_PACKET_SIZE, open_multicast_socket, parse_stream_address, rtp_payload_range
+from iptv_timeshift import select_channels
+
+SCHEDULE_FILE = 'iptv_dvr_schedule.json'
+RECORDINGS_DIR = 'recordings'
+
+# 每个录制的写入缓冲区：填满一个缓冲区后整块交给写入线程，录制继续写入另一个缓冲区
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+WRITE_BUFFERS = 3
+RECV_SIZE = 65536
+# 每次可读回调最多读取的数据报数，避免一个频道占用事件循环过久
+MAX_DATAGRAMS_PER_WAKEUP = 64
+# 磁盘空间检查间隔（秒）
+DISK_CHECK_INTERVAL = 5.0
+# 时间格式：与回看playseek参数相同的 yyyyMMddHHmmss，或 YYYY-MM-DD HH:MM[:SS]，每日重复时可只写 HH:MM
+SCHEDULE_TIME_FORMAT = '%Y%m%d%H%M%S'
+
+
+class ScheduleEntry:
+    """一条录制计划，按频道代码指定频道"""
+
+    def __init__(self, code, start, end, name='', repeat=''):
+        self.code = code
+        self.start = start
+        self.end = end
+        self.name = name
+        self.repeat = repeat
+
+    def occurrences(self, now):
+        """返回尚未结束的录制时间段 (开始, 结束) 的迭代器，每日重复的计划无限产出"""
+        start, end = self.start, self.end
+        if self.repeat == 'daily':
+            while end <= now:
+                start += timedelta(days=1)
+                end += timedelta(days=1)
+            while True:
+                yield start, end
+                start += timedelta(days=1)
+                end += timedelta(days=1)
+        elif end > now:
+            yield start, end
+
+
+def parse_schedule_time(value, now):
+    """解析计划时间，只有 HH:MM[:SS] 时取今天的该时刻"""
+    value = str(value).strip()
+    if re.fullmatch(r'\d{14}', value):
+        return datetime.strptime(value, SCHEDULE_TIME_FORMAT)
+    if re.fullmatch(r'\d{1,2}:\d{2}(:\d{2})?', value):
+        parts = [int(part) for part in value.split(':')]
+        return now.replace(hour=parts[0], minute=parts[1], second=parts[2] if len(parts) > 2 else 0, microsecond=0)
+    return datetime.fromisoformat(value)
+
+
+def load_schedule(schedule_file, now=None):
+    """读取录制计划文件：[{"code", "start", "end"或"duration"(分钟), "name", "repeat": "daily"}, ...]"""
+    now = now or datetime.now()
+    with open(schedule_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('recordings', [])
+    entries = []
+    for item in data:
+        if not item.get('code') or not item.get('start'):
+            raise ValueError(f"录制计划缺少code或start: {item}")
+        start = parse_schedule_time(item['start'], now)
+        if item.get('end'):
+            end = parse_schedule_time(item['end'], now)
+            if end <= start:
+                # 跨过午夜的时间段
+                end += timedelta(days=1)
+        elif item.get('duration'):
+            end = start + timedelta(minutes=float(item['duration']))
+        else:
+            raise ValueError(f"录制计划缺少end或duration: {item}")
+        entries.append(ScheduleEntry(item['code'], start, end, item.get('name', ''), item.get('repeat', '')))
+    return entries
+
+
+def resolve_channels(json_file, use_zte=True, use_hw=False, quality_preference='high'):
+    """从频道JSON建立 {频道代码: (频道名称, 组播地址)}，每个频道按画质偏好选择一个组播流"""
+    selected = select_channels(json_file, use_zte=use_zte, use_hw=use_hw, quality_preference=quality_preference)
+    return {code: (title, url) for code, title, url in selected}
+
+
+class RecordingWriter:
+    """录制文件写入器：数据先复制到大块缓冲区，填满后整块交给写入线程顺序写入磁盘
+
+    所有缓冲区都在写入时，新数据会被丢弃并计数，不会阻塞事件循环。
+    文件按时长或大小轮换，轮换点总在TS包边界上。
+    """
+
+    def __init__(self, directory, prefix, executor, rotate_seconds=1800, rotate_bytes=0):
+        self.directory = directory
+        self.prefix = prefix
+        self.executor = executor
+        self.rotate_seconds = rotate_seconds
+        self.rotate_bytes = rotate_bytes
+        self.files = []
+        self.bytes = 0
+        self.dropped_bytes = 0
+        self.error = None
+        self._free = [bytearray(WRITE_BUFFER_SIZE) for _ in range(WRITE_BUFFERS)]
+        self._buffer = self._free.pop()
+        self._fill = 0
+        self._file = None
+        self._file_started = 0.0
+        self._file_bytes = 0
+        self._pending = set()
+        self._loop = asyncio.get_running_loop()
+
+    def _open_next(self):
+        name = f"{self.prefix}_{datetime.now().strftime(SCHEDULE_TIME_FORMAT)}_{len(self.files) + 1:03d}.ts"
+        path = os.path.join(self.directory, name)
+        previous = self._file
+        self._file = open(path, 'wb', buffering=0)
+        self._file_started = time.monotonic()
+        self._file_bytes = 0
+        self.files.append(path)
+        if previous is not None:
+            # 旧文件在已提交的写入完成后由写入线程关闭
+            self._submit(None, 0, previous)
+
+    def write(self, view):
+        """追加一段TS数据（整数个TS包）"""
+        if self._buffer is None:
+            self._buffer = self._free.pop() if self._free else None
+            if self._buffer is None:
+                self.dropped_bytes += len(view)
+                return
+            self._fill = 0
+        count = len(view)
+        if self._file is None or (self.rotate_seconds and time.monotonic() - self._file_started >= self.rotate_seconds) \
+                or (self.rotate_bytes and self._file_bytes + self._fill + count > self.rotate_bytes):
+            self.flush()
+            if self._file is None or self._file_bytes:
+                self._open_next()
+            if self._buffer is None:
+                self.dropped_bytes += count
+                return
+        if self._fill + count > WRITE_BUFFER_SIZE:
+            self.flush()
+            if self._buffer is None:
+                self.dropped_bytes += count
+                return
+        self._buffer[self._fill:self._fill + count] = view
+        self._fill += count
+        self.bytes += count
+
+    def flush(self):
+        """把当前缓冲区交给写入线程，并换用一个空闲缓冲区（没有空闲缓冲区时为None）"""
+        if self._buffer is None or not self._fill:
+            return
+        self._file_bytes += self._fill
+        self._submit(self._buffer, self._fill, self._file)
+        self._buffer = self._free.pop() if self._free else None
+        self._fill = 0
+
+    def _submit(self, buffer, length, file):
+        future = self._loop.run_in_executor(self.executor, self._write_buffer, buffer, length, file)
+        self._pending.add(future)
+        future.add_done_callback(lambda done: self._written(done, buffer))
+
+    @staticmethod
+    def _write_buffer(buffer, length, file):
+        if buffer is None:
+            file.close()
+            return
+        with memoryview(buffer) as view:
+            file.write(view[:length])
+
+    def _written(self, future, buffer):
+        self._pending.discard(future)
+        if future.exception() is not None and self.error is None:
+            self.error = str(future.exception())
+        if buffer is not None:
+            if self._buffer is None:
+                self._buffer = buffer
+                self._fill = 0
+            else:
+                self._free.append(buffer)
+
+    async def close(self):
+        self.flush()
+        if self._file is not None:
+            self._submit(None, 0, self._file)
+            self._file = None
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+
+class Recording:
+    """一次正在进行的录制：加入组播组，在可读回调中连续读取数据报并写入RecordingWriter"""
+
+    def __init__(self, code, title, url, start, end, writer, iface='0.0.0.0'):
+        self.code = code
+        self.title = title
+        self.url = url
+        self.start = start
+        self.end = end
+        self.writer = writer
+        self.iface = iface
+        self.datagrams = 0
+        self.invalid = 0
+        self.error = None
+        self._sock = None
+        self._buffer = bytearray(RECV_SIZE)
+        self._view = memoryview(self._buffer)
+
+    def open(self):
+        _, group, port = parse_stream_address(self.url)
+        self._sock = open_multicast_socket(group, port, self.iface)
+        self._sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        sock = self._sock
+        buffer = self._buffer
+        view = self._view
+        writer = self.writer
+        for _ in range(MAX_DATAGRAMS_PER_WAKEUP):
+            try:
+                count = sock.recv_into(buffer)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                self.error = str(e)
+                return
+            payload = rtp_payload_range(view[:count])
+            if payload is None:
+                self.invalid += 1
+                continue
+            start, end = payload
+            end -= (end - start) % TS_PACKET_SIZE
+            if end > start:
+                writer.write(view[start:end])
+                self.datagrams += 1
+
+    async def close(self):
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+        await self.writer.close()
+
+    def summary(self):
+        return {
+            'code': self.code,
+            'title': self.title,
+            'url': self.url,
+            'start': self.start.strftime(SCHEDULE_TIME_FORMAT),
+            'end': self.end.strftime(SCHEDULE_TIME_FORMAT),
+            'bytes': self.writer.bytes,
+            'dropped_bytes': self.writer.dropped_bytes,
+            'datagrams': self.datagrams,
+            'invalid_datagrams': self.invalid,
+            'files': self.writer.files,
+            'error': self.error or self.writer.error
+        }
+
+
+class DVRService:
+    """在一个事件循环中按计划同时进行多个录制，并在磁盘剩余空间不足时停止录制"""
+
+    def __init__(self, channels, output_dir=RECORDINGS_DIR, iface='0.0.0.0', rotate_minutes=30, rotate_mb=0,
+                 min_free_mb=1024):
+        self.channels = channels
+        self.output_dir = output_dir
+        self.iface = iface
+        self.rotate_seconds = rotate_minutes * 60
+        self.rotate_bytes = rotate_mb * 1024 * 1024
+        self.min_free_bytes = min_free_mb * 1024 * 1024
+        self.active = {}
+        self.finished = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dvr-writer')
+        self._disk_full = asyncio.Event()
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.output_dir).free
+
+    async def run_entry(self, entry):
+        """按一条计划依次执行各次录制"""
+        if entry.code not in self.channels:
+            print(f"频道JSON中没有频道代码 {entry.code}，跳过该计划")
+            return
+        for start, end in entry.occurrences(datetime.now()):
+            delay = (start - datetime.now()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.record(entry.code, max(start, datetime.now()), end, entry.name)
+
+    async def record(self, code, start, end, name=''):
+        """录制一个频道直到end，磁盘空间不足时提前停止"""
+        title, url = self.channels[code]
+        if self.free_bytes() < self.min_free_bytes:
+            print(f"磁盘剩余空间不足，跳过录制: {title}")
+            self.finished.append({'code': code, 'title': title, 'url': url, 'error': '磁盘剩余空间不足'})
+            return
+        label = re.sub(r'[\\/:*?"<>|\s]+', '_', name or title)
+        directory = os.path.join(self.output_dir, re.sub(r'[\\/:*?"<>|\s]+', '_', f"{title}_{code}"))
+        os.makedirs(directory, exist_ok=True)
+        writer = RecordingWriter(directory, label, self._executor, self.rotate_seconds, self.rotate_bytes)
+        recording = Recording(code, title, url, start, end, writer, self.iface)
+        key = (code, start)
+        try:
+            recording.open()
+        except OSError as e:
+            recording.error = str(e)
+            print(f"无法加入组播组 {url}: {e}")
+            await writer.close()
+            self.finished.append(recording.summary())
+            return
+        self.active[key] = recording
+        print(f"开始录制: {title} ({url}) 至 {end.strftime('%H:%M:%S')}")
+        try:
+            remaining = (end - datetime.now()).total_seconds()
+            disk_full = asyncio.ensure_future(self._disk_full.wait())
+            try:
+                await asyncio.wait_for(asyncio.shield(disk_full), max(remaining, 0))
+                recording.error = '磁盘剩余空间不足，录制已停止'
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                disk_full.cancel()
+        finally:
+            del self.active[key]
+            await recording.close()
+            summary = recording.summary()
+            self.finished.append(summary)
+            print(f"录制结束: {title}，{summary['bytes'] / 1048576:.1f} MB，{len(summary['files'])} 个文件"
+                  f"{'，丢弃 %.1f MB' % (summary['dropped_bytes'] / 1048576) if summary['dropped_bytes'] else ''}"
+                  f"{'，' + summary['error'] if summary['error'] else ''}")
+
+    async def watch_disk(self):
+        """定期检查磁盘剩余空间，不足时通知所有录制停止"""
+        while True:
+            await asyncio.sleep(DISK_CHECK_INTERVAL)
+            if self.active and self.free_bytes() < self.min_free_bytes:
+                print(f"磁盘剩余空间低于 {self.min_free_bytes // 1048576} MB，停止所有录制")
+                self._disk_full.set()
+                self._disk_full = asyncio.Event()
+
+    async def run(self, entries):
+        os.makedirs(self.output_dir, exist_ok=True)
+        watcher = asyncio.ensure_future(self.watch_disk())
+        try:
+            await asyncio.gather(*(self.run_entry(entry) for entry in entries))
+        finally:
+            watcher.cancel()
+            self._executor.shutdown(wait=True)
+        return self.finished
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按计划同时录制多个组播频道")
+    parser.add_argument('json_file', help='频道JSON文件，用于按频道代码查找组播地址')
+    parser.add_argument('--schedule', default=SCHEDULE_FILE, help='录制计划文件')
+    parser.add_argument('--record', nargs='+', metavar='CODE', help='不使用计划文件，立即录制指定频道')
+    parser.add_argument('--duration', type=float, default=60, help='配合 --record 使用，录制分钟数')
+    parser.add_argument('--dir', default=RECORDINGS_DIR, help='录制文件目录')
+    parser.add_argument('--stream-type', choices=['ZTE', 'HW'], default='ZTE', help='录制的流类型')
+    parser.add_argument('--quality', choices=list(QUALITY_OPTIONS), default='高清优先', help='画质偏好')
+    parser.add_argument('--iface', default='0.0.0.0', help='接收组播的本机接口地址')
+    parser.add_argument('--rotate-minutes', type=float, default=30, help='每个文件的最长分钟数（0表示不按时长轮换）')
+    parser.add_argument('--rotate-mb', type=int, default=0, help='每个文件的最大MB数（0表示不按大小轮换）')
+    parser.add_argument('--min-free-mb', type=int, default=1024, help='磁盘剩余空间低于此值时停止录制')
+    parser.add_argument('--list', action='store_true', help='只显示录制计划，不录制')
+    parser.add_argument('--report', metavar='FILE', help='录制结束后保存JSON报告')
+    args = parser.parse_args(argv)
+
+    try:
+        channels = resolve_channels(args.json_file, use_zte=args.stream_type == 'ZTE', use_hw=args.stream_type == 'HW',
+                                    quality_preference=QUALITY_OPTIONS[args.quality])
+        if args.record:
+            start = datetime.now()
+            entries = [ScheduleEntry(code, start, start + timedelta(minutes=args.duration)) for code in args.record]
+        else:
+            entries = load_schedule(args.schedule)
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+
+    for entry in entries:
+        title, url = channels.get(entry.code, ('未知频道', '-'))
+        repeat = '，每日' if entry.repeat == 'daily' else ''
+        print(f"计划: {entry.name or title} [{entry.code}] {url} "
+              f"{entry.start.strftime('%Y-%m-%d %H:%M:%S')} - {entry.end.strftime('%H:%M:%S')}{repeat}")
+    if args.list:
+        return 0
+
+    if sys.platform == 'win32':
+        # 可读回调需要基于select的事件循环
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    service = DVRService(channels, args.dir, args.iface, args.rotate_minutes, args.rotate_mb, args.min_free_mb)
+    try:
+        finished = asyncio.run(service.run(entries))
+    except KeyboardInterrupt:
+        return 1
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(finished, f, ensure_ascii=False, indent=2)
+    return 1 if any(item.get('error') for item in finished) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,461 @@
+import argparse
+import asyncio
+import contextlib
+import ipaddress
+import json
+import math
+import sys
+import time
+from collections import deque
+from urllib.parse import unquote, urlparse
+
+from iptv_json_cmcc import PRESETS_FILE, apply_udp_proxy, compile_filter, load_converter, load_settings, preset_options, write_playlist
+from iptv_stream import PAT_PID, TS_PACKET_SIZE, TS_SYNC_BYTE, TSAnalyzer, open_multicast_socket, parse_stream_address, rtp_payload_range
+
+RECV_SIZE = 65536
+PTS_CLOCK = 90000
+PTS_WRAP = 1 << 33
+
+# H.264/H.265中可作为分片起点的NAL类型：IDR、SPS（H.265还包括VPS和CRA/BLA）
+H264_KEY_NALS = {5, 7}
+H265_KEY_NALS = {16, 17, 18, 19, 20, 21, 32, 33}
+
+PLAYLIST_CONTENT_TYPE = 'application/vnd.apple.mpegurl'
+
+
+class HLSSegmenter:
+    """把连续的TS数据切分为HLS分片，不转码
+
+    分片在视频关键帧处切分（适配字段的random_access_indicator或PES中的IDR/SPS），时长按PTS计算；
+    每个分片以最近的PAT/PMT开头，播放器可以从任意分片开始解码。
+    分片数据和播放列表在生成时渲染一次，之后被所有观看者共享。
+    """
+
+    def __init__(self, target_duration=2.0, window=6, on_segment=None):
+        self.target_duration = target_duration
+        self.window = window
+        self.on_segment = on_segment
+        # 比播放列表多保留两个分片，刚刚移出列表的分片仍可被下载
+        self.segments = deque(maxlen=window + 2)
+        self.sequence = 0
+        self.playlist = None
+        self._analyzer = TSAnalyzer()
+        self._video_pid = None
+        self._key_nals = H264_KEY_NALS
+        self._h265 = False
+        self._pmt_pids = ()
+        self._pat = None
+        self._pmt = None
+        self._current = None
+        self._start_pts = None
+        self._last_pts = None
+        # 相邻两个视频PES的PTS间隔（一帧的时长），PTS跳变时用于计算跳变前分片的时长
+        self._pts_step = 0
+        self._discontinuity = False
+        self._remainder = bytearray()
+
+    def feed(self, data):
+        """送入任意长度的TS数据"""
+        view = memoryview(data)
+        if self._remainder:
+            need = TS_PACKET_SIZE - len(self._remainder)
+            self._remainder += view[:need]
+            view = view[need:]
+            if len(self._remainder) < TS_PACKET_SIZE:
+                return
+            packet = self._remainder
+            self._remainder = bytearray()
+            self._feed_packets(memoryview(packet))
+        usable = len(view) - len(view) % TS_PACKET_SIZE
+        if usable < len(view):
+            self._remainder = bytearray(view[usable:])
+        if usable:
+            self._feed_packets(view[:usable])
+
+    def _feed_packets(self, view):
+        if self._video_pid is None:
+            # 解析出视频PID之前用TSAnalyzer读取PAT/PMT，这部分数据不进入分片
+            self._analyzer.feed(view)
+            if self._analyzer.video_pid is None:
+                return
+            self._video_pid = self._analyzer.video_pid
+            self._h265 = self._analyzer.stream_types.get(self._video_pid) == 0x24
+            self._key_nals = H265_KEY_NALS if self._h265 else H264_KEY_NALS
+            self._pmt_pids = tuple(self._analyzer.pmt_pids)
+            self._analyzer = None
+            return
+
+        video_pid = self._video_pid
+        start = 0
+        for position in range(0, len(view), TS_PACKET_SIZE):
+            if view[position] != TS_SYNC_BYTE or not view[position + 1] & 0x40:
+                continue
+            pid = ((view[position + 1] & 0x1F) << 8) | view[position + 2]
+            if pid == video_pid:
+                # 先把之前的包写入当前分片，再判断是否在这里开始新分片
+                if self._current is not None:
+                    self._current += view[start:position]
+                start = position
+                if self._video_unit_start(view[position:position + TS_PACKET_SIZE]):
+                    self._start_segment()
+            elif pid == PAT_PID:
+                self._pat = bytes(view[position:position + TS_PACKET_SIZE])
+            elif pid in self._pmt_pids:
+                self._pmt = bytes(view[position:position + TS_PACKET_SIZE])
+        if self._current is not None:
+            self._current += view[start:]
+
+    def _video_unit_start(self, packet):
+        """处理视频PES的起始包，需要在此处开始新分片时返回True"""
+        offset = 4
+        keyframe = False
+        if packet[3] & 0x20:
+            adaptation_length = packet[4]
+            if adaptation_length and packet[5] & 0x40:
+                keyframe = True
+            offset += 1 + adaptation_length
+        if not packet[3] & 0x10 or offset + 14 > TS_PACKET_SIZE or packet[offset:offset + 3] != b'\x00\x00\x01':
+            return False
+        pts = None
+        if packet[offset + 7] & 0x80:
+            p = packet[offset + 9:offset + 14]
+            pts = (((p[0] >> 1) & 0x07) << 30) | (p[1] << 22) | ((p[2] >> 1) << 15) | (p[3] << 7) | (p[4] >> 1)
+        if not keyframe:
+            keyframe = self._has_key_nal(bytes(packet[offset + 9 + packet[offset + 8]:]))
+        if pts is None:
+            return False
+        previous_pts = self._last_pts
+        self._last_pts = pts
+
+        if self._start_pts is None:
+            # 第一个分片需要从关键帧开始，并且已经收到PAT/PMT
+            if not keyframe or self._pat is None or self._pmt is None:
+                return False
+            self._start_pts = pts
+            return True
+        duration = ((pts - self._start_pts) % PTS_WRAP) / PTS_CLOCK
+        if duration > self.target_duration * 10:
+            # PTS跳变（如上游切换节目源）：当前分片在跳变处结束，时长按跳变前的最后一帧计算；
+            # 之后才设置不连续标记，标记落在从跳变处开始的分片上
+            self._finish_segment((((previous_pts - self._start_pts) % PTS_WRAP) + self._pts_step) / PTS_CLOCK)
+            self._discontinuity = True
+            self._start_pts = pts
+            return True
+        step = (pts - previous_pts) % PTS_WRAP
+        if 0 < step < PTS_CLOCK:
+            self._pts_step = step
+        if (keyframe and duration >= self.target_duration) or duration >= self.target_duration * 3:
+            self._finish_segment(duration)
+            self._start_pts = pts
+            return True
+        return False
+
+    def _has_key_nal(self, data):
+        position = data.find(b'\x00\x00\x01')
+        while position != -1 and position + 3 < len(data):
+            header = data[position + 3]
+            nal_type = (header >> 1) & 0x3F if self._h265 else header & 0x1F
+            if nal_type in self._key_nals:
+                return True
+            position = data.find(b'\x00\x00\x01', position + 3)
+        return False
+
+    def _start_segment(self):
+        self._current = bytearray()
+        if self._pat is not None and self._pmt is not None:
+            self._current += self._pat
+            self._current += self._pmt
+
+    def _finish_segment(self, duration):
+        if not self._current:
+            return
+        # 分片创建后不再修改，直接作为共享缓冲区
+        self.segments.append((self.sequence, duration, self._current, self._discontinuity))
+        self.sequence += 1
+        self._discontinuity = False
+        self._current = None
+        self.playlist = self._render_playlist()
+        if self.on_segment:
+            self.on_segment(self)
+
+    def _render_playlist(self):
+        listed = list(self.segments)[-self.window:]
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(duration for _, duration, _, _ in listed))}",
+            f"#EXT-X-MEDIA-SEQUENCE:{listed[0][0]}"
+        ]
+        for sequence, duration, _, discontinuity in listed:
+            if discontinuity:
+                lines.append('#EXT-X-DISCONTINUITY')
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(f"{sequence}.ts")
+        return ('\n'.join(lines) + '\n').encode('ascii')
+
+    def segment(self, sequence):
+        """返回指定序号的分片数据，已过期或尚未生成时返回None"""
+        for number, _, data, _ in self.segments:
+            if number == sequence:
+                return data
+        return None
+
+
+class HLSChannel:
+    """一个正在切片的组播流，首次被请求时开始接收，长时间无人观看后停止"""
+
+    def __init__(self, address, segmenter):
+        self.address = address
+        self.segmenter = segmenter
+        self.ready = asyncio.Event()
+        self.last_access = time.monotonic()
+        self.requests = 0
+        self.bytes_received = 0
+        self.task = None
+        self.error = None
+
+
+class HLSServer:
+    """HTTP服务：/hls/<组播地址:端口>/index.m3u8 为直播播放列表，/hls/<组播地址:端口>/<序号>.ts 为分片"""
+
+    def __init__(self, target_duration=2.0, window=6, idle_timeout=30.0, iface='0.0.0.0', udp_proxy=''):
+        self.target_duration = target_duration
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.iface = iface
+        self.udp_proxy = udp_proxy
+        self.channels = {}
+
+    def get_channel(self, address):
+        channel = self.channels.get(address)
+        if channel is None or channel.task.done():
+            segmenter = HLSSegmenter(self.target_duration, self.window)
+            channel = HLSChannel(address, segmenter)
+            segmenter.on_segment = lambda _: channel.ready.set()
+            channel.task = asyncio.get_running_loop().create_task(self._receive(channel))
+            self.channels[address] = channel
+            print(f"开始切片: {address}")
+        channel.last_access = time.monotonic()
+        channel.requests += 1
+        return channel
+
+    async def _receive(self, channel):
+        try:
+            if self.udp_proxy:
+                await self._receive_http(channel)
+            else:
+                await self._receive_udp(channel)
+        except (OSError, ValueError) as e:
+            channel.error = str(e) or type(e).__name__
+            print(f"接收失败: {channel.address} ({channel.error})")
+
+    async def _receive_udp(self, channel):
+        loop = asyncio.get_running_loop()
+        _, group, port = parse_stream_address(f"rtp://{channel.address}")
+        sock = open_multicast_socket(group, port, self.iface)
+        sock.setblocking(False)
+        buffer = bytearray(RECV_SIZE)
+        view = memoryview(buffer)
+        try:
+            while True:
+                count = await loop.sock_recv_into(sock, buffer)
+                payload = rtp_payload_range(view[:count])
+                if payload is None:
+                    continue
+                channel.bytes_received += payload[1] - payload[0]
+                channel.segmenter.feed(view[payload[0]:payload[1]])
+        finally:
+            sock.close()
+
+    async def _receive_http(self, channel):
+        url = apply_udp_proxy(f"rtp://{channel.address}", self.udp_proxy)
+        parsed = urlparse(url)
+        reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+        try:
+            writer.write(f"GET {parsed.path} HTTP/1.0\r\nHost: {parsed.netloc}\r\nUser-Agent: iptv_hls\r\n\r\n".encode('ascii'))
+            await writer.drain()
+            status_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if b' 200' not in status_line:
+                raise ConnectionError(f"代理返回: {status_line.decode('latin-1').strip()}")
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    raise ConnectionError("连接被代理关闭")
+                channel.bytes_received += len(data)
+                channel.segmenter.feed(data)
+        finally:
+            writer.close()
+
+    async def reap_idle(self):
+        """定期停止长时间无人请求的频道，退出组播组"""
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 5.0))
+            now = time.monotonic()
+            for address, channel in list(self.channels.items()):
+                if now - channel.last_access > self.idle_timeout or channel.task.done():
+                    channel.task.cancel()
+                    del self.channels[address]
+                    print(f"停止切片: {address}")
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+                await self._respond(writer, 405, 'text/plain', b'Method Not Allowed')
+                return
+            head_only = parts[0] == 'HEAD'
+            path = unquote(urlparse(parts[1]).path).strip('/').split('/')
+            if path == ['status']:
+                await self._respond(writer, 200, 'application/json', self.status_json(), head_only=head_only)
+                return
+            if len(path) != 3 or path[0] != 'hls' or not valid_multicast_address(path[1]):
+                await self._respond(writer, 404, 'text/plain', b'Not Found')
+                return
+            channel = self.get_channel(path[1])
+            if path[2] == 'index.m3u8':
+                if channel.segmenter.playlist is None:
+                    # 新开始切片的频道等待第一个分片生成
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(channel.ready.wait(), self.target_duration * 3 + 5)
+                playlist = channel.segmenter.playlist
+                if playlist is None:
+                    await self._respond(writer, 503, 'text/plain', (channel.error or '没有收到视频数据').encode('utf-8'))
+                    return
+                await self._respond(writer, 200, PLAYLIST_CONTENT_TYPE, playlist, ('Cache-Control: no-cache',), head_only)
+            elif path[2].endswith('.ts') and path[2][:-3].isdigit():
+                data = channel.segmenter.segment(int(path[2][:-3]))
+                if data is None:
+                    await self._respond(writer, 404, 'text/plain', b'Segment Not Found')
+                    return
+                await self._respond(writer, 200, 'video/mp2t', data, head_only=head_only)
+            else:
+                await self._respond(writer, 404, 'text/plain', b'Not Found')
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _respond(self, writer, status, content_type, body, extra_headers=(), head_only=False):
+        reason = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}.get(status, 'OK')
+        lines = [f"HTTP/1.0 {status} {reason}", f"Content-Type: {content_type}", f"Content-Length: {len(body)}",
+                 "Access-Control-Allow-Origin: *", "Connection: close"]
+        lines.extend(extra_headers)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if not head_only:
+            writer.write(body)
+        await writer.drain()
+
+    def status_json(self):
+        now = time.monotonic()
+        channels = [{
+            'address': channel.address,
+            'segments': channel.segmenter.sequence,
+            'requests': channel.requests,
+            'bytes_received': channel.bytes_received,
+            'idle_seconds': round(now - channel.last_access, 1),
+            'error': channel.error
+        } for channel in self.channels.values()]
+        return json.dumps({'channels': channels}, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def valid_multicast_address(address):
+    """只允许 组播地址:端口，避免服务被用来加入任意地址"""
+    host, _, port = address.rpartition(':')
+    try:
+        return ipaddress.IPv4Address(host).is_multicast and 0 < int(port) < 65536
+    except ValueError:
+        return False
+
+
+def hls_url(stream_url, base_url):
+    """把 rtp://组播地址:端口 转换为HLS服务中的播放列表地址，无法识别的地址原样返回"""
+    try:
+        protocol, group, port = parse_stream_address(stream_url)
+    except ValueError:
+        return stream_url
+    if protocol not in ('rtp', 'udp'):
+        return stream_url
+    return f"{base_url.rstrip('/')}/hls/{group}:{port}/index.m3u8"
+
+
+def load_options(preset_name=None, presets_file=PRESETS_FILE):
+    """读取生成参数：指定预设时使用预设，否则使用iptv_config.json中的当前设置"""
+    config = load_settings(preset_name, presets_file)
+    # 厂商的rtsp回看地址在局域网外也无法播放；合并的第三方地址大多不是组播地址，不能切片；
+    # 切片只使用主地址，不需要备用地址
+    options = preset_options(config, exclude=('catchup', 'merge', 'failover'))
+    # HLS地址由组播地址生成，不经过udp_proxy
+    options['udp_proxy'] = ''
+    return options, compile_filter(config.get('channel_filter', ''))
+
+
+def generate_hls_playlist(json_file, output_file, base_url, options, fmt='m3u', channel_filter=None):
+    """生成使用HLS地址的播放列表，返回写入的条目数"""
+    converter = load_converter(json_file, channel_filter=channel_filter)
+    entries = (entry._replace(stream_url=hls_url(entry.stream_url, base_url))
+               for entry in converter.iter_entries(**options))
+    with open(output_file, 'w', encoding='utf-8') as f:
+        return write_playlist(entries, f, fmt)
+
+
+async def serve(server, host, port):
+    http_server = await asyncio.start_server(server.handle, host, port)
+    reaper = asyncio.get_running_loop().create_task(server.reap_idle())
+    try:
+        async with http_server:
+            await http_server.serve_forever()
+    finally:
+        reaper.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把组播流实时切片为HLS，供浏览器和手机播放")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='启动HLS切片服务')
+    serve_parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    serve_parser.add_argument('--port', type=int, default=8089, help='监听端口')
+    serve_parser.add_argument('--segment', type=float, default=2.0, help='目标分片时长（秒）')
+    serve_parser.add_argument('--window', type=int, default=6, help='播放列表中的分片数')
+    serve_parser.add_argument('--idle', type=float, default=30.0, help='无人请求多少秒后停止切片')
+    serve_parser.add_argument('--iface', default='0.0.0.0', help='接收组播的本机接口地址')
+    serve_parser.add_argument('--udp-proxy', default='', help='通过udpxy代理接收组播，格式同udp_proxy')
+
+    playlist_parser = subparsers.add_parser('playlist', help='生成使用HLS地址的播放列表')
+    playlist_parser.add_argument('json_file', help='频道JSON文件')
+    playlist_parser.add_argument('--base-url', required=True, help='HLS服务地址，如 http://192.168.1.2:8089')
+    playlist_parser.add_argument('--output', '-o', default='hls.m3u', help='输出文件')
+    playlist_parser.add_argument('--format', choices=['m3u', 'diyp'], default='m3u', help='输出格式')
+    playlist_parser.add_argument('--preset', help='使用指定预设的流类型和画质设置')
+    playlist_parser.add_argument('--presets', default=PRESETS_FILE, help='预设文件路径')
+    args = parser.parse_args(argv)
+
+    if args.command == 'playlist':
+        try:
+            options, channel_filter = load_options(args.preset, args.presets)
+            count = generate_hls_playlist(args.json_file, args.output, args.base_url, options, args.format,
+                                          channel_filter)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"已生成 {args.output}，共 {count} 个条目")
+        return 0
+
+    server = HLSServer(args.segment, args.window, args.idle, args.iface, args.udp_proxy)
+    print(f"HLS服务: http://{args.host}:{args.port}/hls/<组播地址:端口>/index.m3u8")
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,107 +1,863 @@
+import argparse
+import bisect
+import csv
+import functools
+import gc
+import hashlib
+import inspect
+import io
 import json
 import os
+import pickle
+import re
 import sys
+import shutil
+import tempfile
 import requests
 import threading
+import time
+import unicodedata
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
 from urllib.parse import urlparse
 from datetime import datetime
 
 # 配置文件路径
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), 'iptv_config.json')
+# 批量预设文件路径
+PRESETS_FILE = os.path.join(os.path.dirname(CONFIG_FILE), 'iptv_presets.json')
+# 频道数据缓存目录及缓存结构版本（整理后的频道结构变化时需要递增）
+CACHE_DIR = os.path.join(os.path.dirname(CONFIG_FILE), 'iptv_cache')
+MODEL_SCHEMA_VERSION = 2
+# 流分析（iptv_probe.py）保存的实测画质结果
+PROBE_RESULTS_FILE = os.path.join(os.path.dirname(CONFIG_FILE), 'iptv_probe.json')
+
+# 界面画质选项与内部画质偏好的对应关系
+QUALITY_OPTIONS = {
+    "超高清优先": "ultra_high",
+    "高清优先": "high",
+    "标清优先": "standard"
+}
+
+# 界面分片选项与分片方式的对应关系
+SHARD_OPTIONS = {
+    "不分片": "",
+    "按分组": "group",
+    "按数量": "size"
+}
+
+# 合并第三方M3U时的冲突策略：外部条目与移动频道匹配时保留哪一方的流地址
+MERGE_POLICIES = {
+    "移动优先": "cmcc",
+    "外部优先": "external",
+    "都保留": "both"
+}
+
+# 频道分组规则：按顺序匹配频道名称，频道数据中带有group字段时优先使用
+CHANNEL_GROUPS = [
+    ('央视', re.compile(r'^(CCTV|CGTN|央视)')),
+    ('卫视', re.compile(r'卫视')),
+    ('广东', re.compile(r'^(广东|大湾区|岭南|南方|嘉佳|经济科教|现代教育)')),
+    ('教育', re.compile(r'^(CETV|中国教育|山东教育|早期教育|中学生)')),
+    ('体育', re.compile(r'(咪咕|体育|赛事|足球|竞技|台球|高尔夫|百视通)')),
+    ('少儿', re.compile(r'(卡通|少儿|动画|卡酷)'))
+]
+DEFAULT_CHANNEL_GROUP = '其他'
+
+# 画质代码所属的画质等级，实测等级与标称不同时才改写标签
+QUALITY_CLASSES = {
+    '2': 'standard',
+    '4': 'high',
+    '40': 'high',
+    '6': 'ultra_high',
+    '10': 'ultra_high',
+    '14': 'ultra_high'
+}
+
+# 解析后的播放列表条目：频道、选中的物理频道、最终流地址、画质名称和回看地址（没有时为None）
+ResolvedEntry = namedtuple('ResolvedEntry', ['channel', 'phychannel', 'stream_url', 'quality', 'catchup', 'alternates'],
+                           defaults=(None, ()))
+
+# 备用地址模式下每个条目最多附带的备用地址数量
+FAILOVER_MAX_ALTERNATES = 3
+
+# EXTINF行中的属性，以及规范化频道名称时去掉的分隔符、括号内容和画质后缀
+_EXTINF_ATTR = re.compile(r'([A-Za-z][\w-]*)="([^"]*)"')
+_TITLE_NOISE = re.compile(r'\[[^\]]*\]|\([^)]*\)|【[^】]*】|[\s\-_·.|]+')
+_TITLE_QUALITY_SUFFIX = re.compile(r'(超高清|高清|标清|超清|uhd|fhd|hd|sd|1080p|720p)+$')
+# 文件名末尾的 _YYYYmmdd_HHMMSS 时间戳
+_FILE_TIMESTAMP = re.compile(r'_\d{8}_\d{6}$')
+
+# 第三方M3U中的一个条目：显示名称、EXTINF属性（键为小写）和流地址
+M3UItem = namedtuple('M3UItem', ['title', 'attrs', 'url'])
+
+M3U_HEADER = '#EXTM3U\n'
+DIYP_GROUP = 'IPTV频道'
+DIYP_HEADER = f'{DIYP_GROUP},#genre#\n'
+DIYP_CATCHUP_HEADER = '回看频道,#genre#\n'
+
+# 厂商回看/时移地址模板：{host}为回看服务器，{ztecode}/{hwcode}/{hwmediaid}/{code}/{channelnum}取自频道参数，
+# ${(b)yyyyMMddHHmmss}等占位符原样保留，由播放器在回看时替换为开始/结束时间
+CATCHUP_TEMPLATES = {
+    'ZTE': 'rtsp://{host}/live/{ztecode}?playseek=${(b)yyyyMMddHHmmss}-${(e)yyyyMMddHHmmss}',
+    'HW': 'rtsp://{host}/PLTV/88888888/224/{hwcode}/{hwmediaid}.smil?playseek=${(b)yyyyMMddHHmmss}-${(e)yyyyMMddHHmmss}'
+}
+
+class ProxyRing:
+    """udp_proxy的一致性哈希环：按组播地址把频道分配到多个代理，增删代理时只有少量频道被重新分配
+
+    udp_proxy格式为逗号分隔的 host:port，可用 *权重 指定权重，如 "192.168.1.1:4022*2,192.168.1.2:4022"。
+    """
+
+    # 每单位权重的虚拟节点数，越多分布越均匀
+    VIRTUAL_NODES = 512
+
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError("没有可用的UDP代理")
+        self.endpoints = endpoints
+        points = []
+        for endpoint, weight in endpoints:
+            for i in range(self.VIRTUAL_NODES * weight):
+                points.append((self._hash(f"{endpoint}#{i}"), endpoint))
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._nodes = [endpoint for _, endpoint in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    @classmethod
+    def parse(cls, udp_proxy):
+        """从字符串或列表解析代理及权重"""
+        items = re.split(r'[,;\s]+', udp_proxy) if isinstance(udp_proxy, str) else udp_proxy
+        endpoints = []
+        for item in items:
+            item = item.strip()
+            if not item:
+                continue
+            weight = 1
+            if '*' in item:
+                item, weight_str = item.rsplit('*', 1)
+                try:
+                    weight = int(weight_str)
+                except ValueError:
+                    raise ValueError(f"无效的UDP代理权重: {weight_str}")
+            if weight > 0:
+                endpoints.append((item.strip(), weight))
+        return cls(endpoints)
+
+    def select(self, stream_url):
+        """按流的组播地址（ip:port）选择代理"""
+        if len(self.endpoints) == 1:
+            return self.endpoints[0][0]
+        return self.node_for(self.address_hash(stream_url))
+
+    @classmethod
+    def address_hash(cls, stream_url):
+        """流的组播地址在环上的位置，与代理无关，可预先计算后用于不同的代理设置"""
+        return cls._hash(stream_url.split('://', 1)[-1])
+
+    def node_for(self, point):
+        """返回环上位置point对应的代理"""
+        index = bisect.bisect(self._hashes, point) % len(self._hashes)
+        return self._nodes[index]
+
+class CatchupResolver:
+    """按厂商生成回看/时移地址，模板在创建时预编译为片段列表，每个频道只做字符串拼接"""
+
+    FIELD_PATTERN = re.compile(r'(?<!\$)\{(host|ztecode|hwcode|hwmediaid|code|channelnum)\}')
+
+    def __init__(self, hosts, templates=None):
+        """hosts为 {'ZTE': 'ip:port', 'HW': 'ip:port'}，未配置服务器的厂商不生成回看地址"""
+        templates = dict(CATCHUP_TEMPLATES, **(templates or {}))
+        self._compiled = {
+            vendor: self.compile(templates[vendor], host)
+            for vendor, host in hosts.items() if host and vendor in templates
+        }
+
+    @classmethod
+    def compile(cls, template, host):
+        """将模板拆分为 [(是否为字段, 文本), ...]，{host}在编译时直接替换"""
+        parts = []
+        position = 0
+        for match in cls.FIELD_PATTERN.finditer(template):
+            literal = template[position:match.start()]
+            name = match.group(1)
+            if name == 'host':
+                literal += host
+                name = None
+            if literal:
+                if parts and not parts[-1][0]:
+                    parts[-1] = (False, parts[-1][1] + literal)
+                else:
+                    parts.append((False, literal))
+            if name:
+                parts.append((True, name))
+            position = match.end()
+        if template[position:]:
+            parts.append((False, template[position:]))
+        return parts
+
+    def __bool__(self):
+        return bool(self._compiled)
+
+    def resolve(self, channel, phychannel, stream_url):
+        """返回频道的回看地址，频道不支持回看或缺少模板所需参数时返回None"""
+        if channel.get('timeshiftAvailable') != 'true' and channel.get('lookbackAvailable') != 'true':
+            return None
+        params = phychannel.get('params') or {}
+        channel_params = channel.get('params') or {}
+
+        # 优先使用与直播流相同厂商的模板
+        if stream_url == (params.get('hwurl') or '').strip():
+            vendors = ('HW', 'ZTE')
+        else:
+            vendors = ('ZTE', 'HW')
+
+        for vendor in vendors:
+            parts = self._compiled.get(vendor)
+            if parts is None:
+                continue
+            values = []
+            for is_field, text in parts:
+                if not is_field:
+                    values.append(text)
+                    continue
+                if text in ('code', 'channelnum'):
+                    value = channel.get(text, '')
+                else:
+                    value = params.get(text) or channel_params.get(text, '')
+                if not value:
+                    break
+                values.append(value)
+            else:
+                return ''.join(values)
+        return None
+
+@functools.lru_cache(maxsize=32)
+def get_proxy_ring(udp_proxy):
+    """解析并缓存代理哈希环，每次生成只构建一次"""
+    return ProxyRing.parse(udp_proxy)
+
+def apply_udp_proxy(stream_url, udp_proxy):
+    """把组播地址改写为udpxy风格的代理地址，配置多个代理时按组播地址一致性哈希选择代理；udp_proxy为空时原样返回"""
+    if not udp_proxy:
+        return stream_url
+    proxy = get_proxy_ring(udp_proxy if isinstance(udp_proxy, str) else tuple(udp_proxy)).select(stream_url)
+    # 处理 rtp:// 和 udp://
+    stream_url = stream_url.replace('rtp://', 'rtp/').replace('udp://', 'udp/')
+    return f"http://{proxy}/{stream_url}"
+
+# CSV中间数据的表头，及读回时各列所属的层级（其余列作为频道字段保留）
+# 回看所需的hwcode和时移/回看标志附加在原有列之后，读回的频道可以生成与JSON相同的回看地址
+CSV_HEADERS = ['code', 'title', 'channelnum', 'hwurl', 'zteurl', 'bitrateType', 'bitrateTypeName', 'hwmediaid', 'ztecode', 'icon',
+               'hwcode', 'timeshiftAvailable', 'lookbackAvailable']
+CSV_CHANNEL_FIELDS = ('code', 'title', 'channelnum', 'icon', 'timeshiftAvailable', 'lookbackAvailable')
+CSV_PHYCHANNEL_FIELDS = ('bitrateType', 'bitrateTypeName')
+CSV_PARAM_FIELDS = ('hwurl', 'zteurl', 'hwmediaid', 'ztecode', 'hwcode')
+
+# 其他省份接口中存放频道列表的字段
+DOCUMENT_LIST_KEYS = ('channelList', 'list', 'data')
+
+# 可以作为流地址的URL前缀
+STREAM_URL_PREFIXES = ('rtp://', 'udp://', 'http://', 'https://')
+
+def find_fallback_url(params):
+    """返回参数中第一个以url结尾且像流地址的字段值，用作找不到指定流类型时的后备地址"""
+    for key, value in params.items():
+        if key.endswith('url') and isinstance(value, str) and value.startswith(STREAM_URL_PREFIXES):
+            return value.strip()
+    return None
+
+class ChannelSchema:
+    """频道JSON结构适配器：每个文档只识别一次结构，然后用专门的转换函数整理全部频道
+
+    整理后的频道带有phychannels列表，每个物理频道带有params和预先计算的后备地址fallbackUrl；
+    子类实现 matches（只在识别结构时调用）和 convert。
+    """
+    name = ''
+    description = ''
+    # 原始频道是否已使用标准字段名（code/title/channelnum等），是则可以在转换前过滤
+    raw_fields = True
+
+    def matches(self, channel):
+        raise NotImplementedError
+
+    def convert(self, channel):
+        raise NotImplementedError
+
+    def convert_all(self, channels, channel_filter=None):
+        """转换全部频道；指定channel_filter时，被排除的频道不会被转换"""
+        if not channel_filter:
+            return [self.convert(channel) for channel in channels]
+        accept = channel_filter.accept_channel
+        result = []
+        for channel in channels:
+            if accept and self.raw_fields and not accept(channel):
+                continue
+            channel = self.convert(channel)
+            if accept and not self.raw_fields and not accept(channel):
+                continue
+            channel = channel_filter.filter_phychannels(channel)
+            if channel is not None:
+                result.append(channel)
+        return result
+
+class PhychannelsSchema(ChannelSchema):
+    """getAllChannel2.json格式：频道带phychannels列表"""
+    name = 'phychannels'
+    description = 'getAllChannel2.json（phychannels列表）'
+
+    def matches(self, channel):
+        return isinstance(channel.get('phychannels'), list)
+
+    def convert(self, channel):
+        for phychannel in channel['phychannels']:
+            if 'fallbackUrl' not in phychannel:
+                phychannel['fallbackUrl'] = find_fallback_url(phychannel.get('params') or {})
+        return channel
+
+class ParamsSchema(ChannelSchema):
+    """getAllChannel.json格式：频道直接带params，作为单一物理频道"""
+    name = 'params'
+    description = 'getAllChannel.json（频道params）'
+
+    def matches(self, channel):
+        return 'params' in channel and not isinstance(channel.get('phychannels'), list)
+
+    def convert(self, channel):
+        params = channel['params']
+        return dict(channel, phychannels=[{
+            'bitrateType': channel.get('bitrateType', ''),
+            'bitrateTypeName': channel.get('bitrateTypeName', ''),
+            'params': params,
+            'fallbackUrl': find_fallback_url(params)
+        }])
+
+class HuaweiEPGSchema(ChannelSchema):
+    """华为EPG频道列表格式：ChannelID/ChannelName/UserChannelID/ChannelURL（igmp://组播|rtsp://单播）"""
+    name = 'huawei_epg'
+    description = '华为EPG（ChannelName/ChannelURL）'
+    raw_fields = False
+    QUALITY_KEYWORDS = (('4K', '10'), ('超清', '6'), ('高清', '4'))
+
+    def matches(self, channel):
+        return 'ChannelName' in channel and 'ChannelURL' in channel
+
+    def convert(self, channel):
+        multicast = ''
+        unicast = ''
+        for url in str(channel.get('ChannelURL', '')).split('|'):
+            url = url.strip()
+            if url.startswith('igmp://'):
+                multicast = multicast or 'rtp://' + url[len('igmp://'):]
+            elif url.startswith(('rtp://', 'udp://')):
+                multicast = multicast or url
+            elif url:
+                unicast = unicast or url
+        title = channel.get('ChannelName', '')
+        bitrate_type = next((code for keyword, code in self.QUALITY_KEYWORDS if keyword in title), '')
+        params = {
+            'hwurl': multicast,
+            'hwcode': channel.get('ChannelID', ''),
+            'unicasturl': unicast
+        }
+        timeshift = 'true' if str(channel.get('TimeShift', '0')) == '1' else 'false'
+        return {
+            'code': channel.get('ChannelID', ''),
+            'title': title,
+            'channelnum': str(channel.get('UserChannelID', '')),
+            'icon': channel.get('ChannelLogoURL') or channel.get('ChannelLogURL', ''),
+            'timeshiftAvailable': timeshift,
+            'lookbackAvailable': timeshift,
+            'params': params,
+            'phychannels': [{
+                'bitrateType': bitrate_type,
+                'bitrateTypeName': '',
+                'params': params,
+                'fallbackUrl': multicast or unicast or None
+            }]
+        }
+
+class SimpleListSchema(ChannelSchema):
+    """通用频道列表格式：name/url，可带id、logo、group、chno"""
+    name = 'simple_list'
+    description = '通用列表（name/url）'
+    raw_fields = False
+
+    def matches(self, channel):
+        return 'name' in channel and 'url' in channel and 'params' not in channel
+
+    def convert(self, channel):
+        url = str(channel.get('url', '')).strip()
+        result = {
+            'code': str(channel.get('id', '') or channel.get('tvg-id', '') or channel['name']),
+            'title': channel['name'],
+            'channelnum': str(channel.get('chno', '') or channel.get('tvg-chno', '')),
+            'icon': channel.get('logo', '') or channel.get('tvg-logo', ''),
+            'params': {'url': url},
+            'phychannels': [{
+                'bitrateType': '',
+                'bitrateTypeName': '',
+                'params': {'url': url},
+                # url字段本身就是流地址，rtsp等单播地址同样保留
+                'fallbackUrl': url or None
+            }]
+        }
+        if channel.get('group'):
+            result['group'] = channel['group']
+        return result
+
+class FlatSchema(ChannelSchema):
+    """没有params的频道：整个频道作为参数"""
+    name = 'flat'
+    description = '频道字段即参数'
+
+    def matches(self, channel):
+        return not any(schema.matches(channel) for schema in CHANNEL_SCHEMAS if schema is not self)
+
+    def convert(self, channel):
+        return dict(channel, phychannels=[{
+            'bitrateType': channel.get('bitrateType', ''),
+            'bitrateTypeName': channel.get('bitrateTypeName', ''),
+            'params': channel,  # 使用整个channel作为params
+            'fallbackUrl': find_fallback_url(channel)
+        }])
+
+class MixedSchema(ChannelSchema):
+    """同一文档中混有多种结构时逐个频道识别"""
+    name = 'mixed'
+    description = '混合结构'
+    raw_fields = False
+
+    def matches(self, channel):
+        return True
+
+    def convert(self, channel):
+        return detect_channel_schema(channel).convert(channel)
+
+# 已知的频道结构，按识别优先级排列（FlatSchema放在最后）
+CHANNEL_SCHEMAS = [PhychannelsSchema(), ParamsSchema(), HuaweiEPGSchema(), SimpleListSchema(), FlatSchema()]
+
+# 过滤规则中属于物理频道的字段，其中流地址和厂商代码从物理频道的params中读取
+PHYCHANNEL_FILTER_FIELDS = ('bitrateType', 'bitrateTypeName')
+PHYCHANNEL_PARAM_FILTER_FIELDS = ('zteurl', 'hwurl', 'ztecode', 'hwcode', 'hwmediaid')
+
+def _filter_text(value):
+    return '' if value is None else value if isinstance(value, str) else str(value)
+
+def _filter_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class ChannelFilter:
+    """频道过滤规则，编译为频道和物理频道两个判断函数
+
+    每条规则一行（或用分号分隔）：include|exclude 字段 运算符 值，例如
+        exclude isCharge = 1
+        include channelnum in 1-199,500-599
+        exclude title ~ 购物|导视
+        include bitrateType in 4,10
+    运算符：= != ~（正则搜索） !~ in 和 not in（逗号分隔，数字范围写作 低-高） < <= > >=（按数字比较）。
+    所有include规则都满足且没有任何exclude规则命中时保留。bitrateType、bitrateTypeName、
+    zteurl、hwurl等物理频道字段以及 phy. 前缀的字段作用于物理频道，所有物理频道都被排除的频道也会被排除。
+    值可以用双引号或单引号括起（引号内用反斜杠转义引号）；分号只有在引号之外、且其后是下一条规则或注释时
+    才分隔规则，因此值和正则表达式中可以包含分号，如 include title ~ ^(CCTV|广东);?$ 。
+    """
+    RULE_PATTERN = re.compile(r'^(include|exclude)\s+(\S+)\s+(!=|=|!~|~|not in|in|<=|>=|<|>)\s*(.*)$')
+    RANGE_PATTERN = re.compile(r'^(-?\d+(?:\.\d+)?)-(-?\d+(?:\.\d+)?)$')
+    # 分号之后是下一条规则、注释或结尾时才是规则分隔符
+    SEPARATOR_FOLLOW = re.compile(r'\s*(?:$|#|(?:include|exclude)\s)')
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.namespace = {'_s': _filter_text, '_n': _filter_number}
+        channel_terms = []
+        phychannel_terms = []
+        for line in self.split_rules(rules):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            match = self.RULE_PATTERN.match(line)
+            if not match:
+                raise ValueError(f"无法解析的过滤规则: {line}")
+            action, field, operator, value = match.groups()
+            value = self._unquote(value.strip(), line)
+            if field.startswith('phy.'):
+                field = field[4:]
+                level = 'p'
+            else:
+                level = 'p' if field in PHYCHANNEL_FILTER_FIELDS or field in PHYCHANNEL_PARAM_FILTER_FIELDS else 'c'
+            if level == 'p' and field in PHYCHANNEL_PARAM_FILTER_FIELDS:
+                accessor = f"_s((p.get('params') or {{}}).get({field!r}))"
+            else:
+                accessor = f"_s({level}.get({field!r}))"
+            term = self._compile_term(len(channel_terms) + len(phychannel_terms), accessor, operator, value)
+            term = f"({term})" if action == 'include' else f"not ({term})"
+            (phychannel_terms if level == 'p' else channel_terms).append(term)
+
+        self.channel_source = f"lambda c: {' and '.join(channel_terms)}" if channel_terms else None
+        self.phychannel_source = f"lambda p: {' and '.join(phychannel_terms)}" if phychannel_terms else None
+        self.accept_channel = self._build(self.channel_source)
+        self.accept_phychannel = self._build(self.phychannel_source)
+
+    @classmethod
+    def split_rules(cls, rules):
+        """按换行和规则之间的分号拆分规则文本，引号内的分号和换行不拆分，注释行原样保留"""
+        lines = []
+        start = 0
+        quote = None
+        position = 0
+        while position < len(rules):
+            char = rules[position]
+            if quote:
+                if char == '\\':
+                    position += 1
+                elif char == quote:
+                    quote = None
+            elif char == '#' and not rules[start:position].strip():
+                # 注释一直到行尾
+                end = rules.find('\n', position)
+                position = len(rules) if end == -1 else end
+                continue
+            elif char in '"\'' and (position == 0 or rules[position - 1].isspace()):
+                # 只有在值的开头才作为引号，正则表达式中间的引号按普通字符处理
+                quote = char
+            elif char == '\n' or (char == ';' and cls.SEPARATOR_FOLLOW.match(rules, position + 1)):
+                lines.append(rules[start:position])
+                start = position + 1
+            position += 1
+        if quote:
+            raise ValueError(f"过滤规则中的引号没有闭合: {rules[start:].strip()}")
+        lines.append(rules[start:])
+        return lines
+
+    @staticmethod
+    def _unquote(value, line):
+        if len(value) >= 2 and value[0] in '"\'' and value[-1] == value[0]:
+            # 只还原转义的引号，正则表达式中的其他反斜杠保持不变
+            return value[1:-1].replace('\\' + value[0], value[0])
+        if value[:1] in '"\'':
+            raise ValueError(f"无法解析的过滤规则: {line}")
+        return value
+
+    def _compile_term(self, index, accessor, operator, value):
+        name = f"_v{index}"
+        if operator in ('=', '!='):
+            self.namespace[name] = value
+            return f"{accessor} {'==' if operator == '=' else '!='} {name}"
+        if operator in ('~', '!~'):
+            try:
+                self.namespace[name] = re.compile(value)
+            except re.error as e:
+                raise ValueError(f"过滤规则中的正则表达式无效: {value} ({e})")
+            return f"{name}.search({accessor}) {'is not' if operator == '~' else 'is'} None"
+        if operator in ('in', 'not in'):
+            values = set()
+            ranges = []
+            for item in value.split(','):
+                item = item.strip()
+                range_match = self.RANGE_PATTERN.match(item)
+                if range_match:
+                    ranges.append((float(range_match.group(1)), float(range_match.group(2))))
+                elif item:
+                    values.add(item)
+            self.namespace[name] = frozenset(values)
+            term = f"(_x := {accessor}) in {name}"
+            if ranges:
+                range_terms = ' or '.join(f"{low!r} <= _y <= {high!r}" for low, high in ranges)
+                term += f" or ((_y := _n(_x)) is not None and ({range_terms}))"
+            return term if operator == 'in' else f"not ({term})"
+        number = _filter_number(value)
+        if number is None:
+            raise ValueError(f"过滤规则 {operator} 需要数字: {value}")
+        self.namespace[name] = number
+        return f"(_x := _n({accessor})) is not None and _x {operator} {name}"
+
+    def _build(self, source):
+        if source is None:
+            return None
+        return eval(compile(source, '<channel_filter>', 'eval'), self.namespace)
+
+    def __bool__(self):
+        return bool(self.accept_channel or self.accept_phychannel)
+
+    def filter_phychannels(self, channel):
+        """按物理频道规则过滤整理后的频道，所有物理频道都被排除时返回None"""
+        accept = self.accept_phychannel
+        if accept is None:
+            return channel
+        phychannels = [phychannel for phychannel in channel['phychannels'] if accept(phychannel)]
+        if not phychannels:
+            return None
+        if len(phychannels) == len(channel['phychannels']):
+            return channel
+        return dict(channel, phychannels=phychannels)
+
+    def apply(self, channels):
+        """过滤已整理的频道列表"""
+        accept = self.accept_channel
+        result = []
+        for channel in channels:
+            if accept and not accept(channel):
+                continue
+            channel = self.filter_phychannels(channel)
+            if channel is not None:
+                result.append(channel)
+        return result
+
+def compile_filter(rules):
+    """编译过滤规则，规则为空时返回None"""
+    if not rules or not rules.strip():
+        return None
+    return ChannelFilter(rules) or None
+
+def detect_channel_schema(channel):
+    """识别单个频道的结构"""
+    for schema in CHANNEL_SCHEMAS:
+        if schema.matches(channel):
+            return schema
+    return CHANNEL_SCHEMAS[-1]
+
+def detect_schema(channels):
+    """按第一个频道识别整个文档的结构，所有频道都符合时返回该结构的适配器，否则返回MixedSchema"""
+    if not channels:
+        return CHANNEL_SCHEMAS[0]
+    schema = detect_channel_schema(channels[0])
+    if all(schema.matches(channel) for channel in channels):
+        return schema
+    return MixedSchema()
 
 class IPTV2M3U:
     def __init__(self):
         self.channels = []
+        # 最近一次整理后的频道列表及其结构，channels被整体替换后生成时会重新整理
+        self._normalized_channels = None
+        self.schema = None
+        # 设置后生成过程会逐个频道检查，事件被置位时抛出JobCancelled
+        self.cancel_event = None
+        # 为真时不输出加载和逐频道的进度信息（错误信息仍会输出），批量生成时使用
+        self.quiet = False
+
+    def _log(self, message):
+        if not self.quiet:
+            print(message)
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def load_json(self, json_file, cache=None, channel_filter=None):
+        """从JSON文件加载频道数据，指定cache时优先读取已整理的缓存数据；.csv文件按CSV中间数据读取
+
+        指定channel_filter（ChannelFilter）时在加载过程中过滤，被排除的频道不会被整理、排序和生成；
+        缓存中保存的始终是未过滤的数据。
+        """
+        if json_file.lower().endswith('.csv'):
+            return self.load_csv(json_file, channel_filter)
+        if cache is not None:
+            try:
+                key = cache.key_for(json_file)
+            except Exception as e:
+                print(f"加载JSON文件失败: {e}")
+                return False
+            channels = cache.load(key)
+            if channels is not None:
+                self.channels = channels
+                self._normalized_channels = channels
+                self._log(f"从缓存加载 {len(self.channels)} 个频道")
+                self.normalize(channel_filter)
+                return True
+            if not self.load_json(json_file):
+                return False
+            cache.store(key, self.channels)
+            self.normalize(channel_filter)
+            return True
 
-    def load_json(self, json_file):
-        """从JSON文件加载频道数据"""
         try:
             with open(json_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
 
-            print(f"JSON数据加载成功，类型: {type(data)}")
+            self._log(f"JSON数据加载成功，类型: {type(data)}")
 
             # 检查不同的JSON结构
             if isinstance(data, dict) and 'channels' in data:
                 self.channels = data['channels']
-                print(f"找到 {len(self.channels)} 个频道")
-                return True
+                self._log(f"找到 {len(self.channels)} 个频道")
+            elif isinstance(data, dict) and any(isinstance(data.get(key), list) for key in DOCUMENT_LIST_KEYS):
+                key = next(key for key in DOCUMENT_LIST_KEYS if isinstance(data.get(key), list))
+                self.channels = data[key]
+                self._log(f"在 {key} 中找到 {len(self.channels)} 个频道")
             elif isinstance(data, list):
                 self.channels = data
-                print(f"直接找到频道列表，共 {len(self.channels)} 个频道")
-                return True
+                self._log(f"直接找到频道列表，共 {len(self.channels)} 个频道")
             else:
                 print(f"未知的JSON结构: {type(data)}")
                 return False
+            self.normalize(channel_filter)
+            return True
         except Exception as e:
             print(f"加载JSON文件失败: {e}")
             return False
 
-    def _get_phychannels(self, channel):
-        """获取物理频道列表，兼容两种JSON格式"""
-        # 检查是否有phychannels字段（getAllChannel2.json格式）
-        if 'phychannels' in channel and isinstance(channel['phychannels'], list):
-            return channel['phychannels']
-        # 直接返回包含params的当前频道作为单一物理频道（getAllChannel.json格式）
-        elif 'params' in channel:
-            # 创建一个虚拟的phychannel对象
-            virtual_phychannel = {
-                'bitrateType': channel.get('bitrateType', ''),
-                'bitrateTypeName': channel.get('bitrateTypeName', ''),
-                'params': channel['params']
-            }
-            return [virtual_phychannel]
-        # 尝试直接从channel中提取必要信息创建虚拟phychannel
-        else:
-            virtual_phychannel = {
-                'bitrateType': channel.get('bitrateType', ''),
-                'bitrateTypeName': channel.get('bitrateTypeName', ''),
-                'params': channel  # 使用整个channel作为params
-            }
-            return [virtual_phychannel]
-
-    def _sort_phychannels_by_quality(self, phychannels, quality_preference):
-        """根据画质偏好排序物理频道"""
-        quality_order = {
-            'ultra_high': ['4K', '超高清', 'UHD', '2160p'],
-            'high': ['高清', 'HD', '1080p'],
-            'standard': ['标清', 'SD', '720p', '480p']
-        }
+    def load_csv(self, csv_file, channel_filter=None):
+        """读取generate_csv生成（可能经过手工编辑）的CSV中间数据，一次遍历按频道代码重新组合为频道和物理频道
 
-        def get_quality_score(phychannel):
-            # 默认最低优先级
-            score = 100
-            bitrate_type_name = phychannel.get('bitrateTypeName', '').lower()
-            bitrate_type = phychannel.get('bitrateType', '')
-
-            # 根据偏好设置优先级
-            target_key = 'high'  # 默认高清
-            if quality_preference == 'ultra_high':
-                target_key = 'ultra_high'
-            elif quality_preference == 'standard':
-                target_key = 'standard'
-
-            # 检查目标画质关键词
-            for i, keyword in enumerate(quality_order.get(target_key, [])):
-                if keyword.lower() in bitrate_type_name or keyword in bitrate_type:
-                    score = i  # 匹配目标画质，分数越低优先级越高
-                    return score
+        每行是一个物理频道，代码相同的行属于同一频道（频道名称等取第一行），频道顺序为首次出现的顺序；
+        没有代码的行按频道名称分组。表头之外的列作为频道字段保留。
+        """
+        try:
+            channels = {}
+            with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+                reader = csv.DictReader(f)
+                missing = [field for field in ('title', 'hwurl', 'zteurl') if field not in (reader.fieldnames or [])]
+                if missing:
+                    print(f"CSV缺少必要的列: {', '.join(missing)}")
+                    return False
+                extra_fields = [field for field in reader.fieldnames if field not in CSV_HEADERS]
+                for row in reader:
+                    key = row.get('code') or row.get('title')
+                    if not key:
+                        continue
+                    params = {field: row.get(field) or '' for field in CSV_PARAM_FIELDS}
+                    phychannel = {field: row.get(field) or '' for field in CSV_PHYCHANNEL_FIELDS}
+                    phychannel['params'] = params
+                    phychannel['fallbackUrl'] = find_fallback_url(params)
+                    channel = channels.get(key)
+                    if channel is None:
+                        channel = {field: row.get(field) or '' for field in CSV_CHANNEL_FIELDS}
+                        channel.update((field, row[field]) for field in extra_fields if row.get(field))
+                        channel['params'] = {field: params[field] for field in ('hwmediaid', 'ztecode', 'hwcode')}
+                        channel['phychannels'] = []
+                        channels[key] = channel
+                    channel['phychannels'].append(phychannel)
+        except Exception as e:
+            print(f"加载CSV文件失败: {e}")
+            return False
 
-            # 检查其他画质关键词
-            for key, keywords in quality_order.items():
-                if key == target_key:
+        self.channels = list(channels.values())
+        self._normalized_channels = self.channels
+        self.schema = 'csv'
+        self._log(f"从CSV加载 {len(self.channels)} 个频道，{sum(len(channel['phychannels']) for channel in self.channels)} 个物理频道")
+        self.normalize(channel_filter)
+        return True
+
+    def normalize(self, channel_filter=None):
+        """识别一次JSON结构，用对应的适配器将频道统一整理为带phychannels列表的结构，之后生成时不再逐个频道识别
+
+        指定channel_filter时只整理通过过滤的频道；已整理过的频道直接按规则过滤。
+        """
+        if self._normalized_channels is not None and self._normalized_channels is self.channels:
+            if channel_filter:
+                self.apply_filter(channel_filter)
+            return
+        schema = detect_schema(self.channels)
+        total = len(self.channels)
+        self.channels = schema.convert_all(self.channels, channel_filter)
+        self._normalized_channels = self.channels
+        self.schema = schema.name
+        self._log(f"识别为{schema.description}格式")
+        if channel_filter:
+            self._log(f"过滤后保留 {len(self.channels)}/{total} 个频道")
+
+    def apply_filter(self, channel_filter):
+        """按过滤规则过滤已整理的频道"""
+        total = len(self.channels)
+        self.channels = channel_filter.apply(self.channels)
+        self._normalized_channels = self.channels
+        self._log(f"过滤后保留 {len(self.channels)}/{total} 个频道")
+
+    def filtered(self, channel_filter):
+        """返回只包含通过过滤的频道的新转换器，原转换器的频道不受影响"""
+        self.normalize()
+        converter = IPTV2M3U()
+        converter.channels = channel_filter.apply(self.channels)
+        converter._normalized_channels = converter.channels
+        converter.schema = self.schema
+        converter.cancel_event = self.cancel_event
+        converter.quiet = self.quiet
+        return converter
+
+    def apply_measured_quality(self, results):
+        """用流分析的实测画质修正物理频道的画质标签，返回被修正的物理频道数
+
+        results为 {流地址: 分析结果}，分析结果中的tier为实测画质代码；
+        标称画质保存在declaredBitrateType/declaredBitrateTypeName中。
+        """
+        self.normalize()
+        corrected = 0
+        for channel in self.channels:
+            phychannels = channel['phychannels']
+            for index, phychannel in enumerate(phychannels):
+                params = phychannel.get('params') or {}
+                for field in ('zteurl', 'hwurl'):
+                    result = results.get((params.get(field) or '').strip())
+                    if result and result.get('tier'):
+                        break
+                else:
                     continue
-                for i, keyword in enumerate(keywords):
-                    if keyword.lower() in bitrate_type_name or keyword in bitrate_type:
-                        score = len(quality_order[target_key]) + i  # 非目标画质，分数高于目标画质
-                        return score
+                tier = result['tier']
+                declared = phychannel.get('bitrateType', '')
+                if QUALITY_CLASSES.get(declared) == QUALITY_CLASSES.get(tier):
+                    continue
+                self._log(f"频道 {channel.get('title', '')} 标称{self.quality_label(phychannel)}，实测为{self._get_bitrate_type(tier)}")
+                phychannels[index] = dict(
+                    phychannel,
+                    bitrateType=tier,
+                    bitrateTypeName=self._get_bitrate_type(tier),
+                    declaredBitrateType=declared,
+                    declaredBitrateTypeName=phychannel.get('bitrateTypeName', '')
+                )
+                corrected += 1
+        return corrected
+
+    # 各画质偏好的关键词，越靠前优先级越高
+    QUALITY_ORDER = {
+        'ultra_high': ['4K', '超高清', 'UHD', '2160p'],
+        'high': ['高清', 'HD', '1080p'],
+        'standard': ['标清', 'SD', '720p', '480p']
+    }
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _quality_score(bitrate_type_name, bitrate_type, quality_preference):
+        """物理频道的画质排序分数，越低优先级越高；分数只取决于画质字段和偏好，按参数缓存"""
+        quality_order = IPTV2M3U.QUALITY_ORDER
+
+        # 根据偏好设置优先级
+        target_key = 'high'  # 默认高清
+        if quality_preference == 'ultra_high':
+            target_key = 'ultra_high'
+        elif quality_preference == 'standard':
+            target_key = 'standard'
+
+        # 检查目标画质关键词
+        for i, keyword in enumerate(quality_order[target_key]):
+            if keyword.lower() in bitrate_type_name or keyword in bitrate_type:
+                return i  # 匹配目标画质，分数越低优先级越高
+
+        # 检查其他画质关键词
+        for key, keywords in quality_order.items():
+            if key == target_key:
+                continue
+            for i, keyword in enumerate(keywords):
+                if keyword.lower() in bitrate_type_name or keyword in bitrate_type:
+                    return len(quality_order[target_key]) + i  # 非目标画质，分数高于目标画质
 
-            return score
+        # 默认最低优先级
+        return 100
 
-        # 按画质分数排序
-        return sorted(phychannels, key=get_quality_score)
+    def _sort_phychannels_by_quality(self, phychannels, quality_preference):
+        """根据画质偏好排序物理频道"""
+        score = self._quality_score
+        return sorted(phychannels, key=lambda phychannel: score(
+            phychannel.get('bitrateTypeName', '').lower(), phychannel.get('bitrateType', ''), quality_preference))
 
     def _check_quality(self, phychannel, target_quality):
         """检查物理频道是否符合目标画质"""
@@ -158,28 +914,32 @@ class IPTV2M3U:
             print("没有频道数据")
             return False
 
-        print(f"开始生成CSV中间数据，共 {len(self.channels)} 个频道")
+        self.normalize()
+        self._log(f"开始生成CSV中间数据，共 {len(self.channels)} 个频道")
 
         try:
             with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
                 # 写入CSV表头
-                headers = ['code', 'title', 'channelnum', 'hwurl', 'zteurl', 'bitrateType', 'bitrateTypeName', 'hwmediaid', 'ztecode', 'icon']
-                f.write(','.join(headers) + '\n')
+                f.write(','.join(CSV_HEADERS) + '\n')
 
                 processed_count = 0
                 total_channels = len(self.channels)
 
                 for channel in self.channels:
+                    self._check_cancelled()
+
                     # 获取频道基本信息
                     code = channel.get('code', '')
                     title = channel.get('title', 'Unknown')
                     channel_num = channel.get('channelnum', '')
                     icon = channel.get('icon', '')
+                    timeshift = channel.get('timeshiftAvailable', '')
+                    lookback = channel.get('lookbackAvailable', '')
 
-                    # 获取物理频道列表（兼容两种JSON格式）
-                    phychannels = self._get_phychannels(channel)
+                    # 获取物理频道列表（已按JSON结构统一整理）
+                    phychannels = channel['phychannels']
                     if not phychannels:
-                        print(f"频道 {title} 没有物理频道信息")
+                        self._log(f"频道 {title} 没有物理频道信息")
                         continue
 
                     # 为每个物理频道生成一行数据
@@ -191,6 +951,7 @@ class IPTV2M3U:
                         bitrate_type_name = phychannel.get('bitrateTypeName', '')
                         ztecode = params.get('ztecode', '')
                         hwmediaid = params.get('hwmediaid', '')
+                        hwcode = params.get('hwcode', '')
 
                         # 转义CSV中的逗号和引号
                         def escape_csv(value):
@@ -210,420 +971,1432 @@ class IPTV2M3U:
                             escape_csv(bitrate_type_name),
                             escape_csv(hwmediaid),
                             escape_csv(ztecode),
-                            escape_csv(icon)
+                            escape_csv(icon),
+                            escape_csv(hwcode),
+                            escape_csv(timeshift),
+                            escape_csv(lookback)
                         ]
 
                         # 写入CSV行
                         f.write(','.join(row) + '\n')
 
                     processed_count += 1
-                    print(f"已处理频道: {title}")
+                    self._log(f"已处理频道: {title}")
 
                     # 更新进度
                     if progress_callback:
                         progress_callback(processed_count, total_channels)
 
-                print(f"CSV中间数据生成完成，共处理 {processed_count} 个频道")
+                self._log(f"CSV中间数据生成完成，共处理 {processed_count} 个频道")
 
             return True
 
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"生成CSV文件失败: {e}")
             import traceback
             traceback.print_exc()
             return False
 
-    # 修改generate_m3u方法，添加multi_quality参数和多画质输出逻辑
-    def generate_m3u(self, output_file, use_zte=True, use_hw=False, quality_preference='high', progress_callback=None, udp_proxy='', multi_quality=False):
+    def _pick_stream_url(self, phychannel, use_zte, use_hw):
+        """按流类型从参数中选取流地址，找不到时使用整理时预先计算的后备地址"""
+        params = phychannel.get('params') or {}
+        if use_zte and params.get('zteurl'):
+            return params['zteurl'].strip()
+        if use_hw and params.get('hwurl'):
+            return params['hwurl'].strip()
+        return phychannel.get('fallbackUrl')
+
+    def quality_label(self, phychannel):
+        """获取物理频道的画质名称（与生成的播放列表中的画质名称相同）"""
+        bitrate_type = phychannel.get('bitrateTypeName', '未知')
+        if not bitrate_type or bitrate_type == '未知':
+            bitrate_type = self._get_bitrate_type(phychannel.get('bitrateType', ''))
+        return bitrate_type
+
+    def _select_streams(self, phychannels, use_zte, use_hw, quality_preference, multi_quality, failover=False):
+        """按流类型和画质偏好选择物理频道，返回 [(phychannel, stream_url, bitrate_type, alternates), ...]
+
+        failover为真时在同一次选择中计算备用地址 alternates = ((地址, 画质名称), ...)，否则为空元组。
+        """
+        # 根据画质偏好排序物理频道
+        sorted_phychannels = self._sort_phychannels_by_quality(phychannels, quality_preference)
+        selections = []
+
+        if multi_quality:
+            # 多画质模式：保留所有可用的物理频道
+            filtered_phychannels = []
+            for phychannel in sorted_phychannels:
+                params = phychannel.get('params', {})
+                if (use_zte and params.get('zteurl')) or (use_hw and params.get('hwurl')):
+                    filtered_phychannels.append(phychannel)
+
+            # 如果没有找到符合条件的频道，尝试使用第一个可用的流
+            if not filtered_phychannels:
+                for phychannel in sorted_phychannels:
+                    if self._pick_stream_url(phychannel, False, False):
+                        filtered_phychannels.append(phychannel)
+                        break
+
+            for phychannel in filtered_phychannels:
+                stream_url = self._pick_stream_url(phychannel, use_zte, use_hw)
+                if stream_url:
+                    # 多画质模式下其他画质已各自成为条目，备用地址只取另一厂商平面
+                    alternates = self._failover_alternates([phychannel], stream_url, use_zte) if failover else ()
+                    selections.append((phychannel, stream_url, self.quality_label(phychannel), alternates))
+            return selections
+
+        # 单画质模式：优先选择符合目标画质的第一个可用物理频道
+        target_quality = self._get_target_quality_code(quality_preference)
+        for phychannel in sorted_phychannels:
+            if self._check_quality(phychannel, target_quality):
+                stream_url = self._pick_stream_url(phychannel, use_zte, use_hw)
+                if stream_url:
+                    return [self._single_selection(phychannel, stream_url, sorted_phychannels, use_zte, failover)]
+
+        # 如果没找到目标画质的流，尝试选择第一个可用的流
+        for phychannel in sorted_phychannels:
+            stream_url = self._pick_stream_url(phychannel, use_zte, use_hw)
+            if stream_url:
+                return [self._single_selection(phychannel, stream_url, sorted_phychannels, use_zte, failover)]
+
+        return selections
+
+    def _single_selection(self, phychannel, stream_url, sorted_phychannels, use_zte, failover):
+        """单画质模式的选择结果，备用地址依次为同一物理频道的另一厂商平面、其他画质（按画质偏好顺序）"""
+        alternates = ()
+        if failover:
+            others = [item for item in sorted_phychannels if item is not phychannel]
+            alternates = self._failover_alternates([phychannel] + others, stream_url, use_zte)
+        return (phychannel, stream_url, self.quality_label(phychannel), alternates)
+
+    def _failover_alternates(self, phychannels, stream_url, use_zte):
+        """按顺序收集物理频道的全部可用地址作为备用地址，跳过主地址和重复地址
+
+        每个物理频道内先取主地址所在的厂商平面，再取另一平面，最后是后备地址；
+        不受流类型选项限制，主平面失效时播放器才能切换到另一厂商的组播。
+        """
+        keys = ('zteurl', 'hwurl') if use_zte else ('hwurl', 'zteurl')
+        seen = {stream_url}
+        alternates = []
+        for phychannel in phychannels:
+            params = phychannel.get('params') or {}
+            quality = None
+            for url in [(params.get(key) or '').strip() for key in keys] + [phychannel.get('fallbackUrl')]:
+                if not url or url in seen:
+                    continue
+                seen.add(url)
+                if quality is None:
+                    quality = self.quality_label(phychannel)
+                alternates.append((url, quality))
+                if len(alternates) >= FAILOVER_MAX_ALTERNATES:
+                    return tuple(alternates)
+        return tuple(alternates)
+
+    def iter_entries(self, use_zte=True, use_hw=False, quality_preference='high', udp_proxy='', multi_quality=False, on_skip=None, catchup=None, merge=None,
+                     failover=False):
+        """惰性地逐个产出已解析的条目 ResolvedEntry(channel, phychannel, stream_url, quality, catchup, alternates)
+
+        stream_url已按udp_proxy处理；failover为真时alternates为按顺序排列的备用地址（同样经过代理）；指定catchup（CatchupResolver）时为支持回看的频道生成回看地址；
+        指定merge（M3UMerge）时按冲突策略合并第三方M3U的条目，未匹配的外部条目排在最后；
+        跳过的频道会以 on_skip(channel, reason) 通知调用方。
+        """
+        self.normalize()
+        if merge:
+            merge.prepare(self.channels, quiet=self.quiet)
+        for channel in self.channels:
+            self._check_cancelled()
+
+            # 获取物理频道列表（已按JSON结构统一整理）
+            phychannels = channel['phychannels']
+            if not phychannels and not merge:
+                if on_skip:
+                    on_skip(channel, "没有物理频道信息")
+                continue
+
+            selections = self._select_streams(phychannels, use_zte, use_hw, quality_preference, multi_quality, failover)
+            if merge:
+                entries = merge.channel_entries(channel, [
+                    ResolvedEntry(channel, phychannel, stream_url, bitrate_type,
+                                  catchup.resolve(channel, phychannel, stream_url) if catchup else None, alternates)
+                    for phychannel, stream_url, bitrate_type, alternates in selections
+                ])
+                if not entries and on_skip:
+                    on_skip(channel, "没有找到可用的流地址" if phychannels else "没有物理频道信息")
+                for entry in entries:
+                    yield self._proxied_entry(entry, udp_proxy)
+                continue
+            if not selections:
+                if on_skip:
+                    on_skip(channel, "没有找到可用的流地址")
+                continue
+
+            for phychannel, stream_url, bitrate_type, alternates in selections:
+                catchup_url = catchup.resolve(channel, phychannel, stream_url) if catchup else None
+                if alternates and udp_proxy:
+                    alternates = tuple((apply_udp_proxy(url, udp_proxy), quality) for url, quality in alternates)
+                yield ResolvedEntry(channel, phychannel, apply_udp_proxy(stream_url, udp_proxy), bitrate_type, catchup_url,
+                                    alternates)
+
+        if merge:
+            for entry in merge.unmatched_entries():
+                self._check_cancelled()
+                yield self._proxied_entry(entry, udp_proxy)
+
+    def _proxied_entry(self, entry, udp_proxy):
+        """对合并后的条目应用udp_proxy，外部条目只有组播地址才经过代理"""
+        if not udp_proxy or (entry.phychannel is None and not entry.stream_url.startswith(('rtp://', 'udp://'))):
+            return entry
+        return entry._replace(
+            stream_url=apply_udp_proxy(entry.stream_url, udp_proxy),
+            alternates=tuple((apply_udp_proxy(url, udp_proxy), quality) for url, quality in entry.alternates)
+        )
+
+    def _entry_total(self, merge):
+        """进度的总数：频道数，合并第三方M3U时加上未匹配的外部条目数"""
+        if not merge:
+            return len(self.channels)
+        self.normalize()
+        return len(self.channels) + merge.prepare(self.channels, quiet=self.quiet)
+
+    def _print_skip(self, channel, reason):
+        self._log(f"频道 {channel.get('title', 'Unknown')} {reason}")
+
+    def preview_rows(self, use_zte=True, use_hw=False, quality_preference='high', udp_proxy='', multi_quality=False, merge=None, failover=False):
+        """返回generate_m3u将会选择的条目，用于界面预览: [(channelnum, title, quality, stream_url), ...]"""
+        try:
+            return [
+                (entry.channel.get('channelnum', ''), entry.channel.get('title', 'Unknown'), entry.quality, entry.stream_url)
+                for entry in self.iter_entries(use_zte, use_hw, quality_preference, udp_proxy, multi_quality, merge=merge,
+                                               failover=failover)
+            ]
+        finally:
+            if merge:
+                merge.close()
+
+    def generate_m3u(self, output_file, use_zte=True, use_hw=False, quality_preference='high', progress_callback=None, udp_proxy='', multi_quality=False, catchup=None, merge=None, failover=False):
         """生成M3U播放列表"""
         if not self.channels:
             print("没有频道数据")
             return False
 
-        print(f"开始生成M3U，共 {len(self.channels)} 个频道")
+        self._log(f"开始生成M3U，共 {len(self.channels)} 个频道")
 
         try:
             with open(output_file, 'w', encoding='utf-8') as f:
-                f.write('#EXTM3U\n')
+                formatter = M3UFormatter()
+                f.write(formatter.header)
 
                 processed_count = 0
-                total_channels = len(self.channels)
-
-                for channel in self.channels:
-                    # 获取频道基本信息
-                    title = channel.get('title', 'Unknown')
-                    channel_num = channel.get('channelnum', '')
-                    icon = channel.get('icon', '')
-
-                    # 获取物理频道列表（兼容两种JSON格式）
-                    phychannels = self._get_phychannels(channel)
-                    if not phychannels:
-                        print(f"频道 {title} 没有物理频道信息")
-                        continue
-
-                    print(f"频道 {title} 有 {len(phychannels)} 个物理频道")
-
-                    # 根据画质偏好排序物理频道
-                    sorted_phychannels = self._sort_phychannels_by_quality(phychannels, quality_preference)
-
-                    if multi_quality:
-                        # 多画质模式：保留所有可用的物理频道
-                        filtered_phychannels = []
-                        for phychannel in sorted_phychannels:
-                            params = phychannel.get('params', {})
-                            if (use_zte and params.get('zteurl')) or (use_hw and params.get('hwurl')):
-                                filtered_phychannels.append(phychannel)
-
-                        # 如果没有找到符合条件的频道，尝试使用第一个可用的流
-                        if not filtered_phychannels:
-                            for phychannel in sorted_phychannels:
-                                params = phychannel.get('params', {})
-                                for key, value in params.items():
-                                    if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                        filtered_phychannels.append(phychannel)
-                                        break
-                                if filtered_phychannels:
-                                    break
-
-                        for phychannel in filtered_phychannels:
-                            params = phychannel.get('params', {})
-                            stream_url = None
-
-                            # 选择适当的流URL
-                            if use_zte and params.get('zteurl'):
-                                stream_url = params['zteurl'].strip()
-                            elif use_hw and params.get('hwurl'):
-                                stream_url = params['hwurl'].strip()
-                            else:
-                                # 尝试其他可能的URL字段
-                                for key, value in params.items():
-                                    if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                        stream_url = value.strip()
-                                        break
-
-                            if not stream_url:
-                                continue
-
-                            # 获取画质信息
-                            bitrate_type = phychannel.get('bitrateTypeName', '未知')
-                            if not bitrate_type or bitrate_type == '未知':
-                                bitrate_type = self._get_bitrate_type(phychannel.get('bitrateType', ''))
-
-                            # 根据udp_proxy参数处理stream_url
-                            if udp_proxy:
-                                # 处理 rtp:// 和 udp://
-                                stream_url = stream_url.replace('rtp://', 'rtp/').replace('udp://', 'udp/')
-                                stream_url = f"http://{udp_proxy}/{stream_url}"
-
-                            # 写入M3U条目
-                            extinf_line = f'#EXTINF:-1 tvg-id="{channel.get("code", "")}" tvg-name="{title}"'
-                            if channel_num:
-                                extinf_line += f' tvg-chno="{channel_num}"'
-                            if icon:
-                                extinf_line += f' tvg-logo="{icon}"'
-                            extinf_line += f' group-title="IPTV",{title} ({bitrate_type})\n'
-
-                            f.write(extinf_line)
-                            f.write(f'{stream_url}\n')
-
-                            processed_count += 1
-                            print(f"成功添加频道: {title} ({bitrate_type})")
-
-                            # 更新进度
-                            if progress_callback:
-                                progress_callback(processed_count, total_channels)
-                    else:
-                        # 单画质模式：选择第一个可用的物理频道
-                        selected_phy = None
-                        stream_url = None
-                        target_quality = self._get_target_quality_code(quality_preference)
-
-                        for phychannel in sorted_phychannels:
-                            params = phychannel.get('params', {})
-                            print(f"物理频道参数: {params}")
-
-                            # 检查当前物理频道是否符合目标画质
-                            if self._check_quality(phychannel, target_quality):
-                                if use_zte and params.get('zteurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['zteurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    print(f"使用ZTE流: {stream_url}")
-                                    break
-                                elif use_hw and params.get('hwurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['hwurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    print(f"使用HW流: {stream_url}")
-                                    break
-                                else:
-                                    # 尝试其他可能的URL字段
-                                    for key, value in params.items():
-                                        if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                            selected_phy = phychannel
-                                            stream_url = value
-                                            # 去除 URL 前后空格
-                                            stream_url = stream_url.strip()
-                                            print(f"使用其他流: {key}={stream_url}")
-                                            break
-                                    if stream_url:
-                                        break
-
-                        if not stream_url:
-                            # 如果没找到目标画质的流，尝试选择第一个可用的流
-                            for phychannel in sorted_phychannels:
-                                params = phychannel.get('params', {})
-                                if use_zte and params.get('zteurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['zteurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    print(f"使用ZTE流: {stream_url}")
-                                    break
-                                elif use_hw and params.get('hwurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['hwurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    print(f"使用HW流: {stream_url}")
-                                    break
-                                else:
-                                    for key, value in params.items():
-                                        if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                            selected_phy = phychannel
-                                            stream_url = value
-                                            # 去除 URL 前后空格
-                                            stream_url = stream_url.strip()
-                                            print(f"使用其他流: {key}={stream_url}")
-                                            break
-                                    if stream_url:
-                                        break
-
-                        if not stream_url:
-                            print(f"频道 {title} 没有找到可用的流地址")
-                            continue
-
-                        # 获取画质信息，直接从选中的物理频道获取
-                        if selected_phy:
-                            bitrate_type = selected_phy.get('bitrateTypeName', '未知')
-                            if not bitrate_type or bitrate_type == '未知':
-                                bitrate_type = self._get_bitrate_type(selected_phy.get('bitrateType', ''))
-                        else:
-                            bitrate_type = '未知'
+                total_channels = self._entry_total(merge)
 
-                        # 根据udp_proxy参数处理stream_url
-                        if udp_proxy:
-                            # 处理 rtp:// 和 udp://
-                            stream_url = stream_url.replace('rtp://', 'rtp/').replace('udp://', 'udp/')
-                            stream_url = f"http://{udp_proxy}/{stream_url}"
+                for entry in self.iter_entries(use_zte, use_hw, quality_preference, udp_proxy, multi_quality,
+                                               on_skip=self._print_skip, catchup=catchup, merge=merge, failover=failover):
+                    # 写入M3U条目
+                    f.write(formatter.format(entry))
 
-                        # 写入M3U条目
-                        extinf_line = f'#EXTINF:-1 tvg-id="{channel.get("code", "")}" tvg-name="{title}"'
-                        if channel_num:
-                            extinf_line += f' tvg-chno="{channel_num}"'
-                        if icon:
-                            extinf_line += f' tvg-logo="{icon}"'
-                        extinf_line += f' group-title="IPTV",{title} ({bitrate_type})\n'
-
-                        f.write(extinf_line)
-                        f.write(f'{stream_url}\n')
-
-                        processed_count += 1
-                        print(f"成功添加频道: {title}")
+                    processed_count += 1
+                    self._log(f"成功添加频道: {entry.channel.get('title', 'Unknown')} ({entry.quality})")
 
-                        # 更新进度
-                        if progress_callback:
-                            progress_callback(processed_count, total_channels)
+                    # 更新进度
+                    if progress_callback:
+                        progress_callback(processed_count, total_channels)
 
-                print(f"M3U生成完成，共添加 {processed_count} 个频道")
+                f.write(formatter.trailer())
+                self._log(f"M3U生成完成，共添加 {processed_count} 个频道")
 
             return True
 
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"生成M3U文件失败: {e}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            # 删除合并M3U暂存未匹配条目的临时文件
+            if merge:
+                merge.close()
 
-    # 修改generate_diyp方法，添加multi_quality参数和多画质输出逻辑
-    def generate_diyp(self, output_file, use_zte=True, use_hw=False, quality_preference='high', progress_callback=None, udp_proxy='', multi_quality=False):
+    def generate_diyp(self, output_file, use_zte=True, use_hw=False, quality_preference='high', progress_callback=None, udp_proxy='', multi_quality=False, catchup=None, merge=None, failover=False):
         """生成DIYP空壳直播源格式"""
         if not self.channels:
             print("没有频道数据")
             return False
 
-        print(f"开始生成DIYP空壳直播源，共 {len(self.channels)} 个频道")
+        self._log(f"开始生成DIYP空壳直播源，共 {len(self.channels)} 个频道")
 
         try:
             with open(output_file, 'w', encoding='utf-8') as f:
-                f.write('IPTV频道,#genre#\n')
+                formatter = DIYPFormatter()
+                f.write(formatter.header)
 
                 processed_count = 0
-                total_channels = len(self.channels)
+                total_channels = self._entry_total(merge)
 
-                for channel in self.channels:
-                    title = channel.get('title', 'Unknown')
-                    # 获取物理频道列表（兼容两种JSON格式）
-                    phychannels = self._get_phychannels(channel)
-                    if not phychannels:
-                        print(f"频道 {title} 没有物理频道信息")
-                        continue
+                for entry in self.iter_entries(use_zte, use_hw, quality_preference, udp_proxy, multi_quality,
+                                               on_skip=self._print_skip, catchup=catchup, merge=merge, failover=failover):
+                    f.write(formatter.format(entry))
 
-                    # 根据画质偏好排序物理频道
-                    sorted_phychannels = self._sort_phychannels_by_quality(phychannels, quality_preference)
-
-                    if multi_quality:
-                        # 多画质模式：保留所有可用的物理频道
-                        filtered_phychannels = []
-                        for phychannel in sorted_phychannels:
-                            params = phychannel.get('params', {})
-                            if (use_zte and params.get('zteurl')) or (use_hw and params.get('hwurl')):
-                                filtered_phychannels.append(phychannel)
-                        
-                        # 如果没有找到符合条件的频道，尝试使用第一个可用的流
-                        if not filtered_phychannels:
-                            for phychannel in sorted_phychannels:
-                                params = phychannel.get('params', {})
-                                for key, value in params.items():
-                                    if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                        filtered_phychannels.append(phychannel)
-                                        break
-                                if filtered_phychannels:
-                                    break
-                        
-                        for phychannel in filtered_phychannels:
-                            params = phychannel.get('params', {})
-                            stream_url = None
-                            
-                            # 选择适当的流URL
-                            if use_zte and params.get('zteurl'):
-                                stream_url = params['zteurl'].strip()
-                            elif use_hw and params.get('hwurl'):
-                                stream_url = params['hwurl'].strip()
-                            else:
-                                # 尝试其他可能的URL字段
-                                for key, value in params.items():
-                                    if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                        stream_url = value.strip()
-                                        break
-                            
-                            if not stream_url:
-                                continue
-                            
-                            # 获取画质信息
-                            bitrate_type = phychannel.get('bitrateTypeName', '未知')
-                            if not bitrate_type or bitrate_type == '未知':
-                                bitrate_type = self._get_bitrate_type(phychannel.get('bitrateType', ''))
-                            
-                            if udp_proxy:
-                                # 处理 rtp:// 和 udp://
-                                stream_url = stream_url.replace('rtp://', 'rtp/').replace('udp://', 'udp/')
-                                stream_url = f"http://{udp_proxy}/{stream_url}"
-                            
-                            line = f"{title},{stream_url}${bitrate_type}\n"
-                            f.write(line)
-                            
-                            processed_count += 1
-                            print(f"成功添加频道: {title} ({bitrate_type})")
-                            
-                            if progress_callback:
-                                progress_callback(processed_count, total_channels)
-                    else:
-                        # 单画质模式：选择第一个可用的物理频道
-                        selected_phy = None
-                        stream_url = None
-                        target_quality = self._get_target_quality_code(quality_preference)
-
-                        for phychannel in sorted_phychannels:
-                            params = phychannel.get('params', {})
-                            if self._check_quality(phychannel, target_quality):
-                                if use_zte and params.get('zteurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['zteurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    break
-                                elif use_hw and params.get('hwurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['hwurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    break
-                                else:
-                                    for key, value in params.items():
-                                        if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                            selected_phy = phychannel
-                                            stream_url = value
-                                            # 去除 URL 前后空格
-                                            stream_url = stream_url.strip()
-                                            break
-                                    if stream_url:
-                                        break
-
-                        if not stream_url:
-                            # 如果没找到目标画质的流，尝试选择第一个可用的流
-                            for phychannel in sorted_phychannels:
-                                params = phychannel.get('params', {})
-                                if use_zte and params.get('zteurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['zteurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    break
-                                elif use_hw and params.get('hwurl'):
-                                    selected_phy = phychannel
-                                    stream_url = params['hwurl']
-                                    # 去除 URL 前后空格
-                                    stream_url = stream_url.strip()
-                                    break
-                                else:
-                                    for key, value in params.items():
-                                        if key.endswith('url') and value and value.startswith(('rtp://', 'udp://', 'http://', 'https://')):
-                                            selected_phy = phychannel
-                                            stream_url = value
-                                            # 去除 URL 前后空格
-                                            stream_url = stream_url.strip()
-                                            break
-                                    if stream_url:
-                                        break
-
-                        if not stream_url:
-                            print(f"频道 {title} 没有找到可用的流地址")
-                            continue
-
-                        # 获取画质信息，直接从选中的物理频道获取
-                        if selected_phy:
-                            bitrate_type = selected_phy.get('bitrateTypeName', '未知')
-                            if not bitrate_type or bitrate_type == '未知':
-                                bitrate_type = self._get_bitrate_type(selected_phy.get('bitrateType', ''))
-                        else:
-                            bitrate_type = '未知'
+                    processed_count += 1
+                    self._log(f"成功添加频道: {entry.channel.get('title', 'Unknown')} ({entry.quality})")
+
+                    if progress_callback:
+                        progress_callback(processed_count, total_channels)
 
-                        if udp_proxy:
-                            # 处理 rtp:// 和 udp://
-                            stream_url = stream_url.replace('rtp://', 'rtp/').replace('udp://', 'udp/')
-                            stream_url = f"http://{udp_proxy}/{stream_url}"
+                f.write(formatter.trailer())
+                self._log(f"DIYP空壳直播源生成完成，共添加 {processed_count} 个频道")
 
-                        line = f"{title},{stream_url}${bitrate_type}\n"
-                        f.write(line)
+            return True
 
-                        processed_count += 1
-                        print(f"成功添加频道: {title}")
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"生成DIYP空壳直播源文件失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            # 删除合并M3U暂存未匹配条目的临时文件
+            if merge:
+                merge.close()
+
+    def generate_sharded(self, output_file, output_format='M3U', shard_by='group', shard_size=500, index_base_url='',
+                         use_zte=True, use_hw=False, quality_preference='high', progress_callback=None, udp_proxy='',
+                         multi_quality=False, catchup=None, merge=None, failover=False):
+        """分片生成播放列表：按分组或固定数量拆分为多个文件，output_file为引用各分片的索引列表"""
+        if not self.channels:
+            print("没有频道数据")
+            return False
 
-                        if progress_callback:
-                            progress_callback(processed_count, total_channels)
+        self._log(f"开始分片生成{output_format}，共 {len(self.channels)} 个频道")
 
-                print(f"DIYP空壳直播源生成完成，共添加 {processed_count} 个频道")
+        try:
+            processed_count = 0
+            total_channels = self._entry_total(merge)
+
+            def counted():
+                nonlocal processed_count
+                for entry in self.iter_entries(use_zte, use_hw, quality_preference, udp_proxy, multi_quality,
+                                               on_skip=self._print_skip, catchup=catchup, merge=merge, failover=failover):
+                    yield entry
+                    processed_count += 1
+                    if progress_callback:
+                        progress_callback(processed_count, total_channels)
 
+            shards = write_sharded_playlist(counted(), output_file, 'm3u' if output_format == 'M3U' else 'diyp',
+                                            shard_by, shard_size, index_base_url)
+            for label, path, count in shards:
+                self._log(f"分片 {label}: {path} ({count} 个条目)")
+            self._log(f"分片生成完成，共 {processed_count} 个条目，{len(shards)} 个分片，索引: {output_file}")
             return True
 
+        except JobCancelled:
+            raise
         except Exception as e:
-            print(f"生成DIYP空壳直播源文件失败: {e}")
+            print(f"分片生成失败: {e}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            # 删除合并M3U暂存未匹配条目的临时文件
+            if merge:
+                merge.close()
+
+def format_m3u_entry(entry):
+    """将条目格式化为M3U文本（EXTINF行和URL行），备用地址按顺序重复相同的EXTINF行，播放器会将其视为同一频道的多个源"""
+    channel = entry.channel
+    title = channel.get('title', 'Unknown')
+    channel_num = channel.get('channelnum', '')
+    icon = channel.get('icon', '')
+
+    extinf_line = f'#EXTINF:-1 tvg-id="{channel.get("code", "")}" tvg-name="{title}"'
+    if channel_num:
+        extinf_line += f' tvg-chno="{channel_num}"'
+    if icon:
+        extinf_line += f' tvg-logo="{icon}"'
+    if entry.catchup:
+        extinf_line += f' catchup="default" catchup-source="{entry.catchup}"'
+    # 带分组的频道（如合并的外部条目）保留原分组；外部条目的画质为空，名称保持原样
+    extinf_line += f' group-title="{channel.get("group") or "IPTV"}",{title}'
+    extinf_line += f' ({entry.quality})\n' if entry.quality else '\n'
+    text = f"{extinf_line}{entry.stream_url}\n"
+    for url, _ in entry.alternates:
+        text += f"{extinf_line}{url}\n"
+    return text
+
+def format_diyp_entry(entry):
+    """将条目格式化为DIYP文本行，备用地址以#分隔附加在主地址之后"""
+    quality = f"${entry.quality}" if entry.quality else ''
+    alternates = ''.join(f"#{url}${quality}" for url, quality in entry.alternates)
+    return f"{entry.channel.get('title', 'Unknown')},{entry.stream_url}{quality}{alternates}\n"
+
+class M3UFormatter:
+    """M3U格式渲染器，回看地址以catchup/catchup-source属性输出"""
+    header = M3U_HEADER
+
+    def format(self, entry):
+        return format_m3u_entry(entry)
+
+    def trailer(self):
+        return ''
+
+class DIYPFormatter:
+    """DIYP格式渲染器，DIYP没有条目属性，回看地址汇总在文件末尾的"回看频道"分组中"""
+    header = DIYP_HEADER
+
+    def __init__(self):
+        self.catchup_lines = []
+        self._seen = set()
+        self._group = DIYP_GROUP
+
+    def format(self, entry):
+        if entry.catchup:
+            line = f"{entry.channel.get('title', 'Unknown')},{entry.catchup}\n"
+            if line not in self._seen:
+                self._seen.add(line)
+                self.catchup_lines.append(line)
+        # 带分组的频道（如合并的外部条目）分组变化时插入新的#genre#行
+        group = entry.channel.get('group') or DIYP_GROUP
+        if group != self._group:
+            self._group = group
+            return f"{group},#genre#\n" + format_diyp_entry(entry)
+        return format_diyp_entry(entry)
+
+    def trailer(self):
+        if not self.catchup_lines:
+            return ''
+        return DIYP_CATCHUP_HEADER + ''.join(self.catchup_lines)
+
+# 输出格式对应的渲染器
+PLAYLIST_FORMATS = {
+    'm3u': M3UFormatter,
+    'diyp': DIYPFormatter
+}
+
+def iter_playlist_chunks(entries, fmt='m3u', chunk_size=64 * 1024):
+    """将条目渲染为文本块的生成器，不缓存整个列表，可直接作为HTTP响应体等流式输出"""
+    formatter = PLAYLIST_FORMATS[fmt]()
+    buffer = [formatter.header]
+    size = len(formatter.header)
+    for entry in entries:
+        text = formatter.format(entry)
+        buffer.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(formatter.trailer())
+    text = ''.join(buffer)
+    if text:
+        yield text
+
+def _is_binary_stream(fp):
+    if isinstance(fp, io.TextIOBase):
+        return False
+    if isinstance(fp, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    return 'b' in getattr(fp, 'mode', '')
+
+def write_playlist(entries, fp, fmt='m3u', encoding='utf-8'):
+    """将条目写入任意文件类对象（文本或二进制），返回写入的条目数"""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for entry in entries:
+            count += 1
+            yield entry
+
+    binary = _is_binary_stream(fp)
+    for chunk in iter_playlist_chunks(counted(), fmt):
+        fp.write(chunk.encode(encoding) if binary else chunk)
+    return count
+
+def channel_group(channel):
+    """返回频道所属的分组名称"""
+    group = channel.get('group')
+    if group:
+        return group
+    title = channel.get('title', '')
+    for name, pattern in CHANNEL_GROUPS:
+        if pattern.search(title):
+            return name
+    return DEFAULT_CHANNEL_GROUP
+
+class _PlaylistShard:
+    """一个分片文件：独立的缓冲写入器和渲染器"""
+
+    def __init__(self, label, path, fmt, encoding, buffer_size):
+        self.label = label
+        self.path = path
+        self.count = 0
+        self.formatter = PLAYLIST_FORMATS[fmt]()
+        self.file = open(path, 'w', encoding=encoding, buffering=buffer_size)
+        self.file.write(self.formatter.header)
+
+    def write(self, entry):
+        self.file.write(self.formatter.format(entry))
+        self.count += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(self.formatter.trailer())
+            self.file.close()
+
+    def remove(self):
+        """关闭并删除分片文件"""
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def _shard_file_name(label):
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', label)
+
+def write_sharded_playlist(entries, output_file, fmt='m3u', shard_by='group', shard_size=500, index_base_url='',
+                           encoding='utf-8', buffer_size=256 * 1024):
+    """一次遍历条目，按分组或固定数量写入多个分片文件，output_file写入引用各分片的索引列表
+
+    分片文件与索引位于同一目录，文件名为 索引名_分组名 或 索引名_序号；
+    按数量分片时同一频道的多个画质不会被拆到两个分片中。
+    index_base_url不为空时，索引中的分片地址为 index_base_url + 分片文件名，否则为相对路径。
+    遍历被取消（JobCancelled）或出错时没有索引引用已写入的分片，这些分片文件会被删除。
+    返回 [(分片名称, 分片路径, 条目数), ...]
+    """
+    base, ext = os.path.splitext(output_file)
+    shards = {}
+    order = []
+    current = None
+    current_code = None
+    try:
+        for entry in entries:
+            if shard_by == 'group':
+                label = channel_group(entry.channel)
+                shard = shards.get(label)
+                if shard is None:
+                    shard = _PlaylistShard(label, f"{base}_{_shard_file_name(label)}{ext}", fmt, encoding, buffer_size)
+                    shards[label] = shard
+                    order.append(shard)
+            else:
+                code = entry.channel.get('code', '')
+                if current is None or (current.count >= shard_size and code != current_code):
+                    if current is not None:
+                        current.close()
+                    index = len(order) + 1
+                    current = _PlaylistShard(f"{index:03d}", f"{base}_{index:03d}{ext}", fmt, encoding, buffer_size)
+                    order.append(current)
+                current_code = code
+                shard = current
+            shard.write(entry)
+    except BaseException:
+        for shard in order:
+            shard.remove()
+        raise
+    for shard in order:
+        shard.close()
+
+    with open(output_file, 'w', encoding=encoding) as f:
+        if fmt == 'm3u':
+            f.write(M3U_HEADER)
+            for shard in order:
+                f.write(f'#EXTINF:-1 group-title="索引",{shard.label} ({shard.count})\n')
+                f.write(f"{index_base_url}{os.path.basename(shard.path)}\n")
+        else:
+            f.write('索引,#genre#\n')
+            for shard in order:
+                f.write(f"{shard.label} ({shard.count}),{index_base_url}{os.path.basename(shard.path)}\n")
+    return [(shard.label, shard.path, shard.count) for shard in order]
+
+async def write_playlist_async(entries, stream, fmt='m3u', binary=True, encoding='utf-8', chunk_size=64 * 1024):
+    """将条目写入异步流，返回写入的条目数
+
+    stream可以是asyncio.StreamWriter（写入后等待drain），也可以是write方法为协程的对象；
+    entries可以是普通可迭代对象或异步可迭代对象。
+    """
+    formatter = PLAYLIST_FORMATS[fmt]()
+
+    async def emit(text):
+        result = stream.write(text.encode(encoding) if binary else text)
+        if inspect.isawaitable(result):
+            await result
+        elif hasattr(stream, 'drain'):
+            await stream.drain()
+
+    async def aiter_entries():
+        if hasattr(entries, '__aiter__'):
+            async for entry in entries:
+                yield entry
+        else:
+            for entry in entries:
+                yield entry
+
+    count = 0
+    buffer = [formatter.header]
+    size = len(formatter.header)
+    async for entry in aiter_entries():
+        text = formatter.format(entry)
+        buffer.append(text)
+        size += len(text)
+        count += 1
+        if size >= chunk_size:
+            await emit(''.join(buffer))
+            buffer = []
+            size = 0
+    buffer.append(formatter.trailer())
+    text = ''.join(buffer)
+    if text:
+        await emit(text)
+    return count
+
+def _parse_extinf(line):
+    """解析 #EXTINF:-1 key="value" ...,显示名称 ，返回 (显示名称, 属性字典)"""
+    body = line[len('#EXTINF:'):]
+    attrs = {}
+    end = 0
+    for match in _EXTINF_ATTR.finditer(body):
+        attrs[match.group(1).lower()] = match.group(2)
+        end = match.end()
+    comma = body.find(',', end)
+    return (body[comma + 1:].strip() if comma >= 0 else ''), attrs
+
+def iter_m3u(source, encoding='utf-8'):
+    """逐行解析M3U播放列表，逐个产出 M3UItem(title, attrs, url)，不把整个文件读入内存
+
+    source可以是文件路径或文本文件对象；没有EXTINF行的地址也会产出（名称为地址本身），
+    #EXTGRP 分组在条目没有group-title属性时作为group-title。
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r', encoding='utf-8-sig' if encoding == 'utf-8' else encoding, errors='replace') as f:
+            yield from iter_m3u(f)
+        return
+    title = None
+    attrs = {}
+    group = ''
+    for line in source:
+        line = line.strip().lstrip('\ufeff')
+        if not line:
+            continue
+        if line.startswith('#'):
+            if line.startswith('#EXTINF:'):
+                title, attrs = _parse_extinf(line)
+                group = ''
+            elif line.startswith('#EXTGRP:'):
+                group = line[len('#EXTGRP:'):].strip()
+            continue
+        if group and 'group-title' not in attrs:
+            attrs['group-title'] = group
+        yield M3UItem(title or attrs.get('tvg-name') or line, attrs, line)
+        title = None
+        attrs = {}
+        group = ''
+
+def normalize_title(title):
+    """频道名称的匹配键：统一全角半角和大小写，去掉空白、标点、括号内容和画质后缀
+
+    例如 "CCTV-1 综合 高清"、"cctv1综合" 和 "CCTV1综合[HD]" 得到相同的键。
+    """
+    text = _TITLE_NOISE.sub('', unicodedata.normalize('NFKC', title or '').casefold())
+    return _TITLE_QUALITY_SUFFIX.sub('', text) or text
+
+class M3UMerge:
+    """把第三方M3U播放列表合并到移动频道中，作为merge参数传给iter_entries和各生成方法
+
+    外部条目依次按tvg-id（与频道代码或规范化名称比较）、tvg-name和显示名称匹配移动频道。
+    外部文件每次准备时只读取一遍：匹配到的条目按频道保存（每个频道最多max_per_channel个地址），
+    未匹配的条目写入临时文件（超过spool_size字节后落盘），生成时排在移动频道之后，
+    因此内存占用只与移动频道数量有关，与外部文件大小无关。各生成方法结束时调用close删除临时文件，
+    同一对象再次用于生成时会重新读取外部文件；也可以用with语句管理。
+    """
+
+    def __init__(self, source, policy='cmcc', keep_unmatched=True, label='外部源', max_per_channel=4,
+                 spool_size=1024 * 1024):
+        if policy not in MERGE_POLICIES.values():
+            raise ValueError(f"未知的合并策略: {policy}")
+        self.source = source
+        self.policy = policy
+        self.keep_unmatched = keep_unmatched
+        self.label = label
+        self.max_per_channel = max_per_channel
+        self.spool_size = spool_size
+        self.matched_count = 0
+        self.unmatched_count = 0
+        self._channels = None
+        self._matched = {}
+        self._spool = None
+
+    @staticmethod
+    def _build_index(channels):
+        index = {}
+        for channel in channels:
+            for key in (channel.get('code'), normalize_title(channel.get('title', ''))):
+                if key:
+                    index.setdefault(key, channel)
+        return index
+
+    @staticmethod
+    def _match(index, item):
+        tvg_id = item.attrs.get('tvg-id', '')
+        for key in (tvg_id, normalize_title(tvg_id), normalize_title(item.attrs.get('tvg-name', '')),
+                    normalize_title(item.title)):
+            channel = index.get(key) if key else None
+            if channel is not None:
+                return channel
+        return None
+
+    def prepare(self, channels, quiet=False):
+        """读取外部文件并与channels匹配，channels未变化时不重复读取，返回未匹配的条目数；quiet为真时不输出匹配统计"""
+        if self._channels is channels:
+            return self.unmatched_count
+        self.close()
+        index = self._build_index(channels)
+        self._matched = {}
+        self._spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size, mode='w+', encoding='utf-8')
+        self.matched_count = 0
+        self.unmatched_count = 0
+        for item in iter_m3u(self.source):
+            channel = self._match(index, item)
+            if channel is not None:
+                items = self._matched.setdefault(id(channel), [])
+                if len(items) < self.max_per_channel and all(existing.url != item.url for existing in items):
+                    items.append(item)
+                    self.matched_count += 1
+            elif self.keep_unmatched:
+                self._spool.write(json.dumps([item.title, item.attrs, item.url], ensure_ascii=False) + '\n')
+                self.unmatched_count += 1
+        self._channels = channels
+        if not quiet:
+            print(f"合并M3U: {self.matched_count} 个条目匹配到 {len(self._matched)} 个频道，{self.unmatched_count} 个未匹配的条目")
+        return self.unmatched_count
+
+    def channel_entries(self, channel, entries):
+        """按冲突策略合并一个移动频道的条目和匹配到的外部条目，返回要输出的条目列表"""
+        items = self._matched.get(id(channel))
+        if not items:
+            return entries
+        urls = {entry.stream_url for entry in entries}
+        external = [ResolvedEntry(channel, None, item.url, self.label, item.attrs.get('catchup-source') or None)
+                    for item in items if item.url not in urls]
+        if not external:
+            return entries
+        if self.policy == 'external':
+            return external
+        if self.policy == 'both':
+            return entries + external
+        return entries or external
+
+    def unmatched_entries(self):
+        """逐个产出未匹配的外部条目，频道信息取自EXTINF属性"""
+        if self._spool is None:
+            return
+        self._spool.seek(0)
+        for line in self._spool:
+            title, attrs, url = json.loads(line)
+            channel = {
+                'code': attrs.get('tvg-id', ''),
+                'title': title,
+                'channelnum': attrs.get('tvg-chno', ''),
+                'icon': attrs.get('tvg-logo', ''),
+                'group': attrs.get('group-title', ''),
+                'phychannels': []
+            }
+            # 未匹配的条目是独立的频道，不附加来源标签，名称保持原样
+            yield ResolvedEntry(channel, None, url, '', attrs.get('catchup-source') or None)
+
+    def close(self):
+        """删除暂存未匹配条目的临时文件，之后再用于生成时会重新读取外部文件"""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        self._channels = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def merge_from_options(options):
+    """根据配置或预设中的merge_m3u/merge_policy/merge_unmatched字段创建M3UMerge，未设置时返回None"""
+    source = (options.get('merge_m3u') or '').strip()
+    if not source:
+        return None
+    policy = MERGE_POLICIES.get(options.get('merge_policy', ''), options.get('merge_policy') or 'cmcc')
+    return M3UMerge(source, policy, keep_unmatched=bool(options.get('merge_unmatched', True)))
+
+def load_presets(presets_file=PRESETS_FILE):
+    """加载命名预设，返回 {名称: 预设参数}"""
+    if not os.path.exists(presets_file):
+        return {}
+    with open(presets_file, 'r', encoding='utf-8') as f:
+        return json.load(f).get('presets', {})
+
+def save_presets(presets, presets_file=PRESETS_FILE):
+    """保存命名预设"""
+    with open(presets_file, 'w', encoding='utf-8') as f:
+        json.dump({'presets': presets}, f, ensure_ascii=False, indent=4)
+
+def load_probe_results(probe_file=PROBE_RESULTS_FILE):
+    """读取流分析保存的实测结果 {流地址: 分析结果}，文件不存在时返回空字典"""
+    if not os.path.exists(probe_file):
+        return {}
+    with open(probe_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_settings(preset_name=None, presets_file=PRESETS_FILE, config_file=CONFIG_FILE):
+    """读取生成设置：指定预设时返回该预设，否则返回iptv_config.json中的当前设置（没有配置文件时为空字典）"""
+    if preset_name:
+        presets = load_presets(presets_file)
+        if preset_name not in presets:
+            raise ValueError(f"未找到预设: {preset_name}")
+        return presets[preset_name]
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def preset_options(preset, exclude=()):
+    """将预设（与iptv_config.json相同的字段）转换为生成方法的参数，exclude中的参数（如catchup、merge）不会出现在结果中"""
+    stream_type = preset.get('stream_type', 'ZTE')
+    options = {
+        'use_zte': stream_type in ["ZTE", "两者都尝试"],
+        'use_hw': stream_type in ["HW", "两者都尝试"],
+        'quality_preference': QUALITY_OPTIONS.get(preset.get('quality', '高清优先'), 'high'),
+        'udp_proxy': preset.get('udp_proxy', '').strip(),
+        'multi_quality': bool(preset.get('multi_quality', False)),
+        'failover': bool(preset.get('failover', False))
+    }
+    if 'catchup' not in exclude:
+        options['catchup'] = CatchupResolver({
+            'ZTE': preset.get('catchup_zte_host', '').strip(),
+            'HW': preset.get('catchup_hw_host', '').strip()
+        }, preset.get('catchup_templates')) or None
+    if 'merge' not in exclude:
+        options['merge'] = merge_from_options(preset)
+    for name in exclude:
+        options.pop(name, None)
+    return options
+
+def load_converter(json_file, cache=None, channel_filter=None):
+    """加载并整理频道数据，返回不输出进度信息的转换器（供命令行工具使用），加载失败时抛出ValueError"""
+    converter = IPTV2M3U()
+    converter.quiet = True
+    if not converter.load_json(json_file, cache=cache, channel_filter=channel_filter):
+        raise ValueError(f"加载JSON文件失败: {json_file}")
+    converter.normalize()
+    return converter
+
+# 批量任务工作进程中共享的转换器
+_batch_converter = None
+
+def _init_batch_worker(channels):
+    global _batch_converter
+    _batch_converter = IPTV2M3U()
+    _batch_converter.channels = channels
+    _batch_converter.quiet = True
+
+def timestamped_file(output_file, now=None):
+    """在文件名（扩展名之前）加上 _YYYYmmdd_HHMMSS 时间戳，已有的时间戳会被替换"""
+    root, ext = os.path.splitext(output_file)
+    timestamp = (now or datetime.now()).strftime("%Y%m%d_%H%M%S")
+    return f"{_FILE_TIMESTAMP.sub('', root)}_{timestamp}{ext}"
+
+def _render_preset(name, preset, converter=None):
+    """用已加载的频道数据渲染单个预设，返回计时结果；预设启用timestamp时输出文件名带时间戳"""
+    converter = converter or _batch_converter
+    output_file = preset.get('output_file') or f"{name}{'.m3u' if preset.get('output_format', 'M3U') == 'M3U' else '.txt'}"
+    if preset.get('timestamp'):
+        output_file = timestamped_file(output_file)
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    channel_filter = compile_filter(preset.get('channel_filter', ''))
+    if channel_filter:
+        converter = converter.filtered(channel_filter)
+    success = True
+    if preset.get('output_csv'):
+        csv_output_file = os.path.splitext(output_file)[0] + '_channels_output.csv'
+        success = converter.generate_csv(csv_output_file)
+    shard_by = SHARD_OPTIONS.get(preset.get('shard_by', ''), preset.get('shard_by', ''))
+    if success and shard_by:
+        success = converter.generate_sharded(output_file, preset.get('output_format', 'M3U'), shard_by,
+                                             int(preset.get('shard_size', 500)), preset.get('index_base_url', ''),
+                                             **preset_options(preset))
+    elif success:
+        generate = converter.generate_m3u if preset.get('output_format', 'M3U') == 'M3U' else converter.generate_diyp
+        success = generate(output_file, **preset_options(preset))
+
+    return {
+        'name': name,
+        'output_file': output_file,
+        'success': success,
+        'seconds': time.perf_counter() - start
+    }
+
+def run_batch(json_file, presets, workers=1, cache=None, cancel_event=None, probe_results=None, channel_filter=None):
+    """只加载并整理一次输入，然后用共享的频道数据渲染所有预设；指定probe_results时先用实测画质修正标签
+
+    channel_filter在加载时过滤所有预设共用的频道，预设中的channel_filter规则只作用于该预设。
+    """
+    for name, preset in presets.items():
+        try:
+            compile_filter(preset.get('channel_filter', ''))
+        except ValueError as e:
+            raise ValueError(f"预设 {name} 的过滤规则无效: {e}")
+        try:
+            merge_from_options(preset)
+        except ValueError as e:
+            raise ValueError(f"预设 {name} 的合并设置无效: {e}")
+    report = {'json_file': json_file, 'results': []}
+    start = time.perf_counter()
+    converter = IPTV2M3U()
+    if not converter.load_json(json_file, cache=cache, channel_filter=channel_filter):
+        raise ValueError(f"加载JSON文件失败: {json_file}")
+    converter.normalize()
+    if probe_results:
+        report['quality_corrected'] = converter.apply_measured_quality(probe_results)
+    converter.cancel_event = cancel_event
+    # 批量模式下不输出逐频道的进度，不影响其他线程的输出
+    converter.quiet = True
+    report['channels'] = len(converter.channels)
+    report['load_seconds'] = time.perf_counter() - start
+
+    if workers > 1 and len(presets) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(converter.channels,)) as executor:
+            futures = [executor.submit(_render_preset, name, preset) for name, preset in presets.items()]
+            for future in futures:
+                if cancel_event is not None and cancel_event.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    raise JobCancelled()
+                report['results'].append(future.result())
+    else:
+        report['results'] = [_render_preset(name, preset, converter) for name, preset in presets.items()]
+
+    report['total_seconds'] = time.perf_counter() - start
+    return report
+
+def format_batch_report(report):
+    """生成批量任务的计时报告"""
+    lines = [
+        f"输入文件: {report['json_file']}",
+        f"加载并整理 {report['channels']} 个频道: {report['load_seconds']:.3f}s"
+    ]
+    if 'quality_corrected' in report:
+        lines.append(f"按实测画质修正 {report['quality_corrected']} 个物理频道")
+    for result in report['results']:
+        status = '成功' if result['success'] else '失败'
+        lines.append(f"  [{status}] {result['name']}: {result['output_file']} ({result['seconds']:.3f}s)")
+    render_seconds = sum(result['seconds'] for result in report['results'])
+    lines.append(f"渲染 {len(report['results'])} 个预设合计: {render_seconds:.3f}s，总耗时: {report['total_seconds']:.3f}s")
+    return '\n'.join(lines)
+
+class ModelCache:
+    """整理后频道数据的磁盘缓存：以源文件内容哈希和结构版本为键，pickle二进制存储，目录超出容量时按最近使用时间淘汰"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key_for(self, json_file):
+        """计算源文件的缓存键"""
+        digest = hashlib.sha256()
+        with open(json_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return f"v{MODEL_SCHEMA_VERSION}_{digest.hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def load(self, key):
+        """读取缓存，不存在或已损坏时返回None（损坏的缓存文件会被删除）"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        # 反序列化会创建大量容器对象，期间暂停循环垃圾回收可显著缩短加载时间
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                header, channels = pickle.load(f)
+            if header != (MODEL_SCHEMA_VERSION, key):
+                raise ValueError("缓存结构版本不匹配")
+            # 更新修改时间，作为最近使用时间供淘汰策略使用
+            os.utime(path)
+            return channels
+        except Exception as e:
+            print(f"缓存无效，已删除: {path} ({e})")
+            self._remove(path)
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def store(self, key, channels):
+        """写入缓存（先写临时文件再原子替换），然后执行淘汰"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(((MODEL_SCHEMA_VERSION, key), channels), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self._path(key))
+            except Exception:
+                self._remove(temp_path)
+                raise
+            self.evict(keep=self._path(key))
+            return True
+        except Exception as e:
+            print(f"写入缓存失败: {e}")
+            return False
+
+    def entries(self):
+        """返回缓存文件列表 [(修改时间, 大小, 路径), ...]，按最近使用时间从旧到新排序"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        result = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, path))
+        result.sort()
+        return result
+
+    def evict(self, keep=None):
+        """删除最久未使用的缓存，直到目录总大小不超过上限（keep指定的文件不删除）"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """清空缓存目录"""
+        for _, _, path in self.entries():
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+# 调度器中的任务：去重键、任务函数、参数和取消事件
+Job = namedtuple('Job', ['key', 'func', 'args', 'cancel_event'])
+
+class JobScheduler:
+    """单工作线程的任务队列：任务按提交顺序依次执行，相同的任务不会重复排队，支持协作式取消
+
+    任务函数的第一个参数为取消事件（threading.Event），长时间运行的循环应定期检查并抛出JobCancelled。
+    """
+
+    def __init__(self):
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._current = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, func, *args):
+        """提交任务，与正在执行或排队中的任务相同时忽略并返回False"""
+        with self._condition:
+            if self._current is not None and self._current.key == key:
+                return False
+            if any(job.key == key for job in self._queue):
+                return False
+            self._queue.append(Job(key, func, args, threading.Event()))
+            self._condition.notify()
+            return True
+
+    def cancel_current(self):
+        """取消正在执行的任务"""
+        with self._condition:
+            if self._current is not None:
+                self._current.cancel_event.set()
+
+    def cancel_all(self):
+        """清空队列并取消正在执行的任务，返回被取消的任务数"""
+        with self._condition:
+            count = len(self._queue)
+            self._queue.clear()
+            if self._current is not None:
+                self._current.cancel_event.set()
+                count += 1
+            return count
+
+    def is_busy(self):
+        with self._condition:
+            return self._current is not None or bool(self._queue)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                job = self._queue.popleft()
+                self._current = job
+            try:
+                job.func(job.cancel_event, *job.args)
+            except JobCancelled:
+                pass
+            except Exception as e:
+                print(f"任务执行失败: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._current = None
+
+class RingLogView:
+    """有界日志视图：固定容量的环形缓冲，每帧批量插入并成批裁剪旧行，完整日志写入溢出文件"""
+
+    def __init__(self, root, text_widget, capacity=2000, frame_ms=50):
+        self.root = root
+        self.text = text_widget
+        self.capacity = capacity
+        self.frame_ms = frame_ms
+        # 待显示的行只保留最后capacity条，一帧内的突发日志不会全部进入控件
+        self._pending = deque(maxlen=capacity)
+        self._spill_pending = []
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._line_count = 0
+        fd, self.spill_path = tempfile.mkstemp(prefix='iptv_log_', suffix='.log')
+        self._spill = os.fdopen(fd, 'w', encoding='utf-8')
+
+    def append(self, line):
+        """线程安全地追加一行日志，每帧最多调度一次刷新"""
+        with self._lock:
+            self._pending.append(line)
+            self._spill_pending.append(line)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.root.after(self.frame_ms, self.flush)
+
+    def flush(self):
+        """将缓冲的日志一次性写入控件和溢出文件（在GUI线程中调用）"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            spill_lines = self._spill_pending
+            self._spill_pending = []
+            self._scheduled = False
+
+        if spill_lines and not self._spill.closed:
+            self._spill.write('\n'.join(spill_lines) + '\n')
+
+        if not lines:
+            return
+
+        chunk = '\n'.join(lines) + '\n'
+        # 仅当用户停留在底部时才自动滚动
+        at_end = self.text.yview()[1] >= 1.0
+        self.text.insert(tk.END, chunk)
+        self._line_count += chunk.count('\n')
+
+        # 超出容量时成批删除最旧的行
+        excess = self._line_count - self.capacity
+        if excess > 0:
+            self.text.delete('1.0', f'{excess + 1}.0')
+            self._line_count -= excess
+
+        if at_end:
+            self.text.see(tk.END)
+
+    def clear(self):
+        """清空日志控件和溢出文件"""
+        with self._lock:
+            self._pending.clear()
+            self._spill_pending = []
+        self.text.delete('1.0', tk.END)
+        self._line_count = 0
+        if not self._spill.closed:
+            self._spill.seek(0)
+            self._spill.truncate()
+
+    def export(self, file_path):
+        """从溢出文件流式导出完整日志"""
+        self.flush()
+        self._spill.flush()
+        with open(self.spill_path, 'r', encoding='utf-8') as src, open(file_path, 'w', encoding='utf-8') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    def close(self):
+        """关闭并删除溢出文件"""
+        if not self._spill.closed:
+            self._spill.close()
+        try:
+            os.remove(self.spill_path)
+        except OSError:
+            pass
+
+class ChannelSearchIndex:
+    """预建的频道搜索索引：子串检索在拼接文本上用str.find完成，前缀检索在有序键上二分查找"""
+
+    def __init__(self, rows, fields):
+        self.size = len(rows)
+        parts = []
+        self._starts = []
+        pos = 0
+        prefix_keys = []
+        for row_id, row in enumerate(rows):
+            values = [str(row[field]).lower() for field in fields]
+            text = '\x00'.join(values)
+            self._starts.append(pos)
+            parts.append(text)
+            pos += len(text) + 1
+            prefix_keys.extend((value, row_id) for value in values if value)
+        # 每行一段，行之间用\x01分隔，查询时可据偏移量二分得到行号
+        self._haystack = '\x01'.join(parts)
+        prefix_keys.sort()
+        self._prefix_values = [key for key, _ in prefix_keys]
+        self._prefix_rows = [row_id for _, row_id in prefix_keys]
+
+    def contains(self, token):
+        """返回任一字段包含token的行号（升序）"""
+        haystack = self._haystack
+        starts = self._starts
+        result = []
+        pos = haystack.find(token)
+        while pos != -1:
+            row_id = bisect.bisect_right(starts, pos) - 1
+            result.append(row_id)
+            # 跳到下一行开头，避免同一行重复命中
+            if row_id + 1 >= self.size:
+                break
+            pos = haystack.find(token, starts[row_id + 1])
+        return result
+
+    def prefix(self, token):
+        """返回任一字段以token开头的行号（升序）"""
+        lo = bisect.bisect_left(self._prefix_values, token)
+        hi = bisect.bisect_left(self._prefix_values, token + '\uffff', lo)
+        return sorted(set(self._prefix_rows[lo:hi]))
+
+    def search(self, query):
+        """按空格分词，各词条件取交集；以^开头的词按前缀匹配，其余按子串匹配"""
+        tokens = [token for token in query.lower().replace('\x00', '').replace('\x01', '').split() if token != '^']
+        if not tokens:
+            return range(self.size)
+        result = None
+        for token in tokens:
+            if token.startswith('^'):
+                matched = self.prefix(token[1:])
+            else:
+                matched = self.contains(token)
+            if result is None:
+                result = matched
+            else:
+                matched_set = set(matched)
+                result = [row_id for row_id in result if row_id in matched_set]
+            if not result:
+                break
+        return result
+
+class PreviewPipeline:
+    """界面实时预览的分阶段缓存：整理后的频道常驻内存，选项变化时只重新计算受影响的阶段
+
+    阶段依次为加载整理（源文件或过滤规则变化时由调用方重建）、流选择（流类型、画质、多画质、
+    备用地址、合并M3U变化）和代理改写（udp_proxy变化）。流选择阶段保存未经代理的地址及其代理路径，
+    代理改写只需为每个条目拼接字符串，多个代理时组播地址在哈希环上的位置也只计算一次。
+    最近几次的选择结果按选项保留，来回切换选项时不需要重新选择。
+    """
+
+    # 保留的选择结果数量
+    SELECTION_CACHE_SIZE = 8
+
+    def __init__(self, converter, source_key):
+        self.converter = converter
+        self.source_key = source_key
+        self.rows = []
+        self._selection_key = None
+        self._udp_proxy = None
+        # 选择结果 {选项: [选择的条目, 哈希环位置]}，条目为 (频道号, 频道名称, 画质, 原始地址, 代理路径或None)，按使用顺序排列
+        self._selections = {}
+
+    @staticmethod
+    def selection_key(options):
+        merge = options.get('merge')
+        merge_key = None
+        if merge:
+            merge_key = (merge.source, os.path.getmtime(merge.source), merge.policy, merge.keep_unmatched)
+        return (options['use_zte'], options['use_hw'], options['quality_preference'], options['multi_quality'],
+                options.get('failover', False), merge_key)
+
+    def update(self, options):
+        """按选项更新rows，返回重新计算的最早阶段 'select' 或 'proxy'，都命中缓存时返回None
+
+        udp_proxy无效时抛出ValueError，已有的结果保持不变。
+        """
+        selection_key = self.selection_key(options)
+        udp_proxy = options.get('udp_proxy', '')
+        if selection_key == self._selection_key and udp_proxy == self._udp_proxy:
+            return None
+        selected, points = self._selections.get(selection_key) or (self._select(options), None)
+        rows, points = self._proxied_rows(selected, points, udp_proxy)
+        self._selections.pop(selection_key, None)
+        self._selections[selection_key] = [selected, points]
+        if len(self._selections) > self.SELECTION_CACHE_SIZE:
+            del self._selections[next(iter(self._selections))]
+        stage = 'proxy' if selection_key == self._selection_key else 'select'
+        self.rows = rows
+        self._selection_key, self._udp_proxy = selection_key, udp_proxy
+        return stage
+
+    def _select(self, options):
+        """运行流选择阶段，与preview_rows选择的条目相同，地址暂不经过代理"""
+        merge = options.get('merge')
+        selected = []
+        try:
+            for entry in self.converter.iter_entries(options['use_zte'], options['use_hw'], options['quality_preference'], '',
+                                                     options['multi_quality'], merge=merge,
+                                                     failover=options.get('failover', False)):
+                url = entry.stream_url
+                # 与_proxied_entry相同：外部条目只有组播地址才经过代理
+                proxied = entry.phychannel is not None or url.startswith(('rtp://', 'udp://'))
+                path = url.replace('rtp://', 'rtp/').replace('udp://', 'udp/') if proxied else None
+                selected.append((entry.channel.get('channelnum', ''), entry.channel.get('title', 'Unknown'),
+                                 entry.quality, url, path))
+        finally:
+            if merge:
+                merge.close()
+        return selected
+
+    @staticmethod
+    def _proxied_rows(selected, points, udp_proxy):
+        """运行代理改写阶段，返回 (rows, 组播地址的哈希环位置)，位置只在首次使用多个代理时计算"""
+        if not udp_proxy:
+            return [(num, title, quality, url) for num, title, quality, url, _ in selected], points
+        ring = get_proxy_ring(udp_proxy)
+        if len(ring.endpoints) == 1:
+            proxy = ring.endpoints[0][0]
+            return [(num, title, quality, f"http://{proxy}/{path}" if path else url)
+                    for num, title, quality, url, path in selected], points
+        if points is None:
+            points = [ProxyRing.address_hash(url) if path else None for _, _, _, url, path in selected]
+        node_for = ring.node_for
+        return [(num, title, quality, f"http://{node_for(point)}/{path}" if path else url)
+                for (num, title, quality, url, path), point in zip(selected, points)], points
+
+class ChannelPreviewWindow:
+    """频道预览窗口：虚拟化的Treeview只创建可见行，滚动时仅替换这些行的内容"""
+
+    COLUMNS = (('channelnum', '频道号', 70), ('title', '频道名称', 180), ('bitrate', '画质', 80), ('url', '流地址', 330))
+
+    def __init__(self, parent, visible_rows=25):
+        self.rows = []
+        self.index = None
+        self.matches = range(0)
+        self.offset = 0
+        self.visible_rows = visible_rows
+        self._search_job = None
+
+        self.window = tk.Toplevel(parent)
+        self.window.title("频道预览")
+        self.window.geometry("700x600")
+
+        search_frame = ttk.Frame(self.window, padding="5")
+        search_frame.pack(fill=tk.X)
+        ttk.Label(search_frame, text="筛选:").pack(side=tk.LEFT, padx=5)
+        self.query_var = tk.StringVar(value="")
+        self.query_var.trace_add('write', self._on_query_changed)
+        ttk.Entry(search_frame, textvariable=self.query_var, width=40).pack(side=tk.LEFT, padx=5)
+        self.count_var = tk.StringVar(value="")
+        ttk.Label(search_frame, textvariable=self.count_var).pack(side=tk.LEFT, padx=5)
+
+        table_frame = ttk.Frame(self.window, padding="5")
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=[c[0] for c in self.COLUMNS], show='headings',
+                                 height=visible_rows, selectmode='browse')
+        for column, heading, width in self.COLUMNS:
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor=tk.W)
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # 预先创建固定数量的行，之后只更新内容
+        self.items = [self.tree.insert('', tk.END, values=('', '', '', '')) for _ in range(visible_rows)]
+
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll_to(self.offset - 3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll_to(self.offset + 3))
+
+    def set_rows(self, rows, keep_position=False):
+        """设置预览数据，搜索索引在有筛选条件时才建立"""
+        self.rows = rows
+        self.index = None
+        self.apply_filter(keep_position)
+
+    def update_urls(self, rows):
+        """只有流地址变化时替换行内容，搜索索引（不含流地址）、筛选结果和滚动位置保持不变"""
+        self.rows = rows
+        self.scroll_to(self.offset)
+
+    def apply_filter(self, keep_position=False):
+        """按当前筛选条件刷新匹配结果"""
+        self._search_job = None
+        query = self.query_var.get()
+        if query.strip():
+            if self.index is None:
+                self.index = ChannelSearchIndex(self.rows, (0, 1, 2))
+            self.matches = self.index.search(query)
+        else:
+            self.matches = range(len(self.rows))
+        self.count_var.set(f"{len(self.matches)} / {len(self.rows)}")
+        self.scroll_to(self.offset if keep_position else 0)
+
+    def scroll_to(self, offset):
+        """滚动到指定偏移，仅刷新可见行"""
+        max_offset = max(0, len(self.matches) - self.visible_rows)
+        self.offset = max(0, min(offset, max_offset))
+        for i, item in enumerate(self.items):
+            position = self.offset + i
+            if position < len(self.matches):
+                self.tree.item(item, values=self.rows[self.matches[position]])
+            else:
+                self.tree.item(item, values=('', '', '', ''))
+        total = len(self.matches)
+        if total > self.visible_rows:
+            self.scrollbar.set(self.offset / total, (self.offset + self.visible_rows) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _on_query_changed(self, *args):
+        # 合并同一帧内的连续输入
+        if self._search_job is None:
+            self._search_job = self.window.after(16, self.apply_filter)
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * len(self.matches)))
+        elif action == 'scroll':
+            step = self.visible_rows if unit == 'pages' else 1
+            self.scroll_to(self.offset + int(value) * step)
+
+    def _on_mousewheel(self, event):
+        self.scroll_to(self.offset - int(event.delta / 120) * 3)
 
 class IPTV2M3UGUI:
     def __init__(self, root):
@@ -642,11 +2415,34 @@ class IPTV2M3UGUI:
         self.udp_proxy_var = tk.StringVar(value="")
         self.timestamp_var = tk.BooleanVar(value=True)
         self.multi_quality_var = tk.BooleanVar(value=False)
+        self.failover_var = tk.BooleanVar(value=False)
         self.output_csv_var = tk.BooleanVar(value=False) 
+        self.record_snapshot_var = tk.BooleanVar(value=False)
+        self.use_probe_results_var = tk.BooleanVar(value=False)
+        self.shard_var = tk.StringVar(value="不分片")
+        self.shard_size_var = tk.StringVar(value="500")
+        self.channel_filter_var = tk.StringVar(value="")
+        self.merge_m3u_var = tk.StringVar(value="")
+        self.merge_policy_var = tk.StringVar(value="移动优先")
+        self.merge_unmatched_var = tk.BooleanVar(value=True)
+        self.catchup_zte_var = tk.StringVar(value="")
+        self.catchup_hw_var = tk.StringVar(value="")
+        self.catchup_templates = None  # 可在配置文件中覆盖默认的回看地址模板
+        self.last_json_file = None
+        self.preview_window = None
+        self.preview_pipeline = None  # 预览用的频道数据及各阶段结果，打开预览后常驻内存
+        self._preview_job = None
+        # 下载、转换等耗时任务在同一个工作线程中依次执行
+        self.scheduler = JobScheduler()
 
         # 创建UI
         self.create_widgets()
 
+        # 预览窗口打开时，影响流选择和代理的选项变化后增量刷新预览
+        for var in (self.stream_var, self.quality_var, self.multi_quality_var, self.failover_var, self.udp_proxy_var,
+                    self.merge_m3u_var, self.merge_policy_var, self.merge_unmatched_var):
+            var.trace_add('write', self._on_preview_option_changed)
+
         # 加载配置
         self.load_config()
 
@@ -692,6 +2488,7 @@ class IPTV2M3UGUI:
         self.output_format_var = tk.StringVar(value="M3U")
         ttk.Radiobutton(options_frame, text="M3U", variable=self.output_format_var, value="M3U").grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
         ttk.Radiobutton(options_frame, text="DIYP", variable=self.output_format_var, value="DIYP").grid(row=2, column=2, sticky=tk.W, padx=5, pady=2)
+        ttk.Checkbutton(options_frame, text="备用地址", variable=self.failover_var).grid(row=2, column=3, sticky=tk.W, padx=5, pady=2)
         
         # 输出选项
         ttk.Label(options_frame, text="输出选项:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
@@ -713,7 +2510,42 @@ class IPTV2M3UGUI:
             "192.168.1.201:4022"
         )
         self.udp_proxy_combo.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5, pady=2)
-        ttk.Label(advanced_frame, text="格式: ip:port").grid(row=0, column=2, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(advanced_frame, text="格式: ip:port[*权重]，多个用逗号分隔").grid(row=0, column=2, sticky=tk.W, padx=5, pady=2)
+
+        # 下载后导入快照库
+        ttk.Checkbutton(advanced_frame, text="下载后记录快照", variable=self.record_snapshot_var).grid(row=1, column=0, columnspan=2, sticky=tk.W, padx=5, pady=2)
+        # 使用iptv_probe.py保存的实测画质修正画质标签
+        ttk.Checkbutton(advanced_frame, text="使用实测画质", variable=self.use_probe_results_var).grid(row=1, column=2, sticky=tk.W, padx=5, pady=2)
+
+        # 回看服务器设置，留空则不输出回看地址
+        ttk.Label(advanced_frame, text="ZTE回看:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(advanced_frame, textvariable=self.catchup_zte_var, width=20).grid(row=2, column=1, sticky=(tk.W, tk.E), padx=5, pady=2)
+        ttk.Label(advanced_frame, text="HW回看:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(advanced_frame, textvariable=self.catchup_hw_var, width=20).grid(row=3, column=1, sticky=(tk.W, tk.E), padx=5, pady=2)
+        ttk.Label(advanced_frame, text="回看服务器 ip:port").grid(row=2, column=2, rowspan=2, sticky=tk.W, padx=5, pady=2)
+
+        # 分片输出，低配置播放器可以只加载需要的分片
+        ttk.Label(advanced_frame, text="分片输出:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Combobox(advanced_frame, textvariable=self.shard_var, values=list(SHARD_OPTIONS), state="readonly", width=18).grid(row=4, column=1, sticky=(tk.W, tk.E), padx=5, pady=2)
+        shard_size_frame = ttk.Frame(advanced_frame)
+        shard_size_frame.grid(row=4, column=2, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(shard_size_frame, text="每个分片").pack(side=tk.LEFT)
+        ttk.Entry(shard_size_frame, textvariable=self.shard_size_var, width=6).pack(side=tk.LEFT, padx=2)
+        ttk.Label(shard_size_frame, text="个频道").pack(side=tk.LEFT)
+
+        # 频道过滤规则，加载时排除不需要的频道
+        ttk.Label(advanced_frame, text="频道过滤:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(advanced_frame, textvariable=self.channel_filter_var, width=20).grid(row=5, column=1, sticky=(tk.W, tk.E), padx=5, pady=2)
+        ttk.Label(advanced_frame, text="如 exclude title ~ 购物; include channelnum in 1-199").grid(row=5, column=2, sticky=tk.W, padx=5, pady=2)
+
+        # 合并第三方M3U，按频道名称或tvg-id与移动频道匹配
+        ttk.Label(advanced_frame, text="合并M3U:").grid(row=6, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(advanced_frame, textvariable=self.merge_m3u_var, width=20).grid(row=6, column=1, sticky=(tk.W, tk.E), padx=5, pady=2)
+        merge_frame = ttk.Frame(advanced_frame)
+        merge_frame.grid(row=6, column=2, sticky=tk.W, padx=5, pady=2)
+        ttk.Button(merge_frame, text="浏览", command=self.browse_merge_m3u).pack(side=tk.LEFT)
+        ttk.Combobox(merge_frame, textvariable=self.merge_policy_var, values=list(MERGE_POLICIES), state="readonly", width=8).pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(merge_frame, text="保留未匹配", variable=self.merge_unmatched_var).pack(side=tk.LEFT)
         
         # 输出文件区域
         output_frame = ttk.LabelFrame(main_frame, text="输出文件", padding="5")
@@ -740,7 +2572,12 @@ class IPTV2M3UGUI:
         ttk.Button(button_frame, text="仅下载", command=self.start_download_only).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="下载并转换", command=self.start_download_and_convert).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="选择本地文件", command=self.select_local_file).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="预览频道", command=self.open_preview).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="保存预设", command=self.save_preset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="批量生成", command=self.start_batch).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="停止", command=self.stop_jobs).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="清空", command=self.clear_all).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="导出日志", command=self.export_log).pack(side=tk.LEFT, padx=5)
 
         # 日志区域
         log_frame = ttk.LabelFrame(main_frame, text="操作日志", padding="5")
@@ -748,6 +2585,7 @@ class IPTV2M3UGUI:
 
         self.log_text = scrolledtext.ScrolledText(log_frame, height=15, width=80)
         self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.log_view = RingLogView(self.root, self.log_text)
 
         # 配置权重
         self.root.columnconfigure(0, weight=1)
@@ -861,28 +2699,38 @@ class IPTV2M3UGUI:
         if not url:
             messagebox.showerror("错误", "请输入JSON源URL")
             return
+        if not self.submit_job(('download', url), self.download_thread_only, url):
+            return
         self.set_ui_enabled(False)
         self.status_var.set("开始下载JSON文件...")
-        threading.Thread(target=self.download_thread_only, args=(url,), daemon=True).start()
 
-    def download_thread_only(self, url):
+    def download_thread_only(self, cancel_event, url):
+        file_path = None
         try:
-            response = requests.get(url, timeout=30)
+            response = requests.get(url, stream=True, timeout=30)
             response.raise_for_status()
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             temp_dir = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), 'temp')
             os.makedirs(temp_dir, exist_ok=True)
             file_name = f"downloaded_{timestamp}.json"
             file_path = os.path.join(temp_dir, file_name)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            with open(file_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if cancel_event.is_set():
+                        raise JobCancelled()
+                    f.write(chunk)
             self.log("\n    URL地址: "+url+"\n    文件保存为: " + file_path + "\n    下载完成")         
+            if self.record_snapshot_var.get():
+                self.record_snapshot(file_path)
+        except JobCancelled:
+            self.remove_partial_file(file_path)
+            self.root.after(0, self.on_job_cancelled)
         except Exception as e:
             self.root.after(0, self.on_download_error, str(e))
         finally:
+            # 界面只能在主线程中更新
             self.root.after(0, self.set_ui_enabled, True)
-            self.set_ui_enabled(True)
-            self.status_var.set("完成")   
+            self.root.after(0, self.status_var.set, "完成")
 
     def start_download_and_convert(self):
         url = self.url_var.get().strip()
@@ -895,17 +2743,16 @@ class IPTV2M3UGUI:
             return
 
         self.save_config()  # 保存当前参数
+
+        # 提交下载任务
+        if not self.submit_job(('download_convert', url), self.download_thread, url):
+            return
         self.log(f"开始下载: {url}")
         self.log("正在连接服务器...")
         self.set_ui_enabled(False)
         self.update_progress(0, "正在连接...")
 
-        # 启动下载线程
-        thread = threading.Thread(target=self.download_thread, args=(url,))
-        thread.daemon = True
-        thread.start()
-
-    def download_thread(self, url):
+    def download_thread(self, cancel_event, url):
         try:
             self.log(f"开始下载: {url}")
 
@@ -929,6 +2776,8 @@ class IPTV2M3UGUI:
 
             with open(self.temp_json_file, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
+                    if cancel_event.is_set():
+                        raise JobCancelled()
                     if chunk:
                         f.write(chunk)
                         downloaded += len(chunk)
@@ -945,12 +2794,17 @@ class IPTV2M3UGUI:
             try:
                 with open(self.temp_json_file, 'r', encoding='utf-8') as f:
                     json.load(f)  # 尝试解析JSON
+                if self.record_snapshot_var.get():
+                    self.record_snapshot(self.temp_json_file)
                 self.root.after(0, lambda: self.on_download_finished(self.temp_json_file, True))
             except json.JSONDecodeError:
                 self.root.after(0, lambda: self.on_download_error("下载的文件不是有效的JSON格式"))
             except Exception as e:
                 self.root.after(0, lambda: self.on_download_error(f"文件验证失败: {str(e)}"))
 
+        except JobCancelled:
+            self.remove_partial_file(self.temp_json_file)
+            self.root.after(0, self.on_job_cancelled)
         except requests.exceptions.Timeout:
             self.root.after(0, lambda: self.on_download_error("连接超时"))
         except requests.exceptions.ConnectionError:
@@ -960,9 +2814,59 @@ class IPTV2M3UGUI:
         except Exception as e:
             self.root.after(0, lambda: self.on_download_error(f"下载失败: {str(e)}"))
 
+    def submit_job(self, key, func, *args):
+        """向任务队列提交任务，相同的任务已在执行或排队时给出提示"""
+        if self.scheduler.submit(key, func, *args):
+            return True
+        self.log("相同的任务正在执行或已在队列中，已忽略")
+        return False
+
+    def stop_jobs(self):
+        """取消正在执行和排队中的任务"""
+        count = self.scheduler.cancel_all()
+        if count:
+            self.log(f"正在停止 {count} 个任务...")
+            self.status_var.set("正在停止...")
+        else:
+            self.log("没有正在执行的任务")
+
+    def on_job_cancelled(self):
+        self.log("任务已取消")
+        self.status_var.set("已取消")
+        self.set_ui_enabled(True)
+        self.progress_var.set(0)
+
+    def remove_partial_file(self, file_path):
+        """删除被取消的任务留下的不完整文件"""
+        if file_path and os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+    def record_snapshot(self, json_file):
+        """将下载的JSON文件导入快照库"""
+        try:
+            from iptv_store import SnapshotStore
+            store = SnapshotStore()
+            try:
+                snapshot_id = store.ingest(json_file)
+            finally:
+                store.close()
+            self.log(f"已记录快照 #{snapshot_id}: {json_file}")
+        except Exception as e:
+            self.log(f"记录快照失败: {str(e)}")
+
+    def browse_merge_m3u(self):
+        file_path = filedialog.askopenfilename(
+            filetypes=[("M3U Files", "*.m3u *.m3u8"), ("All Files", "*.*")]
+        )
+        if file_path:
+            self.merge_m3u_var.set(file_path)
+
     def select_local_file(self):
         file_path = filedialog.askopenfilename(
-            filetypes=[("JSON Files", "*.json"), ("All Files", "*.*")]
+            filetypes=[("JSON Files", "*.json"), ("CSV Files", "*.csv"), ("All Files", "*.*")]
         )
         if file_path:
             self.save_config()  # 保存当前参数
@@ -1012,34 +2916,86 @@ class IPTV2M3UGUI:
         use_zte = stream_type in ["ZTE", "两者都尝试"]
         use_hw = stream_type in ["HW", "两者都尝试"]
 
-        quality_str = self.quality_var.get()
-        if quality_str == "高清优先":
-            quality = "high"
-        elif quality_str == "标清优先":
-            quality = "standard"
-        elif quality_str == "超高清优先":
-            quality = "ultra_high"
-        else:
-            quality = "high"
+        quality = QUALITY_OPTIONS.get(self.quality_var.get(), "high")
         multi_quality = self.multi_quality_var.get()
+        failover = self.failover_var.get()
         output_format = self.output_format_var.get()
         udp_proxy = self.udp_proxy_var.get().strip()
         output_csv = self.output_csv_var.get()  # 获取是否输出中间表的值
+        catchup = self.get_catchup()
+        sharding = self.get_sharding()
+        channel_filter = self.get_channel_filter()
+        if channel_filter is False:
+            self.set_ui_enabled(True)
+            return
+        merge = self.get_merge()
+        if merge is False:
+            self.set_ui_enabled(True)
+            return
+
+        # 提交转换任务，相同来源和选项的任务不会重复排队
+        job_key = ('convert', json_file, self.output_var.get().strip(), use_zte, use_hw, quality, multi_quality,
+                   output_format, udp_proxy, output_csv, self.catchup_zte_var.get().strip(), self.catchup_hw_var.get().strip(),
+                   sharding, self.channel_filter_var.get().strip(), self.merge_m3u_var.get().strip(),
+                   self.merge_policy_var.get(), self.merge_unmatched_var.get(), failover)
+        if not self.submit_job(job_key, self.conversion_thread, json_file, output_file, use_zte, use_hw, quality,
+                               multi_quality, output_format, udp_proxy, output_csv, catchup, sharding, channel_filter,
+                               merge, failover):
+            return
 
+        self.last_json_file = json_file
         self.log(f"开始转换: {json_file} -> {output_file}")
-        self.log(f"参数: 流类型={stream_type}, 画质={quality}, 多画质={multi_quality}, 输出格式={output_format}, UDP代理={udp_proxy}, 输出中间表={output_csv}")
+        self.log(f"参数: 流类型={stream_type}, 画质={quality}, 多画质={multi_quality}, 备用地址={failover}, 输出格式={output_format}, UDP代理={udp_proxy}, 输出中间表={output_csv}")
+
+    def get_catchup(self):
+        """根据回看服务器设置创建回看地址生成器，均未设置时返回None"""
+        return CatchupResolver({
+            'ZTE': self.catchup_zte_var.get().strip(),
+            'HW': self.catchup_hw_var.get().strip()
+        }, self.catchup_templates) or None
+
+    def get_sharding(self):
+        """返回分片设置 (分片方式, 每个分片的频道数)，不分片时返回None"""
+        shard_by = SHARD_OPTIONS.get(self.shard_var.get(), '')
+        if not shard_by:
+            return None
+        try:
+            shard_size = max(int(self.shard_size_var.get()), 1)
+        except ValueError:
+            shard_size = 500
+        return shard_by, shard_size
+
+    def get_merge(self):
+        """根据合并M3U设置创建M3UMerge，未设置时返回None，文件不存在时提示错误并返回False"""
+        merge = merge_from_options(self.merge_options())
+        if merge and not os.path.exists(merge.source):
+            message = f"合并M3U文件不存在: {merge.source}"
+            self.log(message)
+            messagebox.showerror("错误", message)
+            return False
+        return merge
 
-        # 启动转换线程
-        thread = threading.Thread(
-            target=self.conversion_thread,
-            args=(json_file, output_file, use_zte, use_hw, quality, multi_quality, output_format, udp_proxy,output_csv)
-        )
-        thread.daemon = True
-        thread.start()
+    def merge_options(self):
+        return {
+            'merge_m3u': self.merge_m3u_var.get(),
+            'merge_policy': self.merge_policy_var.get(),
+            'merge_unmatched': self.merge_unmatched_var.get()
+        }
+
+    def get_channel_filter(self):
+        """编译频道过滤规则，未设置时返回None，规则无效时提示错误并返回False"""
+        try:
+            return compile_filter(self.channel_filter_var.get())
+        except ValueError as e:
+            self.log(str(e))
+            messagebox.showerror("错误", str(e))
+            return False
 
-    def conversion_thread(self, json_file, output_file, use_zte, use_hw, quality, multi_quality, output_format, udp_proxy,output_csv):
+    def conversion_thread(self, cancel_event, json_file, output_file, use_zte, use_hw, quality, multi_quality, output_format, udp_proxy,output_csv, catchup=None, sharding=None, channel_filter=None, merge=None, failover=False):
+        csv_output_file = None
         try:
             converter = IPTV2M3U()
+            converter.cancel_event = cancel_event
 
             # 首先检查文件是否存在且可读
             if not os.path.exists(json_file):
@@ -1054,8 +3010,8 @@ class IPTV2M3UGUI:
             except Exception as e:
                 print(f"读取文件失败: {e}")
 
-            # 加载JSON文件
-            if not converter.load_json(json_file):
+            # 加载JSON文件（内容未变化时直接读取缓存），同时按过滤规则排除频道
+            if not converter.load_json(json_file, cache=ModelCache(), channel_filter=channel_filter):
                 self.root.after(0, lambda: self.on_conversion_error("加载JSON文件失败，请检查文件格式"))
                 return
 
@@ -1064,6 +3020,15 @@ class IPTV2M3UGUI:
                 self.root.after(0, lambda: self.on_conversion_error("JSON文件中没有找到频道数据"))
                 return
 
+            # 按实测画质修正画质标签
+            if self.use_probe_results_var.get():
+                probe_results = load_probe_results()
+                if probe_results:
+                    corrected = converter.apply_measured_quality(probe_results)
+                    self.log(f"按实测画质修正了 {corrected} 个物理频道")
+                else:
+                    self.log(f"没有实测画质结果: {PROBE_RESULTS_FILE}")
+
             def progress_callback(current, total):
                 progress = (current / total) * 100
                 self.update_progress(progress, f"处理中: {current}/{total}")
@@ -1097,7 +3062,23 @@ class IPTV2M3UGUI:
                 self.log("跳过CSV中间数据文件生成")
 
             # 根据输出格式选择生成方法，并传递multi_quality参数
-            if output_format == 'M3U':
+            if sharding:
+                success = converter.generate_sharded(
+                    output_file,
+                    output_format,
+                    shard_by=sharding[0],
+                    shard_size=sharding[1],
+                    use_zte=use_zte,
+                    use_hw=use_hw,
+                    quality_preference=quality,
+                    progress_callback=progress_callback,
+                    udp_proxy=udp_proxy,
+                    multi_quality=multi_quality,
+                    catchup=catchup,
+                    merge=merge,
+                    failover=failover
+                )
+            elif output_format == 'M3U':
                 success = converter.generate_m3u(
                     output_file,
                     use_zte=use_zte,
@@ -1105,7 +3086,10 @@ class IPTV2M3UGUI:
                     quality_preference=quality,
                     progress_callback=progress_callback,
                     udp_proxy=udp_proxy,
-                    multi_quality=multi_quality
+                    multi_quality=multi_quality,
+                    catchup=catchup,
+                    merge=merge,
+                    failover=failover
                 )
             else:
                 success = converter.generate_diyp(
@@ -1115,7 +3099,10 @@ class IPTV2M3UGUI:
                     quality_preference=quality,
                     progress_callback=progress_callback,
                     udp_proxy=udp_proxy,
-                    multi_quality=multi_quality
+                    multi_quality=multi_quality,
+                    catchup=catchup,
+                    merge=merge,
+                    failover=failover
                 )
 
             if success:
@@ -1132,6 +3119,10 @@ class IPTV2M3UGUI:
             else:
                 self.root.after(0, lambda: self.on_conversion_error("转换失败，请查看控制台输出"))
 
+        except JobCancelled:
+            self.remove_partial_file(output_file)
+            self.remove_partial_file(csv_output_file)
+            self.root.after(0, self.on_job_cancelled)
         except Exception as e:
             error_msg = f"转换错误: {str(e)}"
             print(error_msg)
@@ -1139,6 +3130,174 @@ class IPTV2M3UGUI:
             traceback.print_exc()
             self.root.after(0, lambda: self.on_conversion_error(error_msg))
 
+    def ask_json_file(self):
+        """返回最近一次转换的JSON文件，没有时让用户选择"""
+        json_file = self.last_json_file
+        if not json_file or not os.path.exists(json_file):
+            json_file = filedialog.askopenfilename(
+                filetypes=[("JSON Files", "*.json"), ("CSV Files", "*.csv"), ("All Files", "*.*")]
+            )
+            if not json_file:
+                return None
+            self.last_json_file = json_file
+        return json_file
+
+    def save_preset(self):
+        """将当前选项保存为命名预设"""
+        name = simpledialog.askstring("保存预设", "预设名称:", parent=self.root)
+        if not name or not name.strip():
+            return
+        try:
+            presets = load_presets()
+            presets[name.strip()] = {
+                'output_file': self.output_var.get(),
+                'stream_type': self.stream_var.get(),
+                'quality': self.quality_var.get(),
+                'output_format': self.output_format_var.get(),
+                'udp_proxy': self.udp_proxy_var.get(),
+                'multi_quality': self.multi_quality_var.get(),
+                'failover': self.failover_var.get(),
+                'output_csv': self.output_csv_var.get(),
+                'catchup_zte_host': self.catchup_zte_var.get(),
+                'catchup_hw_host': self.catchup_hw_var.get(),
+                'shard_by': self.shard_var.get(),
+                'shard_size': self.shard_size_var.get(),
+                'channel_filter': self.channel_filter_var.get(),
+                **self.merge_options()
+            }
+            if self.catchup_templates:
+                presets[name.strip()]['catchup_templates'] = self.catchup_templates
+            save_presets(presets)
+            self.log(f"已保存预设: {name.strip()}，共 {len(presets)} 个预设")
+        except Exception as e:
+            messagebox.showerror("错误", f"保存预设失败: {str(e)}")
+
+    def start_batch(self):
+        """加载一次JSON文件，批量生成所有预设"""
+        try:
+            presets = load_presets()
+        except Exception as e:
+            messagebox.showerror("错误", f"加载预设失败: {str(e)}")
+            return
+        if not presets:
+            messagebox.showwarning("警告", "没有已保存的预设，请先点击\"保存预设\"")
+            return
+        json_file = self.ask_json_file()
+        if not json_file:
+            return
+        if not self.submit_job(('batch', json_file), self.batch_thread, json_file, presets):
+            return
+        self.set_ui_enabled(False)
+        self.log(f"开始批量生成 {len(presets)} 个预设: {json_file}")
+
+    def batch_thread(self, cancel_event, json_file, presets):
+        try:
+            report = run_batch(json_file, presets, cache=ModelCache(), cancel_event=cancel_event)
+            for line in format_batch_report(report).split('\n'):
+                self.log(line)
+            self.root.after(0, lambda: self.set_ui_enabled(True))
+            self.update_progress(0, "批量生成完成")
+        except JobCancelled:
+            self.root.after(0, self.on_job_cancelled)
+        except Exception as e:
+            error_msg = f"批量生成失败: {str(e)}"
+            self.root.after(0, lambda: self.on_conversion_error(error_msg))
+
+    def open_preview(self):
+        """打开频道预览窗口，显示按当前选项将会选择的流地址和画质"""
+        json_file = self.ask_json_file()
+        if not json_file:
+            return
+
+        channel_filter = self.get_channel_filter()
+        if channel_filter is False:
+            return
+        merge = self.get_merge()
+        if merge is False:
+            return
+
+        if self.preview_window is None or not self.preview_window.window.winfo_exists():
+            self.preview_window = ChannelPreviewWindow(self.root)
+        self.preview_window.window.lift()
+
+        source_key = self.preview_source_key(json_file)
+        if self.preview_pipeline is not None and self.preview_pipeline.source_key == source_key:
+            # 频道数据已在内存中，不需要重新加载
+            if merge:
+                merge.close()
+            self.refresh_preview(reset=True)
+            return
+        # 加载完成前不再刷新旧数据的预览
+        self.preview_pipeline = None
+        self.log(f"生成预览: {json_file}")
+        threading.Thread(target=self.preview_thread, args=(json_file, source_key, self.preview_options(merge), channel_filter),
+                         daemon=True).start()
+
+    def preview_options(self, merge):
+        stream_type = self.stream_var.get()
+        return {
+            'use_zte': stream_type in ["ZTE", "两者都尝试"],
+            'use_hw': stream_type in ["HW", "两者都尝试"],
+            'quality_preference': QUALITY_OPTIONS.get(self.quality_var.get(), "high"),
+            'udp_proxy': self.udp_proxy_var.get().strip(),
+            'multi_quality': self.multi_quality_var.get(),
+            'merge': merge,
+            'failover': self.failover_var.get()
+        }
+
+    def preview_source_key(self, json_file):
+        """预览频道数据的来源：文件内容或过滤规则变化时需要重新加载"""
+        stat = os.stat(json_file)
+        return (json_file, stat.st_mtime_ns, stat.st_size, self.channel_filter_var.get().strip())
+
+    def preview_thread(self, json_file, source_key, options, channel_filter=None):
+        try:
+            converter = IPTV2M3U()
+            if not converter.load_json(json_file, cache=ModelCache(), channel_filter=channel_filter):
+                self.root.after(0, lambda: self.on_conversion_error("加载JSON文件失败，请检查文件格式"))
+                return
+            pipeline = PreviewPipeline(converter, source_key)
+            pipeline.update(options)
+            self.root.after(0, lambda: self.on_preview_ready(pipeline))
+        except Exception as e:
+            error_msg = f"预览失败: {str(e)}"
+            self.root.after(0, lambda: self.on_conversion_error(error_msg))
+
+    def on_preview_ready(self, pipeline):
+        self.preview_pipeline = pipeline
+        if self.preview_window is not None and self.preview_window.window.winfo_exists():
+            self.log(f"预览完成，共 {len(pipeline.rows)} 个条目")
+            # 加载期间选项可能已经改变
+            self.refresh_preview(reset=True)
+
+    def _on_preview_option_changed(self, *args):
+        # 合并同一次操作中的多次变量写入
+        if self._preview_job is None and self.preview_pipeline is not None:
+            self._preview_job = self.root.after_idle(self.refresh_preview)
+
+    def refresh_preview(self, reset=False):
+        """按当前选项刷新预览窗口，只重新计算变化的选项所影响的阶段；reset为真时重新设置全部行"""
+        self._preview_job = None
+        pipeline = self.preview_pipeline
+        if pipeline is None or self.preview_window is None or not self.preview_window.window.winfo_exists():
+            return
+        merge = merge_from_options(self.merge_options())
+        if merge and not os.path.exists(merge.source):
+            # 合并M3U的路径可能还在输入中
+            return
+        try:
+            stage = pipeline.update(self.preview_options(merge))
+        except (ValueError, OSError) as e:
+            # 正在输入的UDP代理可能暂时无效，保留上一次的结果
+            self.status_var.set(f"预览未更新: {e}")
+            return
+        if reset or stage == 'select':
+            self.preview_window.set_rows(pipeline.rows, keep_position=not reset)
+        elif stage == 'proxy':
+            self.preview_window.update_urls(pipeline.rows)
+        if stage:
+            self.status_var.set(f"预览已更新，共 {len(pipeline.rows)} 个条目")
+
     def update_progress(self, value, message):
         """线程安全的进度更新"""
         def update_ui():
@@ -1189,13 +3348,22 @@ class IPTV2M3UGUI:
 
     def log(self, message):
         """线程安全的日志记录"""
-        def add_log():
-            self.log_text.insert(tk.END, f"[INFO] {message}\n")
-            self.log_text.see(tk.END)
-            # 确保日志及时显示
-            self.log_text.update_idletasks()
+        self.log_view.append(f"[INFO] {message}")
 
-        self.root.after(0, add_log)
+    def export_log(self):
+        """导出完整日志到文件"""
+        file_path = filedialog.asksaveasfilename(
+            defaultextension='.log',
+            initialfile=self.generate_timestamp_filename("iptv_log") + '.log',
+            filetypes=[("Log Files", "*.log"), ("TXT Files", "*.txt"), ("All Files", "*.*")]
+        )
+        if not file_path:
+            return
+        try:
+            self.log_view.export(file_path)
+            self.status_var.set(f"日志已导出: {file_path}")
+        except Exception as e:
+            messagebox.showerror("错误", f"导出日志失败: {str(e)}")
 
     def set_ui_enabled(self, enabled):
         state = tk.NORMAL if enabled else tk.DISABLED
@@ -1215,7 +3383,7 @@ class IPTV2M3UGUI:
             output_format = self.output_format_var.get()
             ext = '.m3u' if output_format == 'M3U' else '.txt'
             self.output_var.set(f"output{ext}")
-        self.log_text.delete(1.0, tk.END)
+        self.log_view.clear()
         self.status_var.set("就绪")
         self.progress_var.set(0)
 
@@ -1226,6 +3394,7 @@ class IPTV2M3UGUI:
                 os.remove(self.temp_json_file)
             except:
                 pass
+        self.log_view.close()
         self.root.destroy()
 
     def load_config(self):
@@ -1253,8 +3422,32 @@ class IPTV2M3UGUI:
                         self.timestamp_var.set(config['timestamp'])
                     if 'multi_quality' in config:
                         self.multi_quality_var.set(config['multi_quality'])
+                    if 'failover' in config:
+                        self.failover_var.set(config['failover'])
                     if 'output_csv' in config:
                         self.output_csv_var.set(config['output_csv'])
+                    if 'record_snapshot' in config:
+                        self.record_snapshot_var.set(config['record_snapshot'])
+                    if 'use_probe_results' in config:
+                        self.use_probe_results_var.set(config['use_probe_results'])
+                    if 'shard_by' in config:
+                        self.shard_var.set(config['shard_by'])
+                    if 'shard_size' in config:
+                        self.shard_size_var.set(str(config['shard_size']))
+                    if 'channel_filter' in config:
+                        self.channel_filter_var.set(config['channel_filter'])
+                    if 'catchup_zte_host' in config:
+                        self.catchup_zte_var.set(config['catchup_zte_host'])
+                    if 'catchup_hw_host' in config:
+                        self.catchup_hw_var.set(config['catchup_hw_host'])
+                    if 'catchup_templates' in config:
+                        self.catchup_templates = config['catchup_templates']
+                    if 'merge_m3u' in config:
+                        self.merge_m3u_var.set(config['merge_m3u'])
+                    if 'merge_policy' in config:
+                        self.merge_policy_var.set(config['merge_policy'])
+                    if 'merge_unmatched' in config:
+                        self.merge_unmatched_var.set(config['merge_unmatched'])
         except Exception as e:
             print(f"加载配置失败: {e}")
 
@@ -1271,15 +3464,86 @@ class IPTV2M3UGUI:
                 'udp_proxy': self.udp_proxy_var.get(),
                 'timestamp': self.timestamp_var.get(),
                 'multi_quality': self.multi_quality_var.get(),
-                'output_csv': self.output_csv_var.get()
+                'failover': self.failover_var.get(),
+                'output_csv': self.output_csv_var.get(),
+                'record_snapshot': self.record_snapshot_var.get(),
+                'use_probe_results': self.use_probe_results_var.get(),
+                'shard_by': self.shard_var.get(),
+                'shard_size': self.shard_size_var.get(),
+                'channel_filter': self.channel_filter_var.get(),
+                'catchup_zte_host': self.catchup_zte_var.get(),
+                'catchup_hw_host': self.catchup_hw_var.get(),
+                **self.merge_options()
             }
+            if self.catchup_templates:
+                config['catchup_templates'] = self.catchup_templates
             with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
                 json.dump(config, f, ensure_ascii=False, indent=4)
         except Exception as e:
             print(f"保存配置失败: {e}")
 
 
+def run_cli(argv):
+    """命令行入口，返回退出码"""
+    parser = argparse.ArgumentParser(description="IPTV JSON转M3U/DIYP工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch_parser = subparsers.add_parser('batch', help='加载一次输入，批量生成所有命名预设')
+    batch_parser.add_argument('json_file', help='频道JSON文件')
+    batch_parser.add_argument('--presets', default=PRESETS_FILE, help='预设文件路径')
+    batch_parser.add_argument('--only', nargs='+', metavar='NAME', help='只生成指定名称的预设')
+    batch_parser.add_argument('--workers', type=int, default=1, help='并行工作进程数')
+    batch_parser.add_argument('--no-cache', action='store_true', help='不使用频道数据缓存')
+    batch_parser.add_argument('--probe-results', metavar='FILE', help='用流分析的实测画质修正画质标签')
+    batch_parser.add_argument('--filter', metavar='RULES', help='加载时的频道过滤规则，多条规则用分号分隔')
+    batch_parser.add_argument('--filter-file', metavar='FILE', help='从文件读取频道过滤规则（每行一条）')
+
+    cache_parser = subparsers.add_parser('cache', help='查看或清空频道数据缓存')
+    cache_parser.add_argument('--clear', action='store_true', help='清空缓存目录')
+
+    args = parser.parse_args(argv)
+    if args.command == 'batch':
+        presets = load_presets(args.presets)
+        if args.only:
+            missing = [name for name in args.only if name not in presets]
+            if missing:
+                print(f"未找到预设: {', '.join(missing)}")
+                return 1
+            presets = {name: presets[name] for name in args.only}
+        if not presets:
+            print(f"没有可用的预设: {args.presets}")
+            return 1
+        cache = None if args.no_cache else ModelCache()
+        probe_results = load_probe_results(args.probe_results) if args.probe_results else None
+        rules = args.filter or ''
+        if args.filter_file:
+            with open(args.filter_file, 'r', encoding='utf-8') as f:
+                rules = f.read() + '\n' + rules
+        try:
+            channel_filter = compile_filter(rules)
+            report = run_batch(args.json_file, presets, workers=args.workers, cache=cache,
+                               probe_results=probe_results, channel_filter=channel_filter)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(format_batch_report(report))
+        return 0 if all(result['success'] for result in report['results']) else 1
+    if args.command == 'cache':
+        cache = ModelCache()
+        if args.clear:
+            cache.clear()
+            print(f"缓存已清空: {cache.cache_dir}")
+            return 0
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"缓存目录: {cache.cache_dir}")
+        print(f"共 {len(entries)} 个缓存，{total / 1024:.1f} KB / {cache.max_bytes / 1024 / 1024:.0f} MB")
+        return 0
+    return 0
+
 def main():
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     root = tk.Tk()
     app = IPTV2M3UGUI(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+from collections import namedtuple
+from urllib.parse import urlparse
+
+from iptv_json_cmcc import PRESETS_FILE, load_converter, load_settings, preset_options
+
+# 单个客户端的测试结果：ttfb为从发起连接到收到第一个负载字节的秒数，stalls为超过阈值没有数据的次数
+ClientResult = namedtuple('ClientResult', ['title', 'url', 'status', 'ttfb', 'bytes', 'seconds', 'stalls',
+                                           'stalled_seconds', 'error'])
+
+READ_SIZE = 65536
+
+
+def load_options(preset_name=None, presets_file=PRESETS_FILE, udp_proxy=None):
+    """读取生成参数：指定预设时使用预设，否则使用iptv_config.json中的当前设置；udp_proxy可覆盖配置"""
+    # 只测试经过代理的组播主地址，不包含合并的第三方条目和备用地址
+    options = preset_options(load_settings(preset_name, presets_file), exclude=('catchup', 'merge', 'failover'))
+    if udp_proxy is not None:
+        options['udp_proxy'] = udp_proxy
+    if not options['udp_proxy']:
+        raise ValueError("没有配置udp_proxy，请在配置中设置或使用 --udp-proxy 指定")
+    return options
+
+
+def build_targets(json_file, options):
+    """生成与generate_m3u相同的代理地址，返回 [(频道名称, 代理地址), ...]"""
+    converter = load_converter(json_file)
+    return [(entry.channel.get('title', 'Unknown'), entry.stream_url) for entry in converter.iter_entries(**options)]
+
+
+async def run_client(title, url, duration, stall_threshold=1.0, start_delay=0.0, connect_timeout=5.0):
+    """作为一个播放客户端拉流 duration 秒，记录首字节时间、吞吐量和卡顿"""
+    await asyncio.sleep(start_delay)
+    loop = asyncio.get_running_loop()
+    parsed = urlparse(url)
+    start = loop.time()
+    writer = None
+    status = None
+    ttfb = None
+    received = 0
+    stalls = 0
+    stalled_seconds = 0.0
+    error = None
+    first_byte_at = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parsed.hostname, parsed.port or 80), connect_timeout)
+        writer.write(f"GET {parsed.path or '/'} HTTP/1.0\r\nHost: {parsed.netloc}\r\n"
+                     f"User-Agent: iptv_loadtest\r\n\r\n".encode('ascii'))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), connect_timeout)
+        parts = status_line.split()
+        status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+        while True:
+            line = await asyncio.wait_for(reader.readline(), connect_timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        if status != 200:
+            raise ConnectionError(f"代理返回: {status_line.decode('latin-1').strip()}")
+
+        deadline = start + duration
+        stall_start = None
+        last_data = loop.time()
+        while True:
+            now = loop.time()
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+            try:
+                data = await asyncio.wait_for(reader.read(READ_SIZE), min(remaining, stall_threshold))
+            except asyncio.TimeoutError:
+                # 超过阈值没有收到数据，记为一次卡顿（持续卡顿只计一次）
+                if stall_start is None and loop.time() < deadline:
+                    stalls += 1
+                    stall_start = last_data
+                continue
+            if not data:
+                error = '连接被代理关闭'
+                break
+            now = loop.time()
+            if first_byte_at is None:
+                first_byte_at = now
+                ttfb = now - start
+            if stall_start is not None:
+                stalled_seconds += now - stall_start
+                stall_start = None
+            last_data = now
+            received += len(data)
+        if stall_start is not None:
+            stalled_seconds += loop.time() - stall_start
+        if first_byte_at is None and error is None:
+            error = '未收到数据'
+    except (OSError, asyncio.TimeoutError) as e:
+        error = str(e) or type(e).__name__
+    finally:
+        if writer is not None:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+    seconds = loop.time() - first_byte_at if first_byte_at is not None else 0.0
+    return ClientResult(title, url, status, ttfb, received, seconds, stalls, stalled_seconds, error)
+
+
+async def run_load_test(targets, clients, duration, ramp_up=0.0, stall_threshold=1.0):
+    """打开clients个并发客户端，依次轮流分配到各个频道；ramp_up秒内逐步启动所有客户端"""
+    tasks = []
+    for index in range(clients):
+        title, url = targets[index % len(targets)]
+        delay = ramp_up * index / clients if clients else 0.0
+        tasks.append(run_client(title, url, duration, stall_threshold, delay))
+    return await asyncio.gather(*tasks)
+
+
+def percentile(values, fraction):
+    """最近秩法计算百分位数，values需已排序"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(results):
+    """汇总测试结果，返回包含总体指标和各频道指标的报告"""
+    channels = {}
+    for result in results:
+        item = channels.setdefault(result.url, {
+            'title': result.title, 'url': result.url, 'clients': 0, 'failed': 0,
+            'bytes': 0, 'seconds': 0.0, 'stalls': 0, 'ttfb': []
+        })
+        item['clients'] += 1
+        if result.error:
+            item['failed'] += 1
+        item['bytes'] += result.bytes
+        item['seconds'] += result.seconds
+        item['stalls'] += result.stalls
+        if result.ttfb is not None:
+            item['ttfb'].append(result.ttfb)
+
+    channel_rows = []
+    for item in channels.values():
+        ttfb = sorted(item.pop('ttfb'))
+        seconds = item.pop('seconds')
+        item['kbps_per_client'] = round(item['bytes'] * 8 / seconds / 1000) if seconds else 0
+        item['ttfb_ms'] = round(ttfb[len(ttfb) // 2] * 1000) if ttfb else None
+        channel_rows.append(item)
+    channel_rows.sort(key=lambda item: (-item['failed'], -item['stalls'], item['kbps_per_client']))
+
+    ttfb = sorted(result.ttfb for result in results if result.ttfb is not None)
+    errors = {}
+    for result in results:
+        if result.error:
+            errors[result.error] = errors.get(result.error, 0) + 1
+    longest = max((result.seconds for result in results), default=0)
+    total_bytes = sum(result.bytes for result in results)
+    return {
+        'clients': len(results),
+        'succeeded': sum(1 for result in results if not result.error),
+        'total_mbps': round(total_bytes * 8 / longest / 1000000, 2) if longest else 0,
+        'ttfb_ms': {name: round(value * 1000) if value is not None else None
+                    for name, value in (('p50', percentile(ttfb, 0.5)), ('p90', percentile(ttfb, 0.9)),
+                                        ('p99', percentile(ttfb, 0.99)), ('max', ttfb[-1] if ttfb else None))},
+        'stalls': sum(result.stalls for result in results),
+        'stalled_clients': sum(1 for result in results if result.stalls),
+        'errors': errors,
+        'channels': channel_rows
+    }
+
+
+def format_report(report, limit=20):
+    """生成可读的测试报告"""
+    ttfb = report['ttfb_ms']
+    lines = [
+        f"客户端: {report['clients']}，成功: {report['succeeded']}，总吞吐量: {report['total_mbps']} Mbps",
+        f"首字节时间(ms): p50={ttfb['p50']} p90={ttfb['p90']} p99={ttfb['p99']} max={ttfb['max']}",
+        f"卡顿: {report['stalls']} 次，涉及 {report['stalled_clients']} 个客户端"
+    ]
+    for error, count in report['errors'].items():
+        lines.append(f"  错误 x{count}: {error}")
+    lines.append("各频道（失败和卡顿较多的在前）:")
+    for item in report['channels'][:limit]:
+        lines.append(f"  {item['title']}: {item['clients']} 个客户端，失败 {item['failed']}，"
+                     f"{item['kbps_per_client']} kbps/客户端，首字节 {item['ttfb_ms']} ms，卡顿 {item['stalls']} 次")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="udpxy代理并发拉流压力测试")
+    parser.add_argument('json_file', help='频道JSON文件')
+    parser.add_argument('--clients', type=int, default=10, help='并发客户端数量')
+    parser.add_argument('--duration', type=float, default=10.0, help='每个客户端拉流秒数')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='在多少秒内逐步启动所有客户端')
+    parser.add_argument('--stall-threshold', type=float, default=1.0, help='超过多少秒没有数据记为卡顿')
+    parser.add_argument('--udp-proxy', help='代理地址（默认使用配置或预设中的udp_proxy）')
+    parser.add_argument('--preset', help='使用指定预设的流类型、画质和代理设置')
+    parser.add_argument('--presets', default=PRESETS_FILE, help='预设文件路径')
+    parser.add_argument('--channels', type=int, help='只测试前N个频道')
+    parser.add_argument('--json', metavar='FILE', help='输出JSON格式的测试报告')
+    args = parser.parse_args(argv)
+
+    try:
+        options = load_options(args.preset, args.presets, args.udp_proxy)
+        targets = build_targets(args.json_file, options)
+    except ValueError as e:
+        print(e)
+        return 1
+    if args.channels:
+        targets = targets[:args.channels]
+    if not targets:
+        print("没有可测试的频道")
+        return 1
+
+    print(f"代理: {options['udp_proxy']}，{len(targets)} 个频道，{args.clients} 个并发客户端，每个 {args.duration} 秒")
+    results = asyncio.run(run_load_test(targets, args.clients, args.duration, args.ramp_up, args.stall_threshold))
+    report = summarize(results)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report['succeeded'] == report['clients'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
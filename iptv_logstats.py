@@ -0,0 +1,260 @@
+import argparse
+import csv
+import json
+import mmap
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from iptv_json_cmcc import PRESETS_FILE, load_converter, load_settings, preset_options
+
+# 日志格式：nginx combined格式可统计字节数（只统计2xx/3xx响应），generic格式只要求行首为客户端IP、行内包含 rtp/ip:port 路径
+# 每种格式给出单行正则；扫描时在前面加上换行符，使正则以字面量开头，匹配引擎可以快速跳到下一行
+LOG_FORMATS = {
+    'combined': rb'([^ \n]+) [^ \n]+ [^ \n]+ \[[^\]\n]*\] "[A-Z]+ /(?:rtp|udp)/@?(\d{1,3}(?:\.\d{1,3}){3}:\d+)[^"\n]*" [23]\d\d (\d+|-)',
+    'generic': rb'([^ \n]+)[^\n]*?/(?:rtp|udp)/@?(\d{1,3}(?:\.\d{1,3}){3}:\d+)()'
+}
+
+# 每个工作进程处理的日志块大小
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _split_chunks(path, chunk_size):
+    """按换行符把文件切分为若干 (开始, 结束) 区间"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    chunks = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                newline = mm.find(b'\n', end)
+                end = size if newline == -1 else newline + 1
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def scan_chunk(path, start, end, log_format='combined'):
+    """扫描日志文件的一个区间，返回 {组播地址: [会话数, 字节数, 客户端IP集合]}
+
+    正则直接在mmap上匹配，只有命中的行才会生成Python对象。
+    """
+    line_pattern = re.compile(LOG_FORMATS[log_format])
+    pattern = re.compile(b'\n' + LOG_FORMATS[log_format])
+    stats = {}
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        matches = pattern.findall(mm, start - 1 if start else 0, end)
+        if start == 0:
+            first = line_pattern.match(mm, 0, end)
+            if first:
+                matches.append(first.groups())
+        for client, address, size in matches:
+            item = stats.get(address)
+            if item is None:
+                item = stats[address] = [0, 0, set()]
+            item[0] += 1
+            if size and size != b'-':
+                item[1] += int(size)
+            item[2].add(client)
+    return stats
+
+
+def _merge(total, stats):
+    for address, (sessions, size, clients) in stats.items():
+        item = total.get(address)
+        if item is None:
+            total[address] = [sessions, size, clients]
+        else:
+            item[0] += sessions
+            item[1] += size
+            item[2] |= clients
+
+
+def scan_logs(paths, log_format='combined', workers=1, chunk_size=CHUNK_SIZE):
+    """扫描多个日志文件，大文件按块分配给多个进程并行处理，返回 ({组播地址: [会话数, 字节数, 客户端IP集合]}, 字节数)"""
+    tasks = []
+    total_bytes = 0
+    for path in paths:
+        total_bytes += os.path.getsize(path)
+        tasks.extend((path, start, end) for start, end in _split_chunks(path, chunk_size))
+
+    total = {}
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(scan_chunk, path, start, end, log_format) for path, start, end in tasks]
+            for future in futures:
+                _merge(total, future.result())
+    else:
+        for path, start, end in tasks:
+            _merge(total, scan_chunk(path, start, end, log_format))
+    return total, total_bytes
+
+
+def load_options(preset_name=None, presets_file=PRESETS_FILE):
+    """读取生成参数：指定预设时使用预设，否则使用iptv_config.json中的当前设置"""
+    # 只需要选择出的组播地址本身，不经过代理，也不包含回看和合并的第三方条目
+    options = preset_options(load_settings(preset_name, presets_file), exclude=('catchup', 'merge'))
+    options['udp_proxy'] = ''
+    return options
+
+
+def _address(url):
+    if '://' not in url:
+        return None
+    return url.split('://', 1)[1].lstrip('@').encode('ascii', 'ignore')
+
+
+def build_address_index(json_file, options=None):
+    """建立组播地址（ip:port，bytes）到频道的反向索引，返回 (索引, 频道列表)
+
+    索引为 {地址: [(频道代码, 频道名称, 画质名称), ...]}。同一地址可能被多个频道引用（如"综合"和"高清"频道
+    共用同一组播），options为生成参数时，按该设置实际输出的播放列表归属地址：被选中输出的地址只属于输出它的频道，
+    没有被选中的地址仍属于所有引用它的频道。列表中有多个频道的地址无法确定归属，统计时单独列出。
+    """
+    converter = load_converter(json_file)
+    index = {}
+    channels = []
+    for channel in converter.channels:
+        code = channel.get('code', '')
+        title = channel.get('title', '')
+        channels.append((code, title))
+        for phychannel in channel['phychannels']:
+            params = phychannel.get('params') or {}
+            for field in ('zteurl', 'hwurl'):
+                address = _address((params.get(field) or '').strip())
+                if address is None:
+                    continue
+                targets = index.setdefault(address, [])
+                target = (code, title, converter.quality_label(phychannel))
+                if target not in targets:
+                    targets.append(target)
+
+    if options is not None:
+        selected = {}
+        for entry in converter.iter_entries(**options):
+            code = entry.channel.get('code', '')
+            title = entry.channel.get('title', '')
+            for url, quality in ((entry.stream_url, entry.quality),) + tuple(entry.alternates):
+                address = _address(url)
+                if address is None:
+                    continue
+                targets = selected.setdefault(address, [])
+                if all(target[0] != code for target in targets):
+                    targets.append((code, title, quality))
+        index.update(selected)
+    return index, channels
+
+
+def aggregate_channels(stats, index, channels):
+    """把按地址统计的结果映射回频道，返回 (频道统计列表, 未匹配地址列表, 共用地址列表)
+
+    频道统计按会话数从多到少排序，没有观看记录的频道也会列出（会话数为0），便于排序和精简频道。
+    属于多个频道的地址不计入这些频道的会话数、流量和观众数，避免同一会话被重复统计，而是连同这些频道一起
+    列在共用地址列表中；各频道的shared_sessions为其共用地址上的会话数，仅供参考。
+    """
+    per_channel = {code: {'code': code, 'title': title, 'sessions': 0, 'bytes': 0, 'clients': set(), 'streams': [],
+                          'shared_sessions': 0}
+                   for code, title in channels}
+    unmatched = []
+    shared = []
+    for address, (sessions, size, clients) in stats.items():
+        targets = index.get(address)
+        if not targets:
+            unmatched.append({'address': address.decode('ascii'), 'sessions': sessions, 'bytes': size,
+                              'viewers': len(clients)})
+            continue
+        codes = {code for code, _, _ in targets}
+        if len(codes) > 1:
+            for code in codes:
+                per_channel[code]['shared_sessions'] += sessions
+            shared.append({'address': address.decode('ascii'), 'sessions': sessions, 'bytes': size,
+                           'viewers': len(clients),
+                           'channels': [{'code': code, 'title': title, 'quality': quality}
+                                        for code, title, quality in targets]})
+            continue
+        for code, title, quality in targets:
+            item = per_channel[code]
+            item['sessions'] += sessions
+            item['bytes'] += size
+            item['clients'] |= clients
+            item['streams'].append({'address': address.decode('ascii'), 'quality': quality,
+                                    'sessions': sessions, 'bytes': size, 'viewers': len(clients)})
+
+    result = []
+    for item in per_channel.values():
+        item['viewers'] = len(item.pop('clients'))
+        result.append(item)
+    result.sort(key=lambda item: (-item['sessions'], -item['bytes']))
+    unmatched.sort(key=lambda item: -item['sessions'])
+    shared.sort(key=lambda item: -item['sessions'])
+    return result, unmatched, shared
+
+
+def write_csv(channel_stats, output_file):
+    """输出CSV：每个频道一行"""
+    with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['code', 'title', 'sessions', 'bytes', 'viewers', 'shared_sessions'])
+        for item in channel_stats:
+            writer.writerow([item['code'], item['title'], item['sessions'], item['bytes'], item['viewers'],
+                             item['shared_sessions']])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="统计udpxy/nginx访问日志中各频道的观看情况")
+    parser.add_argument('json_file', help='频道JSON文件，用于把组播地址映射回频道')
+    parser.add_argument('logs', nargs='+', help='访问日志文件')
+    parser.add_argument('--format', choices=list(LOG_FORMATS), default='combined', help='日志格式')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行工作进程数')
+    parser.add_argument('--csv', metavar='FILE', help='输出CSV格式的频道统计')
+    parser.add_argument('--json', metavar='FILE', help='输出JSON格式的统计报告（- 表示标准输出）')
+    parser.add_argument('--top', type=int, default=20, help='显示观看最多的前N个频道')
+    parser.add_argument('--preset', help='按指定预设的选择归属共用的组播地址（默认使用iptv_config.json中的当前设置）')
+    parser.add_argument('--presets', default=PRESETS_FILE, help='预设文件')
+    parser.add_argument('--all-addresses', action='store_true',
+                        help='不按选择归属地址，被多个频道引用的地址全部作为共用地址列出')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        options = None if args.all_addresses else load_options(args.preset, args.presets)
+    except ValueError as e:
+        print(e)
+        return 1
+    index, channels = build_address_index(args.json_file, options)
+    stats, total_bytes = scan_logs(args.logs, args.format, args.workers)
+    channel_stats, unmatched, shared = aggregate_channels(stats, index, channels)
+    seconds = time.perf_counter() - start
+
+    if args.csv:
+        write_csv(channel_stats, args.csv)
+    if args.json:
+        report = {'logs': args.logs, 'channels': channel_stats, 'shared': shared, 'unmatched': unmatched}
+        if args.json == '-':
+            json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+            sys.stdout.write('\n')
+            return 0
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    sessions = sum(item[0] for item in stats.values())
+    print(f"扫描 {total_bytes / 1024 / 1024:.1f} MB 日志，{sessions} 个会话，耗时 {seconds:.2f}s")
+    for item in channel_stats[:args.top]:
+        print(f"  {item['title']}: {item['sessions']} 个会话，{item['viewers']} 个观众，{item['bytes'] / 1024 / 1024:.1f} MB")
+    unwatched = sum(1 for item in channel_stats if not item['sessions'])
+    print(f"没有观看记录的频道 {unwatched} 个，未匹配到频道的地址 {len(unmatched)} 个")
+    if shared:
+        print(f"无法确定归属的共用地址 {len(shared)} 个，共 {sum(item['sessions'] for item in shared)} 个会话，未计入频道统计：")
+        for item in shared[:args.top]:
+            titles = '、'.join(channel['title'] for channel in item['channels'])
+            print(f"  {item['address']} ({titles}): {item['sessions']} 个会话，{item['viewers']} 个观众")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from iptv_json_cmcc import IPTV2M3U
+
+# 峰值内存预算文件：{阶段: {"fixed": 固定字节数, "per_channel": 每频道字节数}}
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'iptv_memory_budget.json')
+
+# 默认测试的频道数量，从小到大依次运行
+DEFAULT_SIZES = (1000, 5000, 20000)
+
+# 更新预算时在实测值基础上留出的余量，固定部分另加的字节数用于吸收不同Python版本的对象大小差异
+BUDGET_HEADROOM = 1.25
+BUDGET_SLACK = 64 * 1024
+
+TITLE_PREFIXES = ('CCTV-', '广东', '湖南卫视', '体育', '少儿', '电影')
+QUALITIES = (('4', '高清'), ('2', '标清'), ('10', '4K'))
+
+
+def synthetic_lineup(count, phychannels=2):
+    """生成与getAllChannel2.json结构相同的频道数据，字段长度与真实数据相近"""
+    channels = []
+    for index in range(count):
+        code = f"{index:032d}"
+        title = f"{TITLE_PREFIXES[index % len(TITLE_PREFIXES)]}{index}"
+        params = {
+            'ztecode': f"ch{index:015d}",
+            'hwurl': f"rtp://239.10.{index // 250 % 256}.{index % 250}:1025",
+            'zteurl': f"rtp://239.20.{index // 250 % 256}.{index % 250}:{2000 + index % 1000}",
+            'hwmediaid': f"1000010000000006{index:016d}",
+            'hwcode': f"1000010000000005{index:016d}",
+            'recommendPos': 'BizPosition_16227',
+            'playBackRecommendPos': 'BizPosition_69716'
+        }
+        channels.append({
+            'code': code,
+            'title': title,
+            'subTitle': title,
+            'channelnum': str(index + 1),
+            'icon': f"http://183.235.11.40:8081/pics/micro-picture/channelNew/{code}.png",
+            'icon2': '',
+            'showFlag': 'ChannelMark_4',
+            'timeshiftAvailable': 'true',
+            'lookbackAvailable': 'true' if index % 3 else 'false',
+            'isCharge': '0',
+            'params': params,
+            'phychannels': [{
+                'code': f"PhysicalChannel_{index}_{number}",
+                'channelCode': code,
+                'bitrateType': bitrate_type,
+                'bitrateTypeName': bitrate_name,
+                'params': {
+                    'ztecode': params['ztecode'],
+                    'hwurl': f"rtp://239.11.{index // 250 % 256}.{index % 250}:{1025 + number}",
+                    'zteurl': f"rtp://239.21.{index // 250 % 256}.{index % 250}:{2000 + number}",
+                    'hwmediaid': params['hwmediaid'],
+                    'hwcode': params['hwcode']
+                }
+            } for number, (bitrate_type, bitrate_name) in enumerate(QUALITIES[:phychannels])]
+        })
+    return {'channels': channels}
+
+
+def _stages(output_dir):
+    """各生成阶段：(名称, 以已加载的转换器为参数的函数)"""
+    return [
+        ('generate_m3u', lambda converter: converter.generate_m3u(os.path.join(output_dir, 'out.m3u'))),
+        ('generate_diyp', lambda converter: converter.generate_diyp(os.path.join(output_dir, 'out.txt'))),
+        ('generate_csv', lambda converter: converter.generate_csv(os.path.join(output_dir, 'out.csv'))),
+        ('generate_sharded', lambda converter: converter.generate_sharded(os.path.join(output_dir, 'shard.m3u'))),
+    ]
+
+
+def _measure(func, top, frames=1):
+    """在tracemalloc下运行func，返回 (返回值, 峰值, 保留, 分配位置列表)
+
+    每个阶段单独开始跟踪，只记录该阶段新分配的内存，之前已加载的频道数据不计入；
+    分配位置按阶段结束后仍保留的内存从多到少排列。
+    """
+    gc.collect()
+    tracemalloc.start(frames)
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    sites = [{
+        'site': f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+        'bytes': stat.size,
+        'count': stat.count
+    } for stat in snapshot.filter_traces([tracemalloc.Filter(False, __file__)]).statistics('lineno')[:top]]
+    return result, peak, retained, sites
+
+
+def run_size(count, output_dir, top=5, frames=1):
+    """对一个规模的合成频道数据运行加载和各生成阶段，返回各阶段的测量结果"""
+    json_file = os.path.join(output_dir, f"lineup_{count}.json")
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(synthetic_lineup(count), f, ensure_ascii=False)
+
+    results = []
+    converter = IPTV2M3U()
+    converter.quiet = True
+    loaded, peak, retained, sites = _measure(lambda: converter.load_json(json_file), top, frames)
+    if not loaded:
+        raise RuntimeError(f"加载合成数据失败: {json_file}")
+    results.append({'stage': 'load_json', 'channels': count, 'peak': peak, 'retained': retained,
+                    'peak_per_channel': round(peak / count), 'sites': sites})
+    for name, stage in _stages(output_dir):
+        success, peak, retained, sites = _measure(lambda: stage(converter), top, frames)
+        if not success:
+            raise RuntimeError(f"{name} 失败")
+        results.append({'stage': name, 'channels': count, 'peak': peak, 'retained': retained,
+                        'peak_per_channel': round(peak / count), 'sites': sites})
+    return results
+
+
+def run_harness(sizes=DEFAULT_SIZES, top=5, frames=1):
+    """依次运行各规模，返回所有测量结果"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='iptv_memcheck_') as output_dir:
+        for count in sizes:
+            results.extend(run_size(count, output_dir, top, frames))
+    return results
+
+
+def load_budget(budget_file=BUDGET_FILE):
+    if not os.path.exists(budget_file):
+        return {}
+    with open(budget_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def budget_limit(budget, stage, channels):
+    """阶段在指定频道数下允许的峰值字节数，没有预算时返回None
+
+    预算由固定部分（缓冲区等与频道数无关的开销）和每频道部分组成，
+    流式写入的生成器每频道部分接近0，按频道数增长的内存会很快超出预算。
+    """
+    item = budget.get(stage)
+    if item is None:
+        return None
+    return item['fixed'] + item['per_channel'] * channels
+
+
+def check_budget(results, budget):
+    """返回超出预算的结果列表 [(结果, 允许的峰值), ...]；没有预算的阶段不检查"""
+    violations = []
+    for result in results:
+        limit = budget_limit(budget, result['stage'], result['channels'])
+        if limit is not None and result['peak'] > limit:
+            violations.append((result, limit))
+    return violations
+
+
+def updated_budget(results, headroom=BUDGET_HEADROOM):
+    """按实测结果拟合各阶段的固定部分和每频道部分，并乘以余量生成新预算
+
+    每频道部分为峰值对频道数的最小二乘斜率；固定部分为各规模下扣除每频道部分后剩余的最大值。
+    """
+    points = {}
+    for result in results:
+        points.setdefault(result['stage'], []).append((result['channels'], result['peak']))
+    budget = {}
+    for stage, values in points.items():
+        mean_count = sum(count for count, _ in values) / len(values)
+        mean_peak = sum(peak for _, peak in values) / len(values)
+        variance = sum((count - mean_count) ** 2 for count, _ in values)
+        if variance:
+            slope = sum((count - mean_count) * (peak - mean_peak) for count, peak in values) / variance
+        else:
+            slope = mean_peak / mean_count
+        slope = max(slope, 0.0)
+        fixed = max(max(peak - slope * count for count, peak in values), 0.0)
+        budget[stage] = {'fixed': round(fixed * headroom) + BUDGET_SLACK, 'per_channel': round(slope * headroom, 1)}
+    return budget
+
+
+def format_report(results, budget):
+    lines = [f"{'阶段':<18}{'频道数':>8}{'峰值MB':>10}{'保留MB':>10}{'峰值/频道':>10}{'预算MB':>10}"]
+    for result in results:
+        limit = budget_limit(budget, result['stage'], result['channels'])
+        limit_text = f"{limit / 1048576:.2f}" if limit is not None else '-'
+        mark = ' 超出预算' if limit is not None and result['peak'] > limit else ''
+        lines.append(f"{result['stage']:<20}{result['channels']:>8}{result['peak'] / 1048576:>12.2f}"
+                     f"{result['retained'] / 1048576:>10.2f}{result['peak_per_channel']:>12}{limit_text:>12}{mark}")
+        for site in result['sites']:
+            lines.append(f"    {site['site']}: {site['bytes'] / 1024:.1f} KB ({site['count']} 个对象)")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="内存回归测试：在tracemalloc下按不同规模运行加载和各生成器，检查峰值内存预算")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='测试的频道数量')
+    parser.add_argument('--budget', default=BUDGET_FILE, help='预算文件')
+    parser.add_argument('--update-budget', action='store_true', help='按本次结果（加余量）更新预算文件')
+    parser.add_argument('--top', type=int, default=5, help='每个阶段显示的分配位置数')
+    parser.add_argument('--frames', type=int, default=1, help='tracemalloc记录的调用栈深度')
+    parser.add_argument('--json', metavar='FILE', help='输出JSON格式的测量结果')
+    args = parser.parse_args(argv)
+
+    results = run_harness(args.sizes, args.top, args.frames)
+    if args.update_budget:
+        budget = updated_budget(results)
+        with open(args.budget, 'w', encoding='utf-8') as f:
+            json.dump(budget, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"预算已更新: {args.budget}")
+    else:
+        budget = load_budget(args.budget)
+    print(format_report(results, budget))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'budget': budget, 'results': results}, f, ensure_ascii=False, indent=2)
+
+    violations = check_budget(results, budget)
+    for result, limit in violations:
+        print(f"超出预算: {result['stage']} ({result['channels']} 个频道) 峰值 {result['peak'] / 1048576:.2f} MB > "
+              f"{limit / 1048576:.2f} MB，每频道 {result['peak_per_channel']} 字节")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import time
+from urllib.parse import urlparse
+
+from iptv_json_cmcc import PROBE_RESULTS_FILE, apply_udp_proxy, load_converter, load_probe_results
+from iptv_stream import TSAnalyzer, open_multicast_socket, parse_stream_address, rtp_payload_range
+
+# 单个数据报/读取块的最大长度
+RECV_SIZE = 65536
+
+
+def measured_tier(result):
+    """根据实测分辨率（没有时按码率）估计画质代码：2 标清、4 高清、10 4K"""
+    height = result.get('height')
+    if height:
+        if height >= 2160:
+            return '10'
+        return '4' if height >= 1080 else '2'
+    bitrate = result.get('bitrate_kbps')
+    if bitrate:
+        if bitrate >= 20000:
+            return '10'
+        return '4' if bitrate >= 6000 else '2'
+    return None
+
+
+def _finish(analyzer, elapsed, received):
+    result = analyzer.summary()
+    # 优先使用PCR计算的码率，没有PCR时按接收的数据量和时间计算
+    result['bitrate_kbps'] = result['pcr_bitrate_kbps']
+    if result['bitrate_kbps'] is None and received and elapsed > 0:
+        result['bitrate_kbps'] = round(received * 8 / elapsed / 1000)
+    result['seconds'] = round(elapsed, 3)
+    result['tier'] = measured_tier(result)
+    return result
+
+
+def analyze_file(path, chunk_size=188 * 7 * 512):
+    """分析录制的TS文件（裸TS或带RTP头的抓包数据均可），码率按PCR计算"""
+    analyzer = TSAnalyzer()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            analyzer.feed(view[:count])
+    result = analyzer.summary()
+    result['bitrate_kbps'] = result['pcr_bitrate_kbps']
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    result['tier'] = measured_tier(result)
+    return result
+
+
+async def _capture_udp(url, duration, iface):
+    """加入组播组并抓取 duration 秒，数据报接收到固定缓冲区中，RTP头在memoryview上跳过"""
+    loop = asyncio.get_running_loop()
+    _, group, port = parse_stream_address(url)
+    sock = open_multicast_socket(group, port, iface)
+    sock.setblocking(False)
+    analyzer = TSAnalyzer()
+    buffer = bytearray(RECV_SIZE)
+    view = memoryview(buffer)
+    received = 0
+    first = None
+    deadline = loop.time() + duration
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                count = await asyncio.wait_for(loop.sock_recv_into(sock, buffer), remaining)
+            except asyncio.TimeoutError:
+                break
+            if first is None:
+                first = loop.time()
+            payload = rtp_payload_range(view[:count])
+            if payload is None:
+                continue
+            received += payload[1] - payload[0]
+            analyzer.feed(view[payload[0]:payload[1]])
+    finally:
+        sock.close()
+    elapsed = loop.time() - first if first is not None else 0
+    return _finish(analyzer, elapsed, received)
+
+
+async def _capture_http(url, duration):
+    """通过udpxy等HTTP代理抓取 duration 秒，响应体直接接收到固定缓冲区中"""
+    loop = asyncio.get_running_loop()
+    parsed = urlparse(url)
+    host = parsed.hostname
+    port = parsed.port or 80
+    path = parsed.path or '/'
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    analyzer = TSAnalyzer()
+    buffer = bytearray(RECV_SIZE)
+    view = memoryview(buffer)
+    received = 0
+    first = None
+    deadline = loop.time() + duration
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, (host, port)), duration)
+        request = f"GET {path} HTTP/1.0\r\nHost: {parsed.netloc}\r\nUser-Agent: iptv_probe\r\n\r\n"
+        await loop.sock_sendall(sock, request.encode('ascii'))
+
+        # 读取响应头，头部之后的数据作为第一块负载
+        header = bytearray()
+        while b'\r\n\r\n' not in header:
+            count = await asyncio.wait_for(loop.sock_recv_into(sock, buffer), max(deadline - loop.time(), 0.1))
+            if not count:
+                raise ConnectionError("代理在返回响应头前关闭了连接")
+            header += view[:count]
+            if len(header) > 16384:
+                raise ConnectionError("响应头过长")
+        head, _, body = bytes(header).partition(b'\r\n\r\n')
+        status = head.split(b'\r\n', 1)[0].decode('latin-1')
+        if ' 200' not in status:
+            raise ConnectionError(f"代理返回: {status}")
+        if body:
+            first = loop.time()
+            received += len(body)
+            analyzer.feed(body)
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                count = await asyncio.wait_for(loop.sock_recv_into(sock, buffer), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not count:
+                break
+            if first is None:
+                first = loop.time()
+            received += count
+            analyzer.feed(view[:count])
+    finally:
+        sock.close()
+    elapsed = loop.time() - first if first is not None else 0
+    return _finish(analyzer, elapsed, received)
+
+
+async def probe_stream(url, duration=3.0, iface='0.0.0.0', udp_proxy=''):
+    """抓取并分析一个流，配置udp_proxy时通过代理抓取，失败时结果中包含error"""
+    capture_url = apply_udp_proxy(url, udp_proxy)
+    try:
+        if capture_url.startswith(('http://', 'https://')):
+            result = await _capture_http(capture_url, duration)
+        else:
+            result = await _capture_udp(capture_url, duration, iface)
+    except (OSError, ValueError, asyncio.TimeoutError) as e:
+        return {'url': url, 'error': str(e) or type(e).__name__, 'tier': None}
+    if not result['packets']:
+        result['error'] = '未收到数据'
+    result['url'] = url
+    return result
+
+
+async def probe_streams(urls, duration=3.0, iface='0.0.0.0', udp_proxy='', concurrency=16, on_result=None):
+    """并发分析多个流，同时进行的抓取数不超过concurrency，返回 {url: 结果}"""
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def worker(url):
+        async with semaphore:
+            result = await probe_stream(url, duration, iface, udp_proxy)
+        results[url] = result
+        if on_result:
+            on_result(result)
+
+    await asyncio.gather(*(worker(url) for url in urls))
+    return results
+
+
+def collect_stream_urls(json_file, use_zte=True, use_hw=False):
+    """从频道JSON中收集所有物理频道的组播地址（去重并保持顺序）"""
+    converter = load_converter(json_file)
+    urls = {}
+    for channel in converter.channels:
+        for phychannel in channel['phychannels']:
+            params = phychannel.get('params') or {}
+            for field, enabled in (('zteurl', use_zte), ('hwurl', use_hw)):
+                url = (params.get(field) or '').strip()
+                if enabled and url.startswith(('rtp://', 'udp://')):
+                    urls[url] = None
+    return list(urls)
+
+
+def format_result(result):
+    """生成单个分析结果的可读摘要"""
+    if result.get('error'):
+        return f"{result['url']}: 失败 ({result['error']})"
+    resolution = f"{result['width']}x{result['height']}" if result.get('height') else '未知分辨率'
+    pids = ','.join(result['pids'])
+    return (f"{result['url']}: {result.get('video_codec') or '未知编码'} {resolution} "
+            f"{result['bitrate_kbps'] or 0} kbps, 画质代码 {result['tier'] or '-'}, "
+            f"CC错误 {result['cc_errors']}, PID [{pids}]")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="IPTV组播流分析：实测码率、PID、编码和连续计数器错误")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    file_parser = subparsers.add_parser('file', help='分析录制的TS文件')
+    file_parser.add_argument('files', nargs='+')
+
+    url_parser = subparsers.add_parser('url', help='分析一个或多个流地址')
+    url_parser.add_argument('urls', nargs='+', help='如 rtp://239.20.0.104:2006')
+
+    scan_parser = subparsers.add_parser('scan', help='分析频道JSON中的所有流，并保存实测画质')
+    scan_parser.add_argument('json_file')
+    scan_parser.add_argument('--stream-type', choices=['ZTE', 'HW', 'both'], default='ZTE', help='分析的流类型')
+    scan_parser.add_argument('--out', default=PROBE_RESULTS_FILE, help='实测结果文件（已有结果会被合并）')
+    scan_parser.add_argument('--concurrency', type=int, default=16, help='同时抓取的流数量')
+
+    for sub in (url_parser, scan_parser):
+        sub.add_argument('--duration', type=float, default=3.0, help='每个流的抓取秒数')
+        sub.add_argument('--iface', default='0.0.0.0', help='接收组播的本机接口地址')
+        sub.add_argument('--udp-proxy', default='', help='通过udpxy代理抓取，格式同udp_proxy')
+
+    args = parser.parse_args(argv)
+    if args.command == 'file':
+        for path in args.files:
+            result = analyze_file(path)
+            result['url'] = path
+            print(format_result(result))
+        return 0
+
+    if args.command == 'url':
+        results = asyncio.run(probe_streams(args.urls, args.duration, args.iface, args.udp_proxy,
+                                            on_result=lambda result: print(format_result(result))))
+        return 1 if any(result.get('error') for result in results.values()) else 0
+
+    urls = collect_stream_urls(args.json_file, use_zte=args.stream_type in ('ZTE', 'both'),
+                               use_hw=args.stream_type in ('HW', 'both'))
+    print(f"共 {len(urls)} 个流，并发 {args.concurrency}，每个抓取 {args.duration} 秒")
+    start = time.perf_counter()
+    results = asyncio.run(probe_streams(urls, args.duration, args.iface, args.udp_proxy, args.concurrency,
+                                        on_result=lambda result: print(format_result(result))))
+    saved = load_probe_results(args.out)
+    saved.update((url, result) for url, result in results.items() if not result.get('error'))
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(saved, f, ensure_ascii=False, indent=2)
+    failed = sum(1 for result in results.values() if result.get('error'))
+    print(f"完成: 成功 {len(results) - failed} 个，失败 {failed} 个，耗时 {time.perf_counter() - start:.1f}s，结果已保存到 {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
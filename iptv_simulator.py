@@ -0,0 +1,572 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import socket
+import struct
+import sys
+import time
+from collections import namedtuple
+from urllib.parse import unquote, urlparse
+
+from iptv_json_cmcc import compile_filter, load_converter
+from iptv_stream import (NULL_PID, PAT_PID, PCR_CLOCK, TS_PACKET_SIZE, TS_SYNC_BYTE, open_multicast_socket,
+                         parse_stream_address, rtp_payload_range)
+
+# 每个数据报携带7个TS包，与IPTV组播相同
+PACKETS_PER_DATAGRAM = 7
+DATAGRAM_PAYLOAD = TS_PACKET_SIZE * PACKETS_PER_DATAGRAM
+RTP_HEADER = struct.Struct('>BBHII')
+RTP_HEADER_SIZE = RTP_HEADER.size
+RTP_PAYLOAD_TYPE_MP2T = 33
+PTS_CLOCK = 90000
+TIMESTAMP_WRAP = 1 << 33
+RECV_SIZE = 65536
+
+# 模拟流的PID和帧率
+PMT_PID = 0x0100
+VIDEO_PID = 0x0101
+AUDIO_PID = 0x0102
+FRAME_RATE = 25
+GOP_FRAMES = 25
+
+# 循环播放的模拟TS：数据、时长（整秒）和每个数据报中的时间戳 ((负载内偏移, 是否PCR, 原始值), ...)，
+# 发送时按循环次数平移PCR/PTS，接收端看到的时间戳连续递增
+SyntheticLoop = namedtuple('SyntheticLoop', ['data', 'duration', 'timestamps'])
+
+# 按画质代码选择的模拟流参数：(宽, 高, 码率kbps, 编码)，未知画质按高清处理
+SIMULATED_PROFILES = {
+    '2': (720, 576, 2500, 'h264'),
+    '4': (1920, 1080, 8000, 'h264'),
+    '40': (1920, 1080, 8000, 'h264'),
+    '6': (1920, 1080, 12000, 'h265'),
+    '10': (3840, 2160, 25000, 'h265'),
+    '14': (3840, 2160, 25000, 'h265')
+}
+DEFAULT_PROFILE = SIMULATED_PROFILES['4']
+
+# 发送节拍（秒）：每个节拍醒来一次，把所有组播组到期的数据报集中发送
+SEND_TICK = 0.01
+# 落后超过此秒数时丢弃积压的数据报，而不是突发补发
+MAX_LAG = 0.5
+
+
+def _crc32_mpeg(data):
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) & 0xFFFFFFFF if crc & 0x80000000 else (crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+class _BitWriter:
+    """按位写入SPS等语法元素"""
+
+    def __init__(self):
+        self.value = 0
+        self.length = 0
+
+    def bits(self, count, value):
+        self.value = (self.value << count) | (value & ((1 << count) - 1))
+        self.length += count
+
+    def ue(self, value):
+        value += 1
+        size = value.bit_length()
+        self.bits(size - 1, 0)
+        self.bits(size, value)
+
+    def rbsp(self):
+        """写入rbsp_stop_one_bit并按字节对齐，返回加入防竞争字节后的数据"""
+        self.bits(1, 1)
+        self.bits(-self.length % 8, 0)
+        data = self.value.to_bytes(self.length // 8, 'big')
+        output = bytearray()
+        zeros = 0
+        for byte in data:
+            if zeros >= 2 and byte <= 3:
+                output.append(3)
+                zeros = 0
+            output.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        return bytes(output)
+
+
+def _h264_sps(width, height):
+    writer = _BitWriter()
+    writer.bits(8, 66)          # profile_idc: Baseline
+    writer.bits(8, 0)
+    writer.bits(8, 40)          # level_idc
+    writer.ue(0)                # seq_parameter_set_id
+    writer.ue(0)                # log2_max_frame_num_minus4
+    writer.ue(2)                # pic_order_cnt_type
+    writer.ue(1)                # max_num_ref_frames
+    writer.bits(1, 0)
+    mb_width = (width + 15) // 16
+    mb_height = (height + 15) // 16
+    writer.ue(mb_width - 1)
+    writer.ue(mb_height - 1)
+    writer.bits(1, 1)           # frame_mbs_only_flag
+    writer.bits(1, 1)           # direct_8x8_inference_flag
+    if mb_width * 16 != width or mb_height * 16 != height:
+        writer.bits(1, 1)       # frame_cropping_flag
+        writer.ue(0)
+        writer.ue((mb_width * 16 - width) // 2)
+        writer.ue(0)
+        writer.ue((mb_height * 16 - height) // 2)
+    else:
+        writer.bits(1, 0)
+    writer.bits(1, 0)           # vui_parameters_present_flag
+    return b'\x67' + writer.rbsp()
+
+
+def _h265_sps(width, height):
+    writer = _BitWriter()
+    writer.bits(4, 0)           # sps_video_parameter_set_id
+    writer.bits(3, 0)           # sps_max_sub_layers_minus1
+    writer.bits(1, 1)
+    writer.bits(2, 0)           # profile_tier_level: Main
+    writer.bits(1, 0)
+    writer.bits(5, 1)
+    writer.bits(32, 0x60000000)
+    writer.bits(48, 0)
+    writer.bits(8, 150)         # general_level_idc
+    writer.ue(0)                # sps_seq_parameter_set_id
+    writer.ue(1)                # chroma_format_idc
+    writer.ue(width)
+    writer.ue(height)
+    writer.bits(1, 0)           # conformance_window_flag
+    writer.ue(0)
+    writer.ue(0)
+    writer.ue(4)
+    return b'\x42\x01' + writer.rbsp()
+
+
+def _psi_section(table_id, table_id_extension, body):
+    length = 5 + len(body) + 4
+    section = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF]) + struct.pack('>H', table_id_extension) \
+        + bytes([0xC1, 0, 0]) + body
+    return section + struct.pack('>I', _crc32_mpeg(section))
+
+
+def _pts_bytes(pts):
+    return bytes([((pts >> 29) & 0x0E) | 0x21, (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1, (pts >> 7) & 0xFF,
+                  ((pts << 1) & 0xFE) | 1])
+
+
+def _pes_header(stream_id, pts, packet_length=0):
+    return b'\x00\x00\x01' + bytes([stream_id]) + struct.pack('>H', packet_length) + b'\x80\x80\x05' + _pts_bytes(pts)
+
+
+def _ts_packet(pid, counter, payload, unit_start=False, pcr=None, random_access=False):
+    """组装一个TS包；需要适配字段或负载不足184字节时用适配字段填充，超出的负载被截断"""
+    header = bytes([TS_SYNC_BYTE, (0x40 if unit_start else 0) | (pid >> 8), pid & 0xFF])
+    flags = (0x40 if random_access else 0) | (0x10 if pcr is not None else 0)
+    if not flags and len(payload) >= 184:
+        return header + bytes([0x10 | counter]) + payload[:184]
+    if not flags and len(payload) == 183:
+        return header + bytes([0x30 | counter, 0]) + payload
+    fields = bytes([flags])
+    if pcr is not None:
+        base, extension = divmod(pcr, 300)
+        fields += struct.pack('>IH', base >> 1, ((base & 1) << 15) | 0x7E00 | extension)
+    payload = payload[:183 - len(fields)]
+    stuffing = 183 - len(fields) - len(payload)
+    return header + bytes([0x30 | counter, len(fields) + stuffing]) + fields + b'\xff' * stuffing + payload
+
+
+def synthetic_ts(width=1920, height=1080, kbps=8000, codec='h264', seconds=2):
+    """生成可循环播放的MPEG-TS数据（H.264/H.265视频+音频PID，带PAT/PMT、PCR和PTS），返回SyntheticLoop
+
+    每帧一个视频PES，每秒一个关键帧（带SPS和random_access_indicator）。各PID的包数都凑成16的倍数，
+    循环播放时连续计数器保持连续；总长度是数据报负载的整数倍。
+    """
+    stream_type = 0x1B if codec == 'h264' else 0x24
+    sps = _h264_sps(width, height) if codec == 'h264' else _h265_sps(width, height)
+    idr = b'\x65' if codec == 'h264' else b'\x26\x01'
+    non_idr = b'\x41' if codec == 'h264' else b'\x02\x01'
+    pat = b'\x00' + _psi_section(0x00, 1, struct.pack('>HH', 1, 0xE000 | PMT_PID))
+    pmt = b'\x00' + _psi_section(0x02, 1, struct.pack('>HH', 0xE000 | VIDEO_PID, 0xF000)
+                                  + bytes([stream_type]) + struct.pack('>HH', 0xE000 | VIDEO_PID, 0xF000)
+                                  + bytes([0x0F]) + struct.pack('>HH', 0xE000 | AUDIO_PID, 0xF000))
+    pat += b'\xff' * (184 - len(pat))
+    pmt += b'\xff' * (184 - len(pmt))
+
+    frames = max(round(seconds), 1) * GOP_FRAMES
+    # 每个循环发送16的倍数次PAT/PMT（约每100毫秒一次），每帧一个音频包，前几帧补发音频包凑成16的倍数
+    psi_count = 16 * max(frames // 40, 1)
+    psi_plan = [-(-(frame + 1) * psi_count // frames) + (frame * psi_count // -frames) for frame in range(frames)]
+    extra_audio = -frames % 16
+    audio_plan = [2 if frame < extra_audio else 1 for frame in range(frames)]
+    packets_per_frame = kbps * 1000 / 8 / TS_PACKET_SIZE / FRAME_RATE
+    video_plan = [max(int((frame + 1) * packets_per_frame) - int(frame * packets_per_frame)
+                      - 2 * psi_plan[frame] - audio_plan[frame], 1) for frame in range(frames)]
+    video_plan[-1] += -sum(video_plan) % 16
+
+    counters = {PAT_PID: 0, PMT_PID: 0, VIDEO_PID: 0, AUDIO_PID: 0}
+    packets = []
+    timestamps = {}
+
+    def emit(pid, payload, pts=None, **flags):
+        packet = _ts_packet(pid, counters[pid], payload, **flags)
+        counters[pid] = (counters[pid] + 1) & 0x0F
+        datagram, index = divmod(len(packets), PACKETS_PER_DATAGRAM)
+        offset = index * TS_PACKET_SIZE
+        stamps = timestamps.setdefault(datagram, [])
+        if flags.get('pcr') is not None:
+            stamps.append((offset + 6, True, flags['pcr']))
+        if pts is not None:
+            payload_start = 5 + packet[4] if packet[3] & 0x20 else 4
+            stamps.append((offset + payload_start + 9, False, pts))
+        packets.append(packet)
+
+    for frame in range(frames):
+        keyframe = frame % GOP_FRAMES == 0
+        pcr = frame * PCR_CLOCK // FRAME_RATE
+        pts = pcr // 300 + PTS_CLOCK // 10
+        for _ in range(psi_plan[frame]):
+            emit(PAT_PID, pat, unit_start=True)
+            emit(PMT_PID, pmt, unit_start=True)
+        for _ in range(audio_plan[frame]):
+            emit(AUDIO_PID, _pes_header(0xC0, pts, 8 + 170) + b'\x11' * 170, pts, unit_start=True)
+        # 第一个视频包的适配字段带PCR，负载176字节，其余视频包负载184字节
+        es = b'\x00\x00\x00\x01' + (sps + b'\x00\x00\x00\x01' + idr if keyframe else non_idr)
+        pes = _pes_header(0xE0, pts) + es
+        pes += b'\x88' * (176 + 184 * (video_plan[frame] - 1) - len(pes))
+        emit(VIDEO_PID, pes[:176], pts, unit_start=True, pcr=pcr, random_access=keyframe)
+        for offset in range(176, len(pes), 184):
+            emit(VIDEO_PID, pes[offset:offset + 184])
+    while len(packets) % PACKETS_PER_DATAGRAM:
+        packets.append(bytes([TS_SYNC_BYTE, NULL_PID >> 8, NULL_PID & 0xFF, 0x10]) + b'\xff' * 184)
+    datagrams = len(packets) // PACKETS_PER_DATAGRAM
+    return SyntheticLoop(b''.join(packets), frames // FRAME_RATE,
+                         tuple(tuple(timestamps[index]) if timestamps.get(index) else None for index in range(datagrams)))
+
+
+def canonical_group(group):
+    """把组播地址规范为点分十进制（频道数据中偶有 239.20.0.09 这样带前导零的写法），不是IPv4地址时返回None"""
+    parts = group.split('.')
+    if len(parts) != 4 or not all(part.isdigit() and int(part) <= 255 for part in parts):
+        return None
+    return '.'.join(str(int(part)) for part in parts)
+
+
+def collect_multicast_urls(json_file, rules='', limit=0):
+    """从频道JSON中收集所有物理频道的zteurl/hwurl组播地址，返回 [(地址, 画质代码, 频道名称), ...]"""
+    converter = load_converter(json_file, channel_filter=compile_filter(rules))
+    streams = []
+    seen = set()
+    for channel in converter.channels:
+        for phychannel in channel['phychannels']:
+            params = phychannel.get('params') or {}
+            for field in ('zteurl', 'hwurl'):
+                url = (params.get(field) or '').strip()
+                if not url.startswith(('rtp://', 'udp://')):
+                    continue
+                try:
+                    _, group, port = parse_stream_address(url)
+                except ValueError:
+                    continue
+                group = canonical_group(group)
+                if group is None or (group, port) in seen:
+                    continue
+                seen.add((group, port))
+                streams.append((url, phychannel.get('bitrateType', ''), channel.get('title', '')))
+                if limit and len(streams) >= limit:
+                    return streams
+    return streams
+
+
+class SimulatedStream:
+    """一个模拟的组播流：共享的循环TS数据、在其中的发送位置和RTP序号"""
+
+    def __init__(self, url, title, synthetic, ssrc):
+        protocol, group, self.port = parse_stream_address(url)
+        self.group = canonical_group(group) or group
+        self.url = url
+        self.title = title
+        self.rtp = protocol == 'rtp'
+        self.data = memoryview(synthetic.data)
+        self.timestamps = synthetic.timestamps
+        self.duration = synthetic.duration
+        self.ssrc = ssrc
+        self.datagrams = len(synthetic.timestamps)
+        self.rate = self.datagrams / synthetic.duration
+        self.address = (self.group, self.port)
+        self.position = 0
+        self.loops = 0
+        self.sequence = 0
+        self.sent = 0
+        self.skipped = 0
+
+
+class LineupSimulator:
+    """在回环接口上同时向大量组播组发送模拟TS
+
+    所有组播组使用一个发送套接字，每个节拍醒来一次，按各组的码率集中发送到期的数据报；
+    同一画质的组共享同一份循环TS数据，每个数据报只复制一次到发送缓冲区（RTP头就地写入）。
+    """
+
+    PCR_FIELDS = struct.Struct('>IH')
+
+    def __init__(self, streams, iface='127.0.0.1', ttl=1):
+        self.streams = streams
+        self.iface = iface
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(iface))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        with contextlib.suppress(OSError):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        self.started = None
+        self.errors = 0
+        self._buffer = bytearray(RTP_HEADER_SIZE + DATAGRAM_PAYLOAD)
+        self._payload = memoryview(self._buffer)[RTP_HEADER_SIZE:]
+
+    @classmethod
+    def from_json(cls, json_file, rules='', limit=0, kbps=None, seconds=2, iface='127.0.0.1'):
+        """为频道JSON中的所有组播地址创建模拟流；kbps不为空时所有组使用相同码率"""
+        templates = {}
+        streams = []
+        for index, (url, bitrate_type, title) in enumerate(collect_multicast_urls(json_file, rules, limit)):
+            width, height, profile_kbps, codec = SIMULATED_PROFILES.get(bitrate_type, DEFAULT_PROFILE)
+            key = (width, height, kbps or profile_kbps, codec)
+            if key not in templates:
+                templates[key] = synthetic_ts(width, height, key[2], codec, seconds)
+            streams.append(SimulatedStream(url, title, templates[key], 0x10000 + index))
+        return cls(streams, iface)
+
+    def send_due(self, now):
+        """发送截至now所有组到期的数据报，返回本次发送的数据报数"""
+        elapsed = now - self.started
+        buffer = self._buffer
+        payload = self._payload
+        sendto = self.sock.sendto
+        pack_into = RTP_HEADER.pack_into
+        timestamp = int(elapsed * PTS_CLOCK) & 0xFFFFFFFF
+        total = 0
+        for stream in self.streams:
+            due = int(elapsed * stream.rate) - stream.sent - stream.skipped
+            if due <= 0:
+                continue
+            if due > stream.rate * MAX_LAG:
+                stream.skipped += due - 1
+                due = 1
+            data = stream.data
+            timestamps = stream.timestamps
+            position = stream.position
+            shift = stream.loops * stream.duration * PTS_CLOCK
+            for _ in range(due):
+                start = position * DATAGRAM_PAYLOAD
+                payload[:] = data[start:start + DATAGRAM_PAYLOAD]
+                stamps = timestamps[position]
+                if stamps is not None and shift:
+                    self._shift_timestamps(payload, stamps, shift)
+                try:
+                    if stream.rtp:
+                        pack_into(buffer, 0, 0x80, RTP_PAYLOAD_TYPE_MP2T, stream.sequence, timestamp, stream.ssrc)
+                        sendto(buffer, stream.address)
+                        stream.sequence = (stream.sequence + 1) & 0xFFFF
+                    else:
+                        sendto(payload, stream.address)
+                except OSError:
+                    # 发送缓冲区满（ENOBUFS）时丢弃该数据报
+                    self.errors += 1
+                position += 1
+                if position == stream.datagrams:
+                    position = 0
+                    stream.loops += 1
+                    shift = stream.loops * stream.duration * PTS_CLOCK
+            stream.position = position
+            stream.sent += due
+            total += due
+        return total
+
+    def _shift_timestamps(self, payload, stamps, shift):
+        """把数据报中的PCR/PTS平移shift（90kHz）"""
+        for offset, is_pcr, value in stamps:
+            if is_pcr:
+                base, extension = divmod(value, 300)
+                base = (base + shift) % TIMESTAMP_WRAP
+                self.PCR_FIELDS.pack_into(payload, offset, base >> 1, ((base & 1) << 15) | 0x7E00 | extension)
+            else:
+                payload[offset:offset + 5] = _pts_bytes((value + shift) % TIMESTAMP_WRAP)
+
+    def stats(self):
+        sent = sum(stream.sent for stream in self.streams)
+        skipped = sum(stream.skipped for stream in self.streams)
+        rate = sum(stream.rate for stream in self.streams)
+        return {
+            'streams': len(self.streams),
+            'target_mbps': round(rate * DATAGRAM_PAYLOAD * 8 / 1e6, 1),
+            'datagrams_sent': sent,
+            'datagrams_skipped': skipped,
+            'send_errors': self.errors
+        }
+
+    async def run(self, duration=0, stats_interval=5.0, tick=SEND_TICK):
+        """按节拍发送，duration为0时一直运行；每stats_interval秒打印一次实际发送速率"""
+        self.started = time.perf_counter()
+        next_tick = self.started
+        last_report = self.started
+        last_sent = 0
+        busy = 0.0
+        while not duration or time.perf_counter() - self.started < duration:
+            now = time.perf_counter()
+            self.send_due(now)
+            busy += time.perf_counter() - now
+            if stats_interval and now - last_report >= stats_interval:
+                stats = self.stats()
+                sent = stats['datagrams_sent']
+                mbps = (sent - last_sent) * DATAGRAM_PAYLOAD * 8 / (now - last_report) / 1e6
+                print(f"{stats['streams']} 个组播组，发送 {mbps:.1f}/{stats['target_mbps']} Mbps，"
+                      f"发送占用 {busy / (now - last_report) * 100:.0f}%，丢弃积压 {stats['datagrams_skipped']}，"
+                      f"发送失败 {stats['send_errors']}")
+                last_report = now
+                last_sent = sent
+                busy = 0.0
+            next_tick += tick
+            await asyncio.sleep(max(next_tick - time.perf_counter(), 0))
+            if time.perf_counter() - next_tick > MAX_LAG:
+                next_tick = time.perf_counter()
+        return self.stats()
+
+    def close(self):
+        self.sock.close()
+
+
+class UdpxyStandIn:
+    """udpxy风格的HTTP转发：GET /rtp/组播地址:端口 或 /udp/组播地址:端口 加入组播组并返回裸TS
+
+    每个客户端单独加入组播组，RTP头在转发前去掉；/status 返回当前的客户端。
+    """
+
+    def __init__(self, iface='127.0.0.1'):
+        self.iface = iface
+        self.clients = {}
+
+    async def handle(self, reader, writer):
+        sock = None
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            path = unquote(urlparse(parts[1]).path) if len(parts) >= 2 else ''
+            if path.strip('/') == 'status':
+                body = json.dumps(list(self.clients.values()), ensure_ascii=False).encode('utf-8')
+                writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body)
+                             + body)
+                await writer.drain()
+                return
+            try:
+                _, group, port = parse_stream_address('http://udpxy' + path)
+                sock = open_multicast_socket(canonical_group(group) or group, port, self.iface)
+            except (ValueError, OSError):
+                writer.write(b'HTTP/1.0 404 Not Found\r\nContent-Type: text/plain\r\n\r\nNot Found')
+                await writer.drain()
+                return
+            sock.setblocking(False)
+            writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: application/octet-stream\r\n\r\n')
+            client = {'address': f"{group}:{port}", 'peer': str(writer.get_extra_info('peername')), 'bytes': 0}
+            self.clients[id(writer)] = client
+            await self._relay(sock, writer, client)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.clients.pop(id(writer), None)
+            if sock is not None:
+                sock.close()
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    @staticmethod
+    async def _relay(sock, writer, client):
+        loop = asyncio.get_running_loop()
+        buffer = bytearray(RECV_SIZE)
+        view = memoryview(buffer)
+        while not writer.is_closing():
+            count = await loop.sock_recv_into(sock, buffer)
+            payload = rtp_payload_range(view[:count])
+            if payload is None:
+                continue
+            writer.write(view[payload[0]:payload[1]])
+            client['bytes'] += payload[1] - payload[0]
+            if writer.transport.get_write_buffer_size() > 1024 * 1024:
+                await writer.drain()
+
+
+async def run_simulation(simulator, duration, stats_interval, udpxy_host, udpxy_port):
+    server = None
+    if udpxy_port:
+        relay = UdpxyStandIn(simulator.iface)
+        server = await asyncio.start_server(relay.handle, udpxy_host, udpxy_port)
+        print(f"udpxy替代服务: http://{udpxy_host}:{udpxy_port}/rtp/组播地址:端口")
+    try:
+        return await simulator.run(duration, stats_interval)
+    finally:
+        if server is not None:
+            server.close()
+
+
+async def run_udpxy(host, port, iface):
+    relay = UdpxyStandIn(iface)
+    server = await asyncio.start_server(relay.handle, host, port)
+    print(f"udpxy替代服务: http://{host}:{port}/rtp/组播地址:端口")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在回环接口上模拟IPTV组播频道，用于离线测试和性能测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    send_parser = subparsers.add_parser('send', help='向频道JSON中的所有组播地址发送模拟TS')
+    send_parser.add_argument('json_file', help='频道JSON文件')
+    send_parser.add_argument('--kbps', type=int, help='所有组播组使用的码率，默认按画质（标清2500、高清8000、4K 25000）')
+    send_parser.add_argument('--filter', default='', metavar='RULES', help='频道过滤规则，只模拟匹配的频道')
+    send_parser.add_argument('--limit', type=int, default=0, help='最多模拟的组播组数量')
+    send_parser.add_argument('--loop-seconds', type=float, default=2, help='循环TS数据的长度（秒）')
+    send_parser.add_argument('--duration', type=float, default=0, help='运行秒数，0表示一直运行')
+    send_parser.add_argument('--stats', type=float, default=5, help='打印发送速率的间隔秒数')
+    send_parser.add_argument('--iface', default='127.0.0.1', help='发送组播的本机接口地址')
+    send_parser.add_argument('--udpxy-port', type=int, default=0, help='同时启动udpxy替代服务的端口')
+    send_parser.add_argument('--udpxy-host', default='127.0.0.1', help='udpxy替代服务的监听地址')
+
+    udpxy_parser = subparsers.add_parser('udpxy', help='只运行udpxy替代服务')
+    udpxy_parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    udpxy_parser.add_argument('--port', type=int, default=4022, help='监听端口')
+    udpxy_parser.add_argument('--iface', default='127.0.0.1', help='接收组播的本机接口地址')
+
+    args = parser.parse_args(argv)
+    if args.command == 'udpxy':
+        try:
+            asyncio.run(run_udpxy(args.host, args.port, args.iface))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        simulator = LineupSimulator.from_json(args.json_file, args.filter, args.limit, args.kbps, args.loop_seconds,
+                                              args.iface)
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    if not simulator.streams:
+        print("频道JSON中没有组播地址")
+        return 1
+    print(f"模拟 {len(simulator.streams)} 个组播组，目标 {simulator.stats()['target_mbps']} Mbps，接口 {args.iface}")
+    try:
+        stats = asyncio.run(run_simulation(simulator, args.duration, args.stats, args.udpxy_host, args.udpxy_port))
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        simulator.close()
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from iptv_json_cmcc import CONFIG_FILE, load_converter
+
+# 快照数据库路径
+STORE_FILE = os.path.join(os.path.dirname(CONFIG_FILE), 'iptv_snapshots.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken_at TEXT NOT NULL,
+    source TEXT,
+    sha256 TEXT NOT NULL UNIQUE,
+    channel_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS channels (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    code TEXT,
+    title TEXT,
+    channelnum TEXT,
+    icon TEXT,
+    hwcode TEXT,
+    ztecode TEXT,
+    hwmediaid TEXT,
+    timeshift_available TEXT,
+    lookback_available TEXT,
+    is_charge TEXT
+);
+CREATE TABLE IF NOT EXISTS phychannels (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    channel_code TEXT,
+    code TEXT,
+    bitrate_type TEXT,
+    bitrate_type_name TEXT,
+    zteurl TEXT,
+    hwurl TEXT,
+    ztecode TEXT,
+    hwcode TEXT,
+    hwmediaid TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_channels_code ON channels(code, snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_channels_title ON channels(title);
+CREATE INDEX IF NOT EXISTS idx_channels_ztecode ON channels(ztecode);
+CREATE INDEX IF NOT EXISTS idx_channels_hwcode ON channels(hwcode);
+CREATE INDEX IF NOT EXISTS idx_phychannels_channel ON phychannels(channel_code, snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_phychannels_zteurl ON phychannels(zteurl);
+CREATE INDEX IF NOT EXISTS idx_phychannels_hwurl ON phychannels(hwurl);
+"""
+
+
+class SnapshotStore:
+    """基于SQLite的频道快照库，按频道代码、厂商代码和流地址建立索引"""
+
+    def __init__(self, db_file=STORE_FILE):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def ingest(self, json_file, taken_at=None):
+        """导入一个快照文件，全部数据在单个事务中批量写入；内容相同的快照只保存一次，返回快照ID"""
+        with open(json_file, 'rb') as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        row = self.conn.execute('SELECT id FROM snapshots WHERE sha256 = ?', (sha256,)).fetchone()
+        if row:
+            print(f"快照已存在，跳过: {json_file}")
+            return row[0]
+
+        converter = load_converter(json_file)
+
+        if taken_at is None:
+            taken_at = datetime.fromtimestamp(os.path.getmtime(json_file)).strftime('%Y-%m-%d %H:%M:%S')
+
+        channel_rows = []
+        phychannel_rows = []
+        for channel in converter.channels:
+            code = channel.get('code', '')
+            params = channel.get('params') or {}
+            channel_rows.append((
+                code, channel.get('title', ''), channel.get('channelnum', ''), channel.get('icon', ''),
+                params.get('hwcode', ''), params.get('ztecode', ''), params.get('hwmediaid', ''),
+                channel.get('timeshiftAvailable', ''), channel.get('lookbackAvailable', ''), channel.get('isCharge', '')
+            ))
+            for phychannel in channel['phychannels']:
+                phy_params = phychannel.get('params') or {}
+                phychannel_rows.append((
+                    code, phychannel.get('code', ''), phychannel.get('bitrateType', ''),
+                    phychannel.get('bitrateTypeName', ''),
+                    (phy_params.get('zteurl') or '').strip(), (phy_params.get('hwurl') or '').strip(),
+                    phy_params.get('ztecode', ''), phy_params.get('hwcode', ''), phy_params.get('hwmediaid', '')
+                ))
+
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO snapshots (taken_at, source, sha256, channel_count) VALUES (?, ?, ?, ?)',
+                (taken_at, os.path.abspath(json_file), sha256, len(channel_rows))
+            )
+            snapshot_id = cursor.lastrowid
+            self.conn.executemany(
+                'INSERT INTO channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((snapshot_id,) + row for row in channel_rows))
+            self.conn.executemany(
+                'INSERT INTO phychannels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((snapshot_id,) + row for row in phychannel_rows))
+
+        print(f"已导入快照 #{snapshot_id} ({taken_at}): {len(channel_rows)} 个频道, {len(phychannel_rows)} 个物理频道")
+        return snapshot_id
+
+    def snapshots(self):
+        """返回所有快照 [(id, taken_at, source, channel_count), ...]"""
+        return self.conn.execute(
+            'SELECT id, taken_at, source, channel_count FROM snapshots ORDER BY taken_at, id').fetchall()
+
+    def find_channel_codes(self, query):
+        """按频道代码、厂商代码或名称查找频道代码，名称精确匹配失败时按包含匹配"""
+        rows = self.conn.execute(
+            'SELECT DISTINCT code FROM channels WHERE code = ? OR title = ? OR ztecode = ? OR hwcode = ?',
+            (query, query, query, query)
+        ).fetchall()
+        if not rows:
+            rows = self.conn.execute(
+                'SELECT DISTINCT code FROM channels WHERE title LIKE ?', (f'%{query}%',)).fetchall()
+        return [row[0] for row in rows]
+
+    def history(self, channel_code):
+        """返回频道在各快照中的流地址变化，相邻快照内容相同的记录会被合并
+
+        返回 [(taken_at, title, [(bitrate_type_name, zteurl, hwurl), ...]), ...]，
+        频道在某个快照中消失时物理频道列表为空。
+        """
+        rows = self.conn.execute(
+            'SELECT s.id, s.taken_at, c.title FROM snapshots s '
+            'LEFT JOIN channels c ON c.snapshot_id = s.id AND c.code = ? ORDER BY s.taken_at, s.id',
+            (channel_code,)
+        ).fetchall()
+        streams = {}
+        for snapshot_id, bitrate_type_name, zteurl, hwurl in self.conn.execute(
+                'SELECT snapshot_id, bitrate_type_name, zteurl, hwurl FROM phychannels '
+                'WHERE channel_code = ? ORDER BY snapshot_id, bitrate_type, code', (channel_code,)):
+            streams.setdefault(snapshot_id, []).append((bitrate_type_name, zteurl, hwurl))
+
+        result = []
+        previous = None
+        for snapshot_id, taken_at, title in rows:
+            state = (title, streams.get(snapshot_id, []))
+            if state != previous:
+                result.append((taken_at, title, state[1]))
+                previous = state
+        return result
+
+    def find_stream(self, address):
+        """查找使用过指定流地址（如 239.20.0.104:2006 或完整URL）的频道
+
+        返回 [(taken_at, channel_code, title, bitrate_type_name, 厂商), ...]
+        """
+        if '://' in address:
+            candidates = (address,)
+        else:
+            candidates = (f'rtp://{address}', f'udp://{address}')
+        placeholders = ','.join('?' * len(candidates))
+        return self.conn.execute(
+            'SELECT s.taken_at, p.channel_code, c.title, p.bitrate_type_name, '
+            f'CASE WHEN p.zteurl IN ({placeholders}) THEN \'ZTE\' ELSE \'HW\' END '
+            'FROM phychannels p JOIN snapshots s ON s.id = p.snapshot_id '
+            'LEFT JOIN channels c ON c.snapshot_id = p.snapshot_id AND c.code = p.channel_code '
+            f'WHERE p.zteurl IN ({placeholders}) OR p.hwurl IN ({placeholders}) ORDER BY s.taken_at, s.id',
+            candidates * 3
+        ).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="IPTV频道快照库")
+    parser.add_argument('--db', default=STORE_FILE, help='快照数据库路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='导入一个或多个频道JSON快照')
+    ingest_parser.add_argument('json_files', nargs='+')
+    ingest_parser.add_argument('--taken-at', help='快照时间（默认使用文件修改时间）')
+
+    subparsers.add_parser('snapshots', help='列出所有快照')
+
+    history_parser = subparsers.add_parser('history', help='查看频道的流地址变化历史')
+    history_parser.add_argument('channel', help='频道代码、厂商代码或频道名称')
+
+    find_parser = subparsers.add_parser('find', help='查找使用过某个流地址的频道')
+    find_parser.add_argument('address', help='如 239.20.0.104:2006 或 rtp://239.20.0.104:2006')
+
+    args = parser.parse_args(argv)
+    store = SnapshotStore(args.db)
+    try:
+        if args.command == 'ingest':
+            for json_file in args.json_files:
+                store.ingest(json_file, taken_at=args.taken_at)
+        elif args.command == 'snapshots':
+            for snapshot_id, taken_at, source, channel_count in store.snapshots():
+                print(f"#{snapshot_id}  {taken_at}  {channel_count} 个频道  {source}")
+        elif args.command == 'history':
+            codes = store.find_channel_codes(args.channel)
+            if not codes:
+                print(f"未找到频道: {args.channel}")
+                return 1
+            for code in codes:
+                print(f"频道代码: {code}")
+                for taken_at, title, streams in store.history(code):
+                    if title is None:
+                        print(f"  {taken_at}  (频道不存在)")
+                        continue
+                    print(f"  {taken_at}  {title}")
+                    for bitrate_type_name, zteurl, hwurl in streams:
+                        print(f"      {bitrate_type_name or '未知'}: ZTE={zteurl or '-'} HW={hwurl or '-'}")
+        elif args.command == 'find':
+            rows = store.find_stream(args.address)
+            if not rows:
+                print(f"未找到使用该地址的频道: {args.address}")
+                return 1
+            for taken_at, code, title, bitrate_type_name, vendor in rows:
+                print(f"{taken_at}  {title} ({code})  {bitrate_type_name or '未知'}  {vendor}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+import socket
+import struct
+from urllib.parse import urlparse
+
+# MPEG-TS常量
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PAT_PID = 0x0000
+NULL_PID = 0x1FFF
+PCR_CLOCK = 27000000
+
+# PMT中的stream_type与编码格式
+STREAM_TYPES = {
+    0x01: 'MPEG-1 Video',
+    0x02: 'MPEG-2 Video',
+    0x03: 'MPEG-1 Audio',
+    0x04: 'MPEG-2 Audio',
+    0x0F: 'AAC',
+    0x11: 'AAC-LATM',
+    0x1B: 'H.264',
+    0x24: 'H.265',
+    0x42: 'AVS',
+    0xD2: 'AVS2',
+    0x81: 'AC-3',
+    0x87: 'E-AC-3'
+}
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x1B, 0x24, 0x42, 0xD2}
+
+
+def parse_stream_address(url):
+    """解析流地址，返回 (协议, 组播地址, 端口)
+
+    支持 rtp://ip:port、udp://@ip:port 以及udpxy风格的代理地址 http://proxy/rtp/ip:port。
+    """
+    parsed = urlparse(url.strip())
+    if parsed.scheme in ('rtp', 'udp'):
+        netloc = parsed.netloc.lstrip('@')
+        protocol = parsed.scheme
+    elif parsed.scheme in ('http', 'https'):
+        parts = parsed.path.strip('/').split('/')
+        if len(parts) < 2 or parts[-2] not in ('rtp', 'udp'):
+            raise ValueError(f"无法识别的流地址: {url}")
+        protocol = parts[-2]
+        netloc = parts[-1].lstrip('@')
+    else:
+        raise ValueError(f"无法识别的流地址: {url}")
+    host, _, port = netloc.rpartition(':')
+    return protocol, host, int(port)
+
+
+def open_multicast_socket(group, port, iface='0.0.0.0', rcvbuf=4 * 1024 * 1024):
+    """创建加入组播组的UDP套接字，iface为接收组播的本机接口地址（回环测试时使用127.0.0.1）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except OSError:
+            pass
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    except OSError:
+        pass
+    try:
+        # 绑定组播地址，避免收到同端口其他组的数据（Windows不支持时退回绑定任意地址）
+        sock.bind((group, port))
+    except OSError:
+        sock.bind(('', port))
+    membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton(iface))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    return sock
+
+
+def rtp_payload_range(view):
+    """返回数据报中TS负载的范围 (开始, 结束)；数据报本身是裸TS时返回整个范围，无法识别时返回None"""
+    length = len(view)
+    if length == 0:
+        return None
+    if view[0] == TS_SYNC_BYTE:
+        return 0, length
+    if length < 12 or view[0] & 0xC0 != 0x80:
+        return None
+    start = 12 + (view[0] & 0x0F) * 4
+    if view[0] & 0x10:
+        if length < start + 4:
+            return None
+        start += 4 + ((view[start + 2] << 8) | view[start + 3]) * 4
+    end = length
+    if view[0] & 0x20:
+        end -= view[length - 1]
+    if start >= end:
+        return None
+    return start, end
+
+
+def _read_bits(data, bit_position, count):
+    value = 0
+    for _ in range(count):
+        byte = data[bit_position >> 3]
+        value = (value << 1) | ((byte >> (7 - (bit_position & 7))) & 1)
+        bit_position += 1
+    return value, bit_position
+
+
+def _read_ue(data, bit_position):
+    zeros = 0
+    while not _read_bits(data, bit_position, 1)[0]:
+        zeros += 1
+        bit_position += 1
+        if zeros > 31:
+            raise ValueError("无效的指数哥伦布编码")
+    bit_position += 1
+    value, bit_position = _read_bits(data, bit_position, zeros)
+    return (1 << zeros) - 1 + value, bit_position
+
+
+def _skip_scaling_list(data, bit_position, size):
+    last_scale = 8
+    next_scale = 8
+    for _ in range(size):
+        if next_scale != 0:
+            delta, bit_position = _read_ue(data, bit_position)
+            delta = (delta + 1) // 2 if delta & 1 else -(delta // 2)
+            next_scale = (last_scale + delta + 256) % 256
+        last_scale = next_scale if next_scale != 0 else last_scale
+    return bit_position
+
+
+def _remove_emulation_prevention(nal):
+    return bytes(nal).replace(b'\x00\x00\x03', b'\x00\x00')
+
+
+def parse_h264_sps(nal):
+    """解析H.264 SPS（含NAL头），返回 (宽, 高)"""
+    data = _remove_emulation_prevention(nal)
+    profile_idc = data[1]
+    position = 32
+    _, position = _read_ue(data, position)  # seq_parameter_set_id
+    chroma_format_idc = 1
+    if profile_idc in (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135):
+        chroma_format_idc, position = _read_ue(data, position)
+        if chroma_format_idc == 3:
+            position += 1
+        _, position = _read_ue(data, position)  # bit_depth_luma
+        _, position = _read_ue(data, position)  # bit_depth_chroma
+        position += 1
+        scaling_matrix_present, position = _read_bits(data, position, 1)
+        if scaling_matrix_present:
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                present, position = _read_bits(data, position, 1)
+                if present:
+                    position = _skip_scaling_list(data, position, 16 if i < 6 else 64)
+    _, position = _read_ue(data, position)  # log2_max_frame_num
+    pic_order_cnt_type, position = _read_ue(data, position)
+    if pic_order_cnt_type == 0:
+        _, position = _read_ue(data, position)
+    elif pic_order_cnt_type == 1:
+        position += 1
+        _, position = _read_ue(data, position)
+        _, position = _read_ue(data, position)
+        cycle, position = _read_ue(data, position)
+        for _ in range(cycle):
+            _, position = _read_ue(data, position)
+    _, position = _read_ue(data, position)  # max_num_ref_frames
+    position += 1
+    width_mbs, position = _read_ue(data, position)
+    height_map_units, position = _read_ue(data, position)
+    frame_mbs_only, position = _read_bits(data, position, 1)
+    if not frame_mbs_only:
+        position += 1
+    position += 1
+    width = (width_mbs + 1) * 16
+    height = (2 - frame_mbs_only) * (height_map_units + 1) * 16
+    cropping, position = _read_bits(data, position, 1)
+    if cropping:
+        left, position = _read_ue(data, position)
+        right, position = _read_ue(data, position)
+        top, position = _read_ue(data, position)
+        bottom, position = _read_ue(data, position)
+        crop_x = 2 if chroma_format_idc in (1, 2) else 1
+        crop_y = (2 if chroma_format_idc == 1 else 1) * (2 - frame_mbs_only)
+        width -= (left + right) * crop_x
+        height -= (top + bottom) * crop_y
+    return width, height
+
+
+def parse_h265_sps(nal):
+    """解析H.265 SPS（含两字节NAL头），返回 (宽, 高)"""
+    data = _remove_emulation_prevention(nal)
+    position = 16
+    _, position = _read_bits(data, position, 4)  # sps_video_parameter_set_id
+    max_sub_layers, position = _read_bits(data, position, 3)
+    position += 1
+    # profile_tier_level
+    position += 88
+    position += 8  # general_level_idc
+    sub_layer_flags = []
+    for _ in range(max_sub_layers):
+        profile_present, position = _read_bits(data, position, 1)
+        level_present, position = _read_bits(data, position, 1)
+        sub_layer_flags.append((profile_present, level_present))
+    if max_sub_layers > 0:
+        position += 2 * (8 - max_sub_layers)
+    for profile_present, level_present in sub_layer_flags:
+        if profile_present:
+            position += 88
+        if level_present:
+            position += 8
+    _, position = _read_ue(data, position)  # sps_seq_parameter_set_id
+    chroma_format_idc, position = _read_ue(data, position)
+    if chroma_format_idc == 3:
+        position += 1
+    width, position = _read_ue(data, position)
+    height, position = _read_ue(data, position)
+    conformance_window, position = _read_bits(data, position, 1)
+    if conformance_window:
+        left, position = _read_ue(data, position)
+        right, position = _read_ue(data, position)
+        top, position = _read_ue(data, position)
+        bottom, position = _read_ue(data, position)
+        sub_width = 2 if chroma_format_idc in (1, 2) else 1
+        sub_height = 2 if chroma_format_idc == 1 else 1
+        width -= (left + right) * sub_width
+        height -= (top + bottom) * sub_height
+    return width, height
+
+
+class TSAnalyzer:
+    """MPEG-TS流分析器：按188字节包在memoryview上直接读取字段，不为每个包复制数据
+
+    统计各PID的包数、连续计数器错误，解析PAT/PMT得到编码格式，通过PCR计算码率，
+    并从视频流的SPS中解析分辨率。
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.sync_losses = 0
+        self.cc_errors = 0
+        self.pid_packets = {}
+        self.pmt_pids = set()
+        self.stream_types = {}
+        self.pcr_pid = None
+        self.first_pcr = None
+        self.last_pcr = None
+        self.bytes_at_first_pcr = 0
+        self.bytes_at_last_pcr = 0
+        self.width = None
+        self.height = None
+        self._last_cc = {}
+        self._remainder = bytearray()
+        self._video_pid = None
+        self._video_buffer = bytearray()
+
+    def feed(self, data):
+        """送入任意长度的TS数据（bytes/bytearray/memoryview）"""
+        view = memoryview(data)
+        if self._remainder:
+            # 只复制跨越两次数据之间的不足一个包的部分
+            need = TS_PACKET_SIZE - len(self._remainder)
+            self._remainder += view[:need]
+            view = view[need:]
+            if len(self._remainder) == TS_PACKET_SIZE:
+                self._packet(memoryview(self._remainder))
+                self._remainder = bytearray()
+            else:
+                return
+
+        length = len(view)
+        position = 0
+        while position + TS_PACKET_SIZE <= length:
+            if view[position] != TS_SYNC_BYTE:
+                # 失去同步时向后查找同步字节
+                self.sync_losses += 1
+                position += 1
+                while position < length and view[position] != TS_SYNC_BYTE:
+                    position += 1
+                continue
+            self._packet(view[position:position + TS_PACKET_SIZE])
+            position += TS_PACKET_SIZE
+        if position < length:
+            self._remainder = bytearray(view[position:])
+
+    def _packet(self, packet):
+        self.packets += 1
+        self.bytes += TS_PACKET_SIZE
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        self.pid_packets[pid] = self.pid_packets.get(pid, 0) + 1
+        if pid == NULL_PID:
+            return
+
+        payload_unit_start = packet[1] & 0x40
+        adaptation_control = (packet[3] >> 4) & 0x03
+        continuity_counter = packet[3] & 0x0F
+        offset = 4
+        discontinuity = False
+
+        if adaptation_control & 0x02:
+            adaptation_length = packet[4]
+            if adaptation_length > 0:
+                flags = packet[5]
+                discontinuity = bool(flags & 0x80)
+                if flags & 0x10 and pid == self.pcr_pid and adaptation_length >= 7:
+                    pcr_base = (packet[6] << 25) | (packet[7] << 17) | (packet[8] << 9) | (packet[9] << 1) | (packet[10] >> 7)
+                    pcr = pcr_base * 300 + (((packet[10] & 0x01) << 8) | packet[11])
+                    if self.first_pcr is None:
+                        self.first_pcr = pcr
+                        self.bytes_at_first_pcr = self.bytes
+                    self.last_pcr = pcr
+                    self.bytes_at_last_pcr = self.bytes
+            offset += 1 + adaptation_length
+
+        if adaptation_control & 0x01:
+            last_cc = self._last_cc.get(pid)
+            if last_cc is not None and not discontinuity and continuity_counter != last_cc:
+                if continuity_counter != (last_cc + 1) & 0x0F:
+                    self.cc_errors += 1
+            self._last_cc[pid] = continuity_counter
+
+            if offset < TS_PACKET_SIZE:
+                if pid == PAT_PID and payload_unit_start:
+                    self._parse_pat(packet[offset:])
+                elif pid in self.pmt_pids and payload_unit_start:
+                    self._parse_pmt(packet[offset:])
+                elif pid == self._video_pid and self.width is None:
+                    self._collect_video(packet[offset:], payload_unit_start)
+
+    def _section(self, payload):
+        pointer = payload[0]
+        section = payload[1 + pointer:]
+        if len(section) < 3:
+            return None
+        section_length = ((section[1] & 0x0F) << 8) | section[2]
+        return section[:3 + section_length]
+
+    def _parse_pat(self, payload):
+        section = self._section(payload)
+        if section is None or section[0] != 0x00:
+            return
+        # 跳过8字节表头，末尾4字节为CRC
+        for position in range(8, len(section) - 4 - 3, 4):
+            program_number = (section[position] << 8) | section[position + 1]
+            pid = ((section[position + 2] & 0x1F) << 8) | section[position + 3]
+            if program_number != 0:
+                self.pmt_pids.add(pid)
+
+    def _parse_pmt(self, payload):
+        section = self._section(payload)
+        if section is None or section[0] != 0x02 or len(section) < 16:
+            return
+        self.pcr_pid = ((section[8] & 0x1F) << 8) | section[9]
+        program_info_length = ((section[10] & 0x0F) << 8) | section[11]
+        position = 12 + program_info_length
+        end = len(section) - 4
+        while position + 5 <= end:
+            stream_type = section[position]
+            pid = ((section[position + 1] & 0x1F) << 8) | section[position + 2]
+            es_info_length = ((section[position + 3] & 0x0F) << 8) | section[position + 4]
+            self.stream_types[pid] = stream_type
+            if stream_type in VIDEO_STREAM_TYPES and self._video_pid is None:
+                self._video_pid = pid
+            position += 5 + es_info_length
+
+    def _collect_video(self, payload, payload_unit_start):
+        # 只在找到SPS之前收集视频数据，找到后不再复制
+        if payload_unit_start:
+            self._find_sps()
+            self._video_buffer = bytearray()
+        self._video_buffer += payload
+        if len(self._video_buffer) > 512 * 1024:
+            self._find_sps()
+            self._video_buffer = bytearray()
+
+    def _find_sps(self):
+        data = self._video_buffer
+        if len(data) < 9 or data[0:3] != b'\x00\x00\x01':
+            return
+        stream_type = self.stream_types.get(self._video_pid)
+        position = 9 + data[8]  # 跳过PES头
+        while True:
+            start = data.find(b'\x00\x00\x01', position)
+            if start == -1 or start + 4 > len(data):
+                return
+            nal_start = start + 3
+            end = data.find(b'\x00\x00\x01', nal_start)
+            nal = data[nal_start:end if end != -1 else len(data)]
+            try:
+                if stream_type == 0x1B and nal[0] & 0x1F == 7:
+                    self.width, self.height = parse_h264_sps(nal)
+                    return
+                if stream_type == 0x24 and (nal[0] >> 1) & 0x3F == 33:
+                    self.width, self.height = parse_h265_sps(nal)
+                    return
+            except (IndexError, ValueError):
+                pass
+            position = nal_start
+
+    @property
+    def pcr_bitrate(self):
+        """由PCR计算的码率（bit/s），PCR不足时返回None"""
+        if self.first_pcr is None or self.last_pcr is None or self.last_pcr <= self.first_pcr:
+            return None
+        return (self.bytes_at_last_pcr - self.bytes_at_first_pcr) * 8 * PCR_CLOCK / (self.last_pcr - self.first_pcr)
+
+    @property
+    def video_pid(self):
+        """PMT中第一个视频流的PID，尚未解析到PMT时为None"""
+        return self._video_pid
+
+    @property
+    def video_codec(self):
+        if self._video_pid is None:
+            return None
+        return STREAM_TYPES.get(self.stream_types[self._video_pid], f"0x{self.stream_types[self._video_pid]:02X}")
+
+    def summary(self):
+        """返回分析结果"""
+        return {
+            'packets': self.packets,
+            'pcr_bitrate_kbps': round(self.pcr_bitrate / 1000) if self.pcr_bitrate else None,
+            'cc_errors': self.cc_errors,
+            'sync_losses': self.sync_losses,
+            'pids': {str(pid): {'packets': count, 'type': STREAM_TYPES.get(self.stream_types.get(pid), None)}
+                     for pid, count in sorted(self.pid_packets.items())},
+            'video_codec': self.video_codec,
+            'width': self.width,
+            'height': self.height
+        }
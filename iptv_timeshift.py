@@ -0,0 +1,494 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import mmap
+import os
+import re
+import selectors
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, unquote, urlparse
+
+from iptv_json_cmcc import QUALITY_OPTIONS, compile_filter, load_converter
+from iptv_stream import TS_PACKET_SIZE, open_multicast_socket, parse_stream_address, rtp_payload_range
+
+# 环形文件目录，每个频道一个 <频道代码>.ring 文件
+RING_DIR = 'iptv_timeshift'
+
+# 环形文件布局：文件头（魔数、版本、数据区容量、累计写入字节数、时间索引条目数）、
+# 时间索引（每秒一条 (时间戳, 累计偏移)，本身也是环形的），之后是数据区
+RING_MAGIC = b'IPTVRING'
+RING_VERSION = 1
+RING_HEADER = struct.Struct('<8sIIQQQ')
+RING_WRITTEN = struct.Struct('<Q')
+RING_WRITTEN_OFFSET = 24
+RING_INDEX_COUNT_OFFSET = 32
+INDEX_ENTRY = struct.Struct('<dQ')
+INDEX_OFFSET = 4096
+INDEX_SLOTS = 16384
+DATA_OFFSET = INDEX_OFFSET + INDEX_SLOTS * INDEX_ENTRY.size
+
+# 单个数据报的最大长度；录制线程对每个就绪的套接字连续读取，直到没有数据
+RECV_SIZE = 65536
+# 每次发送给播放器的最大字节数，以及追上直播点后的等待间隔
+SEND_SIZE = TS_PACKET_SIZE * 348
+POLL_INTERVAL = 0.02
+# 回看时间参数格式，与厂商回看地址的playseek参数相同（本地时间）
+PLAYSEEK_FORMAT = '%Y%m%d%H%M%S'
+
+
+class TimeshiftRing:
+    """单个频道的环形录制文件
+
+    数据区是固定大小的mmap，写入位置为累计写入字节数对容量取模，新数据覆盖最旧的数据；
+    所有写入都是整数个TS包，因此任何TS包大小整数倍的累计偏移都是包的起始位置。
+    写入只做内存复制和文件头更新，不分配新的缓冲区；读取方用累计偏移定位，被覆盖的数据视为已过期。
+    """
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity - capacity % TS_PACKET_SIZE
+        if self.capacity <= 0:
+            raise ValueError(f"环形文件容量过小: {capacity}")
+        size = DATA_OFFSET + self.capacity
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self._file = open(path, mode)
+        if os.path.getsize(path) != size:
+            self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self._view = memoryview(self._mm)
+        self.data = self._view[DATA_OFFSET:]
+
+        magic, version, _, capacity, written, index_count = RING_HEADER.unpack_from(self._mm, 0)
+        if magic != RING_MAGIC or version != RING_VERSION or capacity != self.capacity:
+            written = index_count = 0
+            RING_HEADER.pack_into(self._mm, 0, RING_MAGIC, RING_VERSION, 0, self.capacity, 0, 0)
+        self.written = written
+        # 正在进行的写入完成后的written；write()先更新它再复制数据，读取方据此判断复制期间数据是否被覆盖
+        self.writing = written
+        self.index_count = index_count
+        self._index_second = None
+
+    def write(self, view):
+        """追加一段TS数据（长度为TS包大小的整数倍），超出容量时覆盖最旧的数据"""
+        count = len(view)
+        self.writing = self.written + count
+        if count > self.capacity:
+            view = view[count - self.capacity:]
+            self.written += count - self.capacity
+            count = self.capacity
+        position = self.written % self.capacity
+        first = min(count, self.capacity - position)
+        self.data[position:position + first] = view[:first]
+        if first < count:
+            self.data[:count - first] = view[first:]
+
+        # 每秒记录一次时间索引，指向该秒内第一次写入的位置
+        now = time.time()
+        second = int(now)
+        if second != self._index_second:
+            self._index_second = second
+            INDEX_ENTRY.pack_into(self._mm, INDEX_OFFSET + (self.index_count % INDEX_SLOTS) * INDEX_ENTRY.size,
+                                  now, self.written)
+            self.index_count += 1
+            RING_WRITTEN.pack_into(self._mm, RING_INDEX_COUNT_OFFSET, self.index_count)
+        self.written += count
+        RING_WRITTEN.pack_into(self._mm, RING_WRITTEN_OFFSET, self.written)
+
+    def oldest(self):
+        """仍在窗口中的最旧数据的累计偏移"""
+        return max(0, self.written - self.capacity)
+
+    def readable(self):
+        """可以安全读取的最旧累计偏移：在oldest()的基础上排除正在进行的写入将要覆盖的数据"""
+        return max(0, self.writing - self.capacity)
+
+    def read(self, offset, size):
+        """复制从累计偏移offset开始的size字节，数据已被覆盖或尚未写入时返回None"""
+        if offset < self.readable() or offset + size > self.written:
+            return None
+        position = offset % self.capacity
+        first = min(size, self.capacity - position)
+        chunk = bytes(self.data[position:position + first])
+        if first < size:
+            chunk += bytes(self.data[:size - first])
+        # 复制期间录制线程可能已覆盖这段数据
+        if offset < self.readable():
+            return None
+        return chunk
+
+    def _index_entry(self, number):
+        return INDEX_ENTRY.unpack_from(self._mm, INDEX_OFFSET + (number % INDEX_SLOTS) * INDEX_ENTRY.size)
+
+    def _index_range(self):
+        """返回仍然有效（指向窗口内数据）的索引条目编号范围 [开始, 结束)"""
+        end = self.index_count
+        low = max(0, end - INDEX_SLOTS)
+        oldest = self.oldest()
+        high = end
+        while low < high:
+            middle = (low + high) // 2
+            if self._index_entry(middle)[1] < oldest:
+                low = middle + 1
+            else:
+                high = middle
+        return low, end
+
+    def offset_for_time(self, timestamp):
+        """返回时间戳对应的累计偏移：该时间之前最近一个索引点，早于所有有效索引点时返回窗口中最旧的数据，没有数据时返回None"""
+        if self.written == 0:
+            return None
+        start, end = self._index_range()
+        low, high = start, end
+        while low < high:
+            middle = (low + high) // 2
+            if self._index_entry(middle)[0] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        if low == start:
+            return self.oldest()
+        return self._index_entry(low - 1)[1]
+
+    def window(self):
+        """返回窗口的 (开始时间, 结束时间, 字节数)，没有数据时时间为None"""
+        start, end = self._index_range()
+        if start >= end:
+            return None, None, self.written - self.oldest()
+        return self._index_entry(start)[0], time.time(), self.written - self.oldest()
+
+    def close(self):
+        self.data.release()
+        self._view.release()
+        self._mm.close()
+        self._file.close()
+
+
+class TimeshiftRecorder:
+    """在单个线程中用selectors同时接收多个组播频道，并写入各自的环形文件"""
+
+    def __init__(self, iface='0.0.0.0'):
+        self.iface = iface
+        self.channels = {}
+        self._selector = selectors.DefaultSelector()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_channel(self, code, title, url, ring):
+        _, group, port = parse_stream_address(url)
+        sock = open_multicast_socket(group, port, self.iface)
+        sock.setblocking(False)
+        channel = {'code': code, 'title': title, 'url': url, 'ring': ring, 'socket': sock,
+                   'datagrams': 0, 'dropped': 0}
+        self.channels[code] = channel
+        self._selector.register(sock, selectors.EVENT_READ, channel)
+        return channel
+
+    def run(self):
+        """录制循环：所有频道共用一个接收缓冲区，负载按memoryview直接写入环形文件"""
+        buffer = bytearray(RECV_SIZE)
+        view = memoryview(buffer)
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(0.5):
+                channel = key.data
+                sock = key.fileobj
+                ring = channel['ring']
+                while True:
+                    try:
+                        count = sock.recv_into(buffer)
+                    except OSError:
+                        # BlockingIOError表示该套接字暂时没有更多数据
+                        break
+                    payload = rtp_payload_range(view[:count])
+                    if payload is None:
+                        channel['dropped'] += 1
+                        continue
+                    start, end = payload
+                    end -= (end - start) % TS_PACKET_SIZE
+                    if end > start:
+                        ring.write(view[start:end])
+                        channel['datagrams'] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='timeshift-recorder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for channel in self.channels.values():
+            self._selector.unregister(channel['socket'])
+            channel['socket'].close()
+            channel['ring'].close()
+        self._selector.close()
+
+
+def parse_playseek(value):
+    """解析 playseek=开始-结束（yyyyMMddHHmmss，本地时间），返回 (开始时间戳, 结束时间戳或None)"""
+    begin, _, end = value.partition('-')
+    start = datetime.strptime(begin, PLAYSEEK_FORMAT).timestamp()
+    return start, datetime.strptime(end, PLAYSEEK_FORMAT).timestamp() if end else None
+
+
+def parse_range(value):
+    """解析 Range: bytes=开始-[结束]，返回 (开始, 结束或None)，结束为包含在内的最后一个字节"""
+    match = re.fullmatch(r'\s*bytes=(\d+)-(\d*)\s*', value or '')
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+
+def resolve_start(ring, query, range_header=None):
+    """根据请求确定播放的累计偏移区间 (开始, 结束或None)
+
+    支持 Range（累计字节偏移）、offset（距直播点的秒数）、start（Unix时间戳）和playseek参数，都没有时从直播点开始。
+    请求的位置已不在窗口中时抛出LookupError。
+    """
+    byte_range = parse_range(range_header)
+    if byte_range is not None:
+        start, last = byte_range
+        if start < ring.oldest() or start > ring.written:
+            raise LookupError(f"偏移 {start} 不在时移窗口中")
+        return start, last + 1 if last is not None else None
+
+    end_time = None
+    if 'playseek' in query:
+        start_time, end_time = parse_playseek(query['playseek'][0])
+    elif 'start' in query:
+        start_time = float(query['start'][0])
+    elif 'offset' in query:
+        start_time = time.time() - float(query['offset'][0])
+    else:
+        return ring.written, None
+
+    start = ring.offset_for_time(start_time)
+    if start is None:
+        raise LookupError("频道还没有录制数据")
+    end = None
+    if end_time is not None and end_time < time.time():
+        end = ring.offset_for_time(end_time)
+        if end is not None and end <= start:
+            raise LookupError("请求的时间段不在时移窗口中")
+    return start, end
+
+
+class TimeshiftServer:
+    """通过HTTP提供时移播放：/ts/<频道代码> 播放，/playlist.m3u 播放列表，/status 录制状态"""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+                await self._respond(writer, 405, 'text/plain', b'Method Not Allowed')
+                return
+            parsed = urlparse(parts[1])
+            path = unquote(parsed.path)
+            query = parse_qs(parsed.query)
+            if path in ('/', '/status'):
+                await self._respond(writer, 200, 'application/json', self.status_json())
+            elif path == '/playlist.m3u':
+                host = headers.get('host') or '127.0.0.1'
+                await self._respond(writer, 200, 'audio/x-mpegurl', self.playlist(host).encode('utf-8'))
+            elif path.startswith('/ts/'):
+                await self._stream(writer, path[4:], query, headers.get('range'), parts[0] == 'HEAD')
+            else:
+                await self._respond(writer, 404, 'text/plain', b'Not Found')
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _respond(self, writer, status, content_type, body, extra_headers=()):
+        reason = {200: 'OK', 206: 'Partial Content', 404: 'Not Found', 405: 'Method Not Allowed',
+                  416: 'Range Not Satisfiable'}.get(status, 'OK')
+        lines = [f"HTTP/1.0 {status} {reason}", f"Content-Type: {content_type}", "Accept-Ranges: bytes",
+                 "Connection: close"]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.extend(extra_headers)
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body:
+            writer.write(body)
+        await writer.drain()
+
+    async def _stream(self, writer, code, query, range_header, head_only):
+        channel = self.recorder.channels.get(code)
+        if channel is None:
+            await self._respond(writer, 404, 'text/plain', f"未录制的频道: {code}".encode('utf-8'))
+            return
+        ring = channel['ring']
+        try:
+            start, end = resolve_start(ring, query, range_header)
+        except (LookupError, ValueError) as e:
+            await self._respond(writer, 416, 'text/plain', str(e).encode('utf-8'),
+                                (f"Content-Range: bytes */{ring.written}",))
+            return
+
+        # 响应头中返回起始的累计偏移，播放器可据此用Range继续定位
+        extra = [f"X-Timeshift-Offset: {start}"]
+        status = 200
+        if range_header:
+            status = 206
+            extra.append(f"Content-Range: bytes {start}-{end - 1 if end is not None else ''}/*")
+        if end is not None and end <= ring.written:
+            extra.append(f"Content-Length: {end - start}")
+        await self._respond(writer, status, 'video/mp2t', None, extra)
+        if head_only:
+            return
+
+        position = start
+        while end is None or position < end:
+            oldest = ring.readable()
+            if position < oldest:
+                # 播放器读取过慢，数据已被覆盖，跳到窗口中最旧的数据继续播放
+                position = oldest
+            available = ring.written - position
+            if available <= 0:
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            size = min(available, SEND_SIZE)
+            if end is not None:
+                size = min(size, end - position)
+            chunk = ring.read(position, size)
+            if chunk is None:
+                continue
+            writer.write(chunk)
+            await writer.drain()
+            position += size
+
+    def status(self):
+        """各频道的录制状态"""
+        channels = []
+        for channel in self.recorder.channels.values():
+            ring = channel['ring']
+            start, end, size = ring.window()
+            channels.append({
+                'code': channel['code'],
+                'title': channel['title'],
+                'url': channel['url'],
+                'window_seconds': round(end - start, 1) if start is not None else 0,
+                'window_start': datetime.fromtimestamp(start).strftime(PLAYSEEK_FORMAT) if start is not None else None,
+                'bytes': size,
+                'capacity': ring.capacity,
+                'written': ring.written,
+                'datagrams': channel['datagrams'],
+                'dropped': channel['dropped']
+            })
+        return channels
+
+    def status_json(self):
+        return json.dumps({'channels': self.status()}, ensure_ascii=False, indent=2).encode('utf-8')
+
+    def playlist(self, host):
+        """生成M3U播放列表：直播地址为时移服务的直播点，回看地址使用与厂商模板相同的playseek参数"""
+        lines = ['#EXTM3U']
+        for channel in self.recorder.channels.values():
+            url = f"http://{host}/ts/{channel['code']}"
+            catchup_source = f"{url}?playseek=${{(b)yyyyMMddHHmmss}}-${{(e)yyyyMMddHHmmss}}"
+            lines.append(f'#EXTINF:-1 tvg-id="{channel["code"]}" tvg-name="{channel["title"]}" catchup="default" '
+                         f'catchup-source="{catchup_source}" group-title="时移",{channel["title"]}')
+            lines.append(url)
+        return '\n'.join(lines) + '\n'
+
+
+def select_channels(json_file, titles=None, rules='', use_zte=True, use_hw=False, quality_preference='high'):
+    """选择要录制的频道，返回 [(频道代码, 频道名称, 组播地址), ...]
+
+    titles为频道名称或代码列表，rules为频道过滤规则；每个频道按画质偏好只录制一个组播流。
+    """
+    converter = load_converter(json_file, channel_filter=compile_filter(rules))
+    wanted = set(titles or ())
+    selected = []
+    seen = set()
+    for entry in converter.iter_entries(use_zte=use_zte, use_hw=use_hw, quality_preference=quality_preference):
+        channel = entry.channel
+        code = channel.get('code') or channel.get('title', '')
+        if code in seen or not entry.stream_url.startswith(('rtp://', 'udp://')):
+            continue
+        if wanted and code not in wanted and channel.get('title') not in wanted:
+            continue
+        seen.add(code)
+        selected.append((code, channel.get('title', code), entry.stream_url))
+    return selected
+
+
+async def serve(recorder, host, port):
+    server = TimeshiftServer(recorder)
+    http_server = await asyncio.start_server(server.handle, host, port)
+    async with http_server:
+        await http_server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地时移服务：把组播频道持续录制到环形文件，并通过HTTP提供时移播放")
+    parser.add_argument('json_file', help='频道JSON文件')
+    parser.add_argument('--channels', nargs='+', metavar='NAME', help='要录制的频道名称或代码')
+    parser.add_argument('--filter', default='', metavar='RULES', help='用频道过滤规则选择要录制的频道')
+    parser.add_argument('--stream-type', choices=['ZTE', 'HW'], default='ZTE', help='录制的流类型')
+    parser.add_argument('--quality', choices=list(QUALITY_OPTIONS), default='高清优先', help='画质偏好')
+    parser.add_argument('--size', type=int, default=512, help='每个频道的环形文件大小（MB）')
+    parser.add_argument('--dir', default=RING_DIR, help='环形文件目录')
+    parser.add_argument('--iface', default='0.0.0.0', help='接收组播的本机接口地址')
+    parser.add_argument('--host', default='0.0.0.0', help='HTTP服务监听地址')
+    parser.add_argument('--port', type=int, default=8088, help='HTTP服务端口')
+    args = parser.parse_args(argv)
+
+    if not args.channels and not args.filter:
+        print("请用 --channels 或 --filter 选择要录制的频道")
+        return 1
+    try:
+        channels = select_channels(args.json_file, args.channels, args.filter, use_zte=args.stream_type == 'ZTE',
+                                   use_hw=args.stream_type == 'HW', quality_preference=QUALITY_OPTIONS[args.quality])
+    except ValueError as e:
+        print(e)
+        return 1
+    if not channels:
+        print("没有匹配的频道")
+        return 1
+
+    os.makedirs(args.dir, exist_ok=True)
+    recorder = TimeshiftRecorder(args.iface)
+    for code, title, url in channels:
+        ring = TimeshiftRing(os.path.join(args.dir, f"{re.sub(r'[^0-9A-Za-z_.-]', '_', code)}.ring"),
+                             args.size * 1024 * 1024)
+        try:
+            recorder.add_channel(code, title, url, ring)
+        except OSError as e:
+            ring.close()
+            print(f"无法接收 {title} ({url}): {e}")
+            continue
+        print(f"录制 {title}: {url}，窗口 {args.size} MB")
+    if not recorder.channels:
+        return 1
+
+    recorder.start()
+    print(f"时移服务: http://{args.host}:{args.port}/playlist.m3u")
+    try:
+        asyncio.run(serve(recorder, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+
+from iptv_json_cmcc import run_batch, timestamped_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, 'getAllChannel2.json')
+
+
+def test_timestamped_file_replaces_existing_timestamp():
+    now = datetime(2026, 10, 19, 7, 30, 5)
+    assert timestamped_file('out/zte.m3u', now) == 'out/zte_20261019_073005.m3u'
+    assert timestamped_file('out/zte_20250101_000000.m3u', now) == 'out/zte_20261019_073005.m3u'
+    assert timestamped_file('playlist', now) == 'playlist_20261019_073005'
+
+
+def test_batch_honours_timestamp(tmp_path):
+    presets = {
+        'stamped': {'output_file': str(tmp_path / 'zte.m3u'), 'timestamp': True},
+        'plain': {'output_file': str(tmp_path / 'hw.txt'), 'output_format': 'DIYP', 'stream_type': 'HW'},
+    }
+    results = {result['name']: result for result in run_batch(SOURCE, presets)['results']}
+    assert re.fullmatch(r'zte_\d{8}_\d{6}\.m3u', os.path.basename(results['stamped']['output_file']))
+    assert results['plain']['output_file'] == str(tmp_path / 'hw.txt')
+    assert all(os.path.exists(result['output_file']) for result in results.values())
+
+
+def test_batch_does_not_redirect_stdout(tmp_path, capsys):
+    # 批量生成期间其他线程的输出不能被吞掉
+    seen = []
+    stop = threading.Event()
+
+    def watch():
+        while not stop.is_set():
+            seen.append(sys.stdout)
+
+    watcher = threading.Thread(target=watch)
+    stdout = sys.stdout
+    watcher.start()
+    try:
+        run_batch(SOURCE, {'zte': {'output_file': str(tmp_path / 'zte.m3u')}})
+    finally:
+        stop.set()
+        watcher.join()
+    assert all(item is stdout for item in seen)
+    output = capsys.readouterr().out
+    assert '成功添加频道' not in output
+    assert '开始生成M3U' not in output
@@ -0,0 +1,118 @@
+import copy
+
+import pytest
+
+from iptv_json_cmcc import CatchupResolver, IPTV2M3U, format_m3u_entry
+
+ZTE_HOST = '183.59.160.61:554'
+HW_HOST = '183.59.156.166:554'
+PLAYSEEK = '?playseek=${(b)yyyyMMddHHmmss}-${(e)yyyyMMddHHmmss}'
+
+CHANNEL = {
+    'code': '02000000000000050000000000000055',
+    'title': 'CCTV-1综合',
+    'channelnum': '100',
+    'timeshiftAvailable': 'true',
+    'lookbackAvailable': 'true',
+    'params': {},
+    'phychannels': [{
+        'code': 'PhysicalChannel_889',
+        'bitrateType': '4',
+        'bitrateTypeName': '高清',
+        'params': {
+            'ztecode': 'ch000000000000104',
+            'hwurl': 'rtp://239.10.0.114:1025',
+            'zteurl': 'rtp://239.20.0.104:2006',
+            'hwmediaid': '10000100000000060000000000128463',
+            'hwcode': '10000100000000050000000000088734'
+        }
+    }]
+}
+
+ZTE_CATCHUP = f"rtsp://{ZTE_HOST}/live/ch000000000000104{PLAYSEEK}"
+HW_CATCHUP = (f"rtsp://{HW_HOST}/PLTV/88888888/224/10000100000000050000000000088734/"
+              f"10000100000000060000000000128463.smil{PLAYSEEK}")
+
+
+def resolve(resolver, channel, url_key):
+    phychannel = channel['phychannels'][0]
+    return resolver.resolve(channel, phychannel, phychannel['params'][url_key])
+
+
+def entries(channel, resolver, **options):
+    converter = IPTV2M3U()
+    converter.channels = [channel]
+    return list(converter.iter_entries(catchup=resolver, **options))
+
+
+def test_compile_substitutes_host_and_keeps_player_placeholders():
+    parts = CatchupResolver.compile('rtsp://{host}/live/{ztecode}?playseek=${(b)yyyyMMddHHmmss}', ZTE_HOST)
+    assert parts == [(False, f"rtsp://{ZTE_HOST}/live/"), (True, 'ztecode'),
+                     (False, '?playseek=${(b)yyyyMMddHHmmss}')]
+
+
+def test_zte_stream_uses_zte_template():
+    resolver = CatchupResolver({'ZTE': ZTE_HOST, 'HW': HW_HOST})
+    assert resolve(resolver, CHANNEL, 'zteurl') == ZTE_CATCHUP
+
+
+def test_hw_stream_uses_hw_template():
+    resolver = CatchupResolver({'ZTE': ZTE_HOST, 'HW': HW_HOST})
+    assert resolve(resolver, CHANNEL, 'hwurl') == HW_CATCHUP
+
+
+def test_hw_only_selection_emits_hw_catchup():
+    resolver = CatchupResolver({'ZTE': ZTE_HOST, 'HW': HW_HOST})
+    (entry,) = entries(copy.deepcopy(CHANNEL), resolver, use_zte=False, use_hw=True)
+    assert entry.stream_url == 'rtp://239.10.0.114:1025'
+    assert entry.catchup == HW_CATCHUP
+    assert f'catchup="default" catchup-source="{HW_CATCHUP}"' in format_m3u_entry(entry)
+
+
+def test_falls_back_to_other_vendor_when_host_missing():
+    assert resolve(CatchupResolver({'HW': HW_HOST}), CHANNEL, 'zteurl') == HW_CATCHUP
+    assert resolve(CatchupResolver({'ZTE': ZTE_HOST}), CHANNEL, 'hwurl') == ZTE_CATCHUP
+
+
+def test_channel_params_fill_missing_phychannel_params():
+    channel = copy.deepcopy(CHANNEL)
+    params = channel['phychannels'][0]['params']
+    channel['params'] = {'hwcode': params.pop('hwcode'), 'hwmediaid': params.pop('hwmediaid')}
+    assert resolve(CatchupResolver({'HW': HW_HOST}), channel, 'hwurl') == HW_CATCHUP
+
+
+@pytest.mark.parametrize('missing, hosts', [
+    (('hwcode',), {'HW': HW_HOST}),
+    (('hwmediaid',), {'HW': HW_HOST}),
+    (('ztecode',), {'ZTE': ZTE_HOST}),
+    (('ztecode', 'hwcode'), {'ZTE': ZTE_HOST, 'HW': HW_HOST}),
+])
+def test_missing_template_fields_emit_no_catchup(missing, hosts):
+    channel = copy.deepcopy(CHANNEL)
+    for key in missing:
+        del channel['phychannels'][0]['params'][key]
+    resolver = CatchupResolver(hosts)
+    assert resolve(resolver, channel, 'zteurl') is None
+    (entry,) = entries(channel, resolver)
+    assert entry.catchup is None
+    assert 'catchup' not in format_m3u_entry(entry)
+
+
+def test_channel_without_timeshift_or_lookback_emits_no_catchup():
+    channel = copy.deepcopy(CHANNEL)
+    channel['timeshiftAvailable'] = 'false'
+    channel['lookbackAvailable'] = 'false'
+    resolver = CatchupResolver({'ZTE': ZTE_HOST, 'HW': HW_HOST})
+    (entry,) = entries(channel, resolver)
+    assert entry.catchup is None
+    assert 'catchup' not in format_m3u_entry(entry)
+
+
+def test_either_flag_enables_catchup():
+    channel = copy.deepcopy(CHANNEL)
+    channel['timeshiftAvailable'] = 'false'
+    assert resolve(CatchupResolver({'ZTE': ZTE_HOST}), channel, 'zteurl') == ZTE_CATCHUP
+
+
+def test_no_hosts_is_falsy():
+    assert not CatchupResolver({'ZTE': '', 'HW': ''})
@@ -0,0 +1,54 @@
+import pytest
+
+from iptv_json_cmcc import ChannelFilter
+
+
+def accepts(rules, **channel):
+    return ChannelFilter(rules).accept_channel(channel)
+
+
+def test_semicolon_separates_rules():
+    rules = 'exclude isCharge = 1; include channelnum in 1-199,500'
+    assert accepts(rules, isCharge='0', channelnum='150')
+    assert accepts(rules, isCharge='0', channelnum='500')
+    assert not accepts(rules, isCharge='1', channelnum='150')
+    assert not accepts(rules, isCharge='0', channelnum='300')
+
+
+def test_quoted_value_may_contain_semicolon():
+    assert accepts('include title = "a;b"', title='a;b')
+    assert not accepts('include title = "a;b"', title='a')
+    assert accepts("include title = 'a;b'; exclude isCharge = 1", title='a;b', isCharge='0')
+    assert not accepts("include title = 'a;b'; exclude isCharge = 1", title='a;b', isCharge='1')
+
+
+def test_unquoted_regex_may_contain_semicolon():
+    rules = 'include title ~ ^(CCTV|广东);?$'
+    assert accepts(rules, title='CCTV;')
+    assert accepts(rules, title='广东')
+    assert not accepts(rules, title='CCTV-1')
+
+
+def test_quoted_regex_keeps_backslashes():
+    assert accepts(r'include title ~ "^CCTV-\d+\"$"', title='CCTV-5"')
+    assert not accepts(r'include title ~ "^CCTV-\d+\"$"', title='CCTV-5')
+
+
+def test_comments_and_newlines():
+    rules = "# it's a comment; include title = x\nexclude title ~ 购物|导视\n\ninclude channelnum < 1000"
+    assert ChannelFilter.split_rules(rules)[0] == "# it's a comment; include title = x"
+    assert accepts(rules, title='CCTV-1', channelnum='1')
+    assert not accepts(rules, title='家有购物', channelnum='1')
+
+
+@pytest.mark.parametrize('rules', ['include title = "abc', 'include title = "a" b', 'keep title = a'])
+def test_invalid_rules_raise(rules):
+    with pytest.raises(ValueError):
+        ChannelFilter(rules)
+
+
+def test_phychannel_rules_drop_only_matching_variants():
+    channel = {'title': 'CCTV-1', 'phychannels': [{'bitrateType': '4'}, {'bitrateType': '2'}]}
+    rule = ChannelFilter('include bitrateType in 4,10')
+    assert rule.filter_phychannels(channel)['phychannels'] == [{'bitrateType': '4'}]
+    assert ChannelFilter('include bitrateType = 10').filter_phychannels(channel) is None
@@ -0,0 +1,56 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from iptv_json_cmcc import CatchupResolver, IPTV2M3U
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATCHUP_HOSTS = {'ZTE': '183.59.160.61:554', 'HW': '183.59.156.166:554'}
+
+
+def load(source):
+    converter = IPTV2M3U()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert converter.load_json(source)
+    return converter
+
+
+def render(converter, path, **options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert converter.generate_m3u(str(path), catchup=CatchupResolver(CATCHUP_HOSTS), **options)
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('source', ['getAllChannel.json', 'getAllChannel2.json'])
+@pytest.mark.parametrize('options', [
+    {},
+    {'use_zte': False, 'use_hw': True},
+    {'use_hw': True, 'multi_quality': True},
+])
+def test_csv_round_trip_keeps_m3u_and_catchup(tmp_path, source, options):
+    from_json = load(os.path.join(ROOT, source))
+    csv_file = tmp_path / 'channels.csv'
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert from_json.generate_csv(str(csv_file))
+    from_csv = load(str(csv_file))
+
+    expected = render(from_json, tmp_path / 'json.m3u', **options)
+    actual = render(from_csv, tmp_path / 'csv.m3u', **options)
+    assert 'catchup-source=' in expected
+    assert actual == expected
+
+
+def test_csv_without_catchup_columns_still_loads(tmp_path):
+    csv_file = tmp_path / 'old.csv'
+    csv_file.write_text(
+        'code,title,channelnum,hwurl,zteurl,bitrateType,bitrateTypeName,hwmediaid,ztecode,icon\n'
+        '1,CCTV-1,1,rtp://239.10.0.1:1025,rtp://239.20.0.1:2000,4,高清,100,ch1,\n',
+        encoding='utf-8-sig'
+    )
+    converter = load(str(csv_file))
+    (entry,) = converter.iter_entries(catchup=CatchupResolver(CATCHUP_HOSTS))
+    assert entry.stream_url == 'rtp://239.20.0.1:2000'
+    assert entry.catchup is None
@@ -0,0 +1,76 @@
+import copy
+import os
+
+from iptv_diff import diff_channels, load_channels, main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SD = {'zteurl': 'rtp://239.20.0.192:2182', 'hwurl': 'rtp://239.10.0.202:1025'}
+HD = {'zteurl': 'rtp://239.20.0.104:2006', 'hwurl': 'rtp://239.10.0.114:1025'}
+
+# getAllChannel2.json格式：每个物理频道有code和画质代码
+STRUCTURED = [{
+    'code': 'cctv1', 'title': 'CCTV-1综合', 'channelnum': '1', 'params': {},
+    'phychannels': [
+        {'code': 'PhysicalChannel_889', 'bitrateType': '4', 'bitrateTypeName': '高清', 'params': dict(HD)},
+        {'code': 'PhysicalChannel_33', 'bitrateType': '2', 'bitrateTypeName': '标清', 'params': dict(SD)},
+    ]
+}]
+# getAllChannel.json格式整理后：一个没有code和画质代码的物理频道
+FLAT = [{
+    'code': 'cctv1', 'title': 'CCTV-1综合', 'channelnum': '1', 'params': dict(SD),
+    'phychannels': [{'bitrateType': '', 'bitrateTypeName': '', 'params': dict(SD)}]
+}]
+
+
+def test_format_switch_matches_variants_by_address():
+    report = diff_channels(FLAT, STRUCTURED)
+    # 只有旧格式没有的高清画质算新增，标清画质按组播地址配对
+    assert [item['phychannel_code'] for item in report['variants_added']] == ['PhysicalChannel_889']
+    assert report['variants_removed'] == []
+    assert report['streams_moved'] == []
+    reverse = diff_channels(STRUCTURED, FLAT)
+    assert [item['phychannel_code'] for item in reverse['variants_removed']] == ['PhysicalChannel_889']
+    assert reverse['variants_added'] == []
+
+
+def test_stream_moved_under_same_code():
+    new = copy.deepcopy(STRUCTURED)
+    new[0]['phychannels'][0]['params']['zteurl'] = 'rtp://239.20.0.105:2006'
+    report = diff_channels(STRUCTURED, new)
+    assert [(item['phychannel_code'], item['field']) for item in report['streams_moved']] == [
+        ('PhysicalChannel_889', 'zteurl')]
+    assert report['variants_added'] == report['variants_removed'] == []
+
+
+def test_stream_moved_without_codes_matches_by_bitrate_type():
+    new = copy.deepcopy(FLAT)
+    new[0]['phychannels'][0]['params'] = dict(HD)
+    report = diff_channels(FLAT, new)
+    assert sorted(item['field'] for item in report['streams_moved']) == ['hwurl', 'zteurl']
+    assert report['variants_added'] == report['variants_removed'] == []
+
+
+def test_recoded_variant_matches_by_address():
+    # 物理频道code变化但组播地址不变，不算删除再新增
+    new = copy.deepcopy(STRUCTURED)
+    new[0]['phychannels'][1]['code'] = '02000000000000060000000000000033'
+    report = diff_channels(STRUCTURED, new)
+    assert report['summary']['variants_added'] == report['summary']['variants_removed'] == 0
+    assert report['streams_moved'] == []
+
+
+def test_sample_files_do_not_report_removed_variants():
+    old_channels = load_channels(os.path.join(ROOT, 'getAllChannel.json'))
+    new_channels = load_channels(os.path.join(ROOT, 'getAllChannel2.json'))
+    summary = diff_channels(old_channels, new_channels)['summary']
+    assert summary['channels_added'] == summary['channels_removed'] == 0
+    assert summary['variants_removed'] == 0
+    # getAllChannel.json每个频道只有一个物理频道，新增的是它没有的其余画质
+    variants = sum(len(channel['phychannels']) for channel in new_channels)
+    assert summary['variants_added'] == variants - len(old_channels)
+
+
+def test_same_file_exits_zero(capsys):
+    source = os.path.join(ROOT, 'getAllChannel2.json')
+    assert main([source, source, '--no-cache']) == 0
+    assert '新增画质 0 个，删除画质 0 个' in capsys.readouterr().out
@@ -0,0 +1,119 @@
+import copy
+
+import iptv_json_cmcc
+from iptv_json_cmcc import FAILOVER_MAX_ALTERNATES, IPTV2M3U
+
+UDP_PROXY = '192.168.1.1:4022'
+
+
+def phychannel(number, bitrate_type, name, zte=True, hw=True):
+    params = {}
+    if zte:
+        params['zteurl'] = f'rtp://239.20.0.{number}:800{number}'
+    if hw:
+        params['hwurl'] = f'rtp://239.10.0.{number}:900{number}'
+    return {'code': f'PhysicalChannel_{number}', 'bitrateType': bitrate_type, 'bitrateTypeName': name, 'params': params}
+
+
+CHANNEL = {
+    'code': 'ch1',
+    'title': 'CCTV-1综合',
+    'channelnum': '1',
+    'params': {},
+    'phychannels': [phychannel(1, '2', '标清'), phychannel(2, '4', '高清'), phychannel(3, '10', '4K')]
+}
+
+
+def make_converter(channel=CHANNEL):
+    converter = IPTV2M3U()
+    converter.quiet = True
+    converter.channels = [copy.deepcopy(channel)]
+    return converter
+
+
+def entries(channel=CHANNEL, **options):
+    return list(make_converter(channel).iter_entries(failover=True, **options))
+
+
+def test_alternates_start_with_other_vendor_then_other_qualities():
+    [entry] = entries()
+    assert entry.stream_url == 'rtp://239.20.0.2:8002'
+    # 同一物理频道的华为平面在前，其余画质按画质偏好排列，每个物理频道内同样先中兴后华为
+    assert entry.alternates == (
+        ('rtp://239.10.0.2:9002', '高清'),
+        ('rtp://239.20.0.1:8001', '标清'),
+        ('rtp://239.10.0.1:9001', '标清'),
+    )
+
+
+def test_hw_primary_falls_back_to_zte_plane():
+    [entry] = entries(use_zte=False, use_hw=True)
+    assert entry.stream_url == 'rtp://239.10.0.2:9002'
+    assert entry.alternates[0] == ('rtp://239.20.0.2:8002', '高清')
+    assert entry.alternates[1:] == (('rtp://239.10.0.1:9001', '标清'), ('rtp://239.20.0.1:8001', '标清'))
+
+
+def test_missing_plane_uses_fallback_url_without_duplicates():
+    channel = copy.deepcopy(CHANNEL)
+    del channel['phychannels'][1]['params']['zteurl']
+    [entry] = entries(channel)
+    # 高清只有华为地址：主地址使用后备地址，备用地址中不再重复出现
+    assert entry.stream_url == 'rtp://239.10.0.2:9002'
+    urls = [url for url, _ in entry.alternates]
+    assert entry.stream_url not in urls
+    assert len(set(urls)) == len(urls)
+    assert urls[0] == 'rtp://239.20.0.1:8001'
+
+
+def test_multi_quality_alternates_only_other_vendor():
+    result = entries(multi_quality=True)
+    assert [(entry.quality, entry.alternates) for entry in result] == [
+        ('高清', (('rtp://239.10.0.2:9002', '高清'),)),
+        ('标清', (('rtp://239.10.0.1:9001', '标清'),)),
+        ('4K', (('rtp://239.10.0.3:9003', '4K'),)),
+    ]
+
+
+def test_alternates_capped(monkeypatch):
+    [entry] = entries()
+    # 三个物理频道共有5个备用地址
+    assert len(entry.alternates) == FAILOVER_MAX_ALTERNATES
+    monkeypatch.setattr(iptv_json_cmcc, 'FAILOVER_MAX_ALTERNATES', 1)
+    [entry] = entries()
+    assert entry.alternates == (('rtp://239.10.0.2:9002', '高清'),)
+
+
+def test_without_failover_no_alternates():
+    [entry] = make_converter().iter_entries()
+    assert entry.alternates == ()
+
+
+def test_alternates_rewritten_for_udp_proxy():
+    [entry] = entries(udp_proxy=UDP_PROXY)
+    assert entry.stream_url == f'http://{UDP_PROXY}/rtp/239.20.0.2:8002'
+    assert [url for url, _ in entry.alternates] == [
+        f'http://{UDP_PROXY}/rtp/239.10.0.2:9002',
+        f'http://{UDP_PROXY}/rtp/239.20.0.1:8001',
+        f'http://{UDP_PROXY}/rtp/239.10.0.1:9001',
+    ]
+
+
+def test_diyp_appends_alternates_with_quality(tmp_path):
+    output_file = tmp_path / 'out.txt'
+    assert make_converter().generate_diyp(str(output_file), failover=True)
+    lines = output_file.read_text(encoding='utf-8').splitlines()
+    assert ('CCTV-1综合,rtp://239.20.0.2:8002$高清'
+            '#rtp://239.10.0.2:9002$高清#rtp://239.20.0.1:8001$标清#rtp://239.10.0.1:9001$标清') in lines
+
+
+def test_m3u_repeats_extinf_for_each_alternate(tmp_path):
+    output_file = tmp_path / 'out.m3u'
+    assert make_converter().generate_m3u(str(output_file), failover=True)
+    lines = output_file.read_text(encoding='utf-8').splitlines()
+    extinf = [line for line in lines if line.startswith('#EXTINF')]
+    # 每个备用地址前重复相同的EXTINF行，播放器会将其视为同一频道的多个源
+    assert len(extinf) == 1 + FAILOVER_MAX_ALTERNATES
+    assert len(set(extinf)) == 1
+    assert extinf[0].endswith(',CCTV-1综合 (高清)')
+    urls = [lines[index + 1] for index, line in enumerate(lines) if line.startswith('#EXTINF')]
+    assert urls == ['rtp://239.20.0.2:8002', 'rtp://239.10.0.2:9002', 'rtp://239.20.0.1:8001', 'rtp://239.10.0.1:9001']
@@ -0,0 +1,66 @@
+import pytest
+
+from iptv_hls import HLSSegmenter
+from iptv_simulator import DATAGRAM_PAYLOAD, PTS_CLOCK, LineupSimulator, synthetic_ts
+from iptv_stream import TSAnalyzer
+
+JUMP = 3600 * PTS_CLOCK
+
+
+@pytest.fixture(scope='module')
+def sd_loop():
+    # 每秒一个关键帧
+    return synthetic_ts(720, 576, 2500, 'h264', 2)
+
+
+def shifted(loop, shift):
+    """把循环TS中的PCR/PTS平移shift（90kHz），与模拟器循环发送时的处理相同"""
+    data = bytearray(loop.data)
+    view = memoryview(data)
+    for index, stamps in enumerate(loop.timestamps):
+        if stamps and shift:
+            LineupSimulator._shift_timestamps(LineupSimulator, view[index * DATAGRAM_PAYLOAD:], stamps, shift)
+    return bytes(data)
+
+
+def feed(segmenter, data):
+    # 与接收组播时一样按数据报送入
+    for position in range(0, len(data), DATAGRAM_PAYLOAD):
+        segmenter.feed(data[position:position + DATAGRAM_PAYLOAD])
+
+
+def stream(loop, loops, offset=0):
+    return b''.join(shifted(loop, offset + index * loop.duration * PTS_CLOCK) for index in range(loops))
+
+
+def test_steady_stream_cut_every_two_seconds(sd_loop):
+    segmenter = HLSSegmenter(target_duration=2.0)
+    feed(segmenter, stream(sd_loop, 5))
+    # 10秒的流，最后一个分片要等到下一个关键帧才结束
+    assert [sequence for sequence, _, _, _ in segmenter.segments] == [0, 1, 2, 3]
+    assert all(duration == pytest.approx(2.0) for _, duration, _, _ in segmenter.segments)
+    assert not any(discontinuity for _, _, _, discontinuity in segmenter.segments)
+    assert b'#EXT-X-DISCONTINUITY' not in segmenter.playlist
+    assert b'#EXT-X-TARGETDURATION:2\n' in segmenter.playlist
+
+    analyzer = TSAnalyzer()
+    analyzer.feed(segmenter.segment(1))
+    # 每个分片以PAT/PMT开头，可以单独解码
+    assert analyzer.video_codec == 'H.264'
+    assert (analyzer.width, analyzer.height) == (720, 576)
+    assert analyzer.cc_errors == 0
+
+
+def test_discontinuity_marks_segment_after_jump(sd_loop):
+    segmenter = HLSSegmenter(target_duration=2.0)
+    feed(segmenter, stream(sd_loop, 2))
+    feed(segmenter, stream(sd_loop, 3, JUMP))
+    segments = [(duration, discontinuity) for _, duration, _, discontinuity in segmenter.segments]
+    # 首个关键帧随PID探测丢弃，分片从1.1秒的关键帧开始：0.ts为1.1~3.1秒，
+    # 1.ts在4.1秒的跳变处结束，不带标记；2.ts从跳变处开始，带不连续标记
+    assert segments[0] == (pytest.approx(2.0), False)
+    assert segments[1] == (pytest.approx(1.0), False)
+    assert segments[2] == (pytest.approx(2.0), True)
+    assert [discontinuity for _, discontinuity in segments].count(True) == 1
+    lines = segmenter.playlist.decode('ascii').splitlines()
+    assert lines[lines.index('#EXT-X-DISCONTINUITY') + 2] == '2.ts'
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from iptv_logstats import aggregate_channels, build_address_index, load_options, main, scan_logs
+
+OPTIONS = {'use_zte': True, 'use_hw': False, 'quality_preference': 'high', 'udp_proxy': '', 'multi_quality': False}
+
+
+def phychannel(bitrate_type, name, zteurl, hwurl):
+    return {'bitrateType': bitrate_type, 'bitrateTypeName': name, 'params': {'zteurl': zteurl, 'hwurl': hwurl}}
+
+
+# 综合和高清频道共用高清组播，综合频道另有标清组播；广东卫视单独使用一个组播
+LINEUP = {'channels': [
+    {'code': 'cctv1', 'title': 'CCTV-1综合', 'channelnum': '1', 'phychannels': [
+        phychannel('2', '标清', 'rtp://239.20.0.192:2182', 'rtp://239.10.0.202:1025'),
+        phychannel('4', '高清', 'rtp://239.20.0.104:2006', 'rtp://239.10.0.114:1025'),
+    ]},
+    {'code': 'cctv1hd', 'title': 'CCTV-1高清', 'channelnum': '2', 'phychannels': [
+        phychannel('4', '高清', 'rtp://239.20.0.104:2006', 'rtp://239.10.0.114:1025'),
+    ]},
+    {'code': 'gdws', 'title': '广东卫视', 'channelnum': '3', 'phychannels': [
+        phychannel('4', '高清', 'rtp://239.20.0.101:2000', 'rtp://239.10.0.101:1025'),
+    ]},
+]}
+
+LOG_LINES = [
+    ('10.0.0.1', '239.20.0.104:2006', 1000),
+    ('10.0.0.2', '239.20.0.104:2006', 1000),
+    ('10.0.0.1', '239.20.0.192:2182', 500),
+    ('10.0.0.3', '239.20.0.101:2000', 300),
+    ('10.0.0.3', '239.10.0.101:1025', 200),
+    ('10.0.0.4', '239.99.0.1:1234', 100),
+]
+
+
+@pytest.fixture
+def lineup(tmp_path):
+    path = tmp_path / 'lineup.json'
+    path.write_text(json.dumps(LINEUP, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def access_log(tmp_path):
+    path = tmp_path / 'access.log'
+    path.write_text(''.join(
+        f'{client} - - [19/Oct/2026:07:00:00 +0800] "GET /rtp/{address} HTTP/1.1" 200 {size}\n'
+        for client, address, size in LOG_LINES), encoding='ascii')
+    return str(path)
+
+
+def aggregate(lineup, access_log, options):
+    index, channels = build_address_index(lineup, options)
+    stats, _ = scan_logs([access_log])
+    channel_stats, unmatched, shared = aggregate_channels(stats, index, channels)
+    return {item['code']: item for item in channel_stats}, unmatched, shared
+
+
+def test_shared_address_is_not_double_counted(lineup, access_log):
+    channels, unmatched, shared = aggregate(lineup, access_log, OPTIONS)
+    # 两个频道都输出了239.20.0.104:2006，无法确定归属
+    assert [item['address'] for item in shared] == ['239.20.0.104:2006']
+    assert {channel['code'] for channel in shared[0]['channels']} == {'cctv1', 'cctv1hd'}
+    assert shared[0]['sessions'] == 2
+    # 综合频道只计入只属于它的标清地址
+    assert channels['cctv1']['sessions'] == 1
+    assert channels['cctv1']['shared_sessions'] == 2
+    assert channels['cctv1hd']['sessions'] == 0
+    assert [item['address'] for item in unmatched] == ['239.99.0.1:1234']
+    total = sum(item['sessions'] for item in channels.values()) + sum(item['sessions'] for item in shared)
+    assert total + unmatched[0]['sessions'] == len(LOG_LINES)
+
+
+def test_unselected_variant_still_attributed_to_its_channel(lineup, access_log):
+    channels, _, _ = aggregate(lineup, access_log, OPTIONS)
+    # 标清地址只被综合频道引用，HW地址虽未被选中也只属于广东卫视
+    assert channels['cctv1']['bytes'] == 500
+    assert channels['gdws']['sessions'] == 2
+    assert channels['gdws']['viewers'] == 1
+
+
+def test_selection_attributes_address_to_emitting_channel(lineup, access_log):
+    # 标清优先时综合频道输出标清地址，高清组播只由高清频道输出
+    channels, _, shared = aggregate(lineup, access_log, dict(OPTIONS, quality_preference='standard'))
+    assert shared == []
+    assert channels['cctv1hd']['sessions'] == 2
+    assert channels['cctv1hd']['viewers'] == 2
+    assert channels['cctv1']['sessions'] == 1
+
+
+def test_without_selection_every_shared_reference_is_reported(lineup, access_log):
+    channels, _, shared = aggregate(lineup, access_log, None)
+    assert [item['address'] for item in shared] == ['239.20.0.104:2006']
+    assert channels['cctv1hd']['sessions'] == 0
+
+
+def test_json_report(lineup, access_log, tmp_path, capsys):
+    report_file = tmp_path / 'report.json'
+    assert main([lineup, access_log, '--all-addresses', '--workers', '1', '--json', str(report_file)]) == 0
+    report = json.loads(report_file.read_text(encoding='utf-8'))
+    assert [item['address'] for item in report['shared']] == ['239.20.0.104:2006']
+    assert '共用地址 1 个' in capsys.readouterr().out
+
+
+def test_load_options_from_preset(tmp_path):
+    presets_file = tmp_path / 'presets.json'
+    presets_file.write_text(json.dumps({'presets': {'hw': {
+        'stream_type': 'HW', 'quality': '标清优先', 'udp_proxy': '192.168.1.1:4022',
+        'merge_m3u': str(tmp_path / 'missing.m3u'), 'catchup_hw_host': '183.59.156.166:554'
+    }}}, ensure_ascii=False), encoding='utf-8')
+    options = load_options('hw', str(presets_file))
+    # 不经过代理，不创建回看和合并对象
+    assert options == {'use_zte': False, 'use_hw': True, 'quality_preference': 'standard', 'udp_proxy': '',
+                       'multi_quality': False, 'failover': False}
+    with pytest.raises(ValueError):
+        load_options('missing', str(presets_file))
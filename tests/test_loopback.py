@@ -0,0 +1,128 @@
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from iptv_dvr import DVRService
+from iptv_probe import analyze_file, probe_stream
+from iptv_simulator import LineupSimulator, SimulatedStream, synthetic_ts
+from iptv_stream import TS_PACKET_SIZE, TSAnalyzer, open_multicast_socket
+from iptv_timeshift import TimeshiftRecorder, TimeshiftRing
+
+IFACE = '127.0.0.1'
+# 每个测试使用不同的端口，同一端口上加入的组播组会收到彼此的数据
+PROBE_ADDRESS = ('239.255.42.1', 5400)
+
+
+@pytest.fixture(scope='module')
+def loopback():
+    """回环接口上不能收发组播时（如部分容器和CI环境）跳过整个模块"""
+    try:
+        receiver = open_multicast_socket(*PROBE_ADDRESS, IFACE)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    except OSError as e:
+        pytest.skip(f"无法在回环接口上加入组播组: {e}")
+    try:
+        receiver.settimeout(1)
+        sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(IFACE))
+        sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sender.sendto(b'\x47' + b'\xff' * (TS_PACKET_SIZE - 1), PROBE_ADDRESS)
+        receiver.recv(TS_PACKET_SIZE)
+    except OSError as e:
+        pytest.skip(f"回环接口上收不到组播: {e}")
+    finally:
+        receiver.close()
+        sender.close()
+
+
+@pytest.fixture(scope='module')
+def sd_loop():
+    return synthetic_ts(720, 576, 2500, 'h264', 1)
+
+
+def simulator(url, synthetic):
+    return LineupSimulator([SimulatedStream(url, '测试频道', synthetic, 0x10001)], IFACE)
+
+
+def send_while(url, synthetic, receiver=None, seconds=2.5):
+    """在回环接口上发送seconds秒模拟流，同时运行接收协程（如果有），返回接收协程的结果"""
+    sender = simulator(url, synthetic)
+
+    async def run():
+        if receiver is None:
+            await sender.run(seconds, stats_interval=0)
+            return None
+        _, result = await asyncio.gather(sender.run(seconds, stats_interval=0), receiver)
+        return result
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        sender.close()
+    assert sender.stats()['send_errors'] == 0
+    return result
+
+
+@pytest.mark.parametrize('url', ['rtp://239.255.42.11:5411', 'udp://@239.255.42.12:5412'])
+def test_simulator_to_probe(loopback, sd_loop, url):
+    result = send_while(url, sd_loop, probe_stream(url, 2.0, IFACE))
+    assert 'error' not in result
+    assert result['cc_errors'] == 0
+    assert result['video_codec'] == 'H.264'
+    assert (result['width'], result['height']) == (720, 576)
+    assert result['bitrate_kbps'] == pytest.approx(2500, rel=0.05)
+    assert result['tier'] == '2'
+
+
+@pytest.mark.parametrize('capacity', [4 * 1024 * 1024, TS_PACKET_SIZE * 7 * 64])
+def test_simulator_to_timeshift_ring(loopback, sd_loop, tmp_path, capacity):
+    url = 'rtp://239.255.42.21:5421'
+    ring = TimeshiftRing(str(tmp_path / 'ring.dat'), capacity)
+    recorder = TimeshiftRecorder(IFACE)
+    channel = recorder.add_channel('test', '测试频道', url, ring)
+    recorder.start()
+    try:
+        send_while(url, sd_loop, seconds=2.0)
+        time.sleep(0.2)
+        assert channel['datagrams'] > 0 and channel['dropped'] == 0
+        oldest = ring.oldest()
+        data = ring.read(oldest, ring.written - oldest)
+        assert ring.offset_for_time(time.time() - 60) == oldest
+    finally:
+        recorder.stop()
+
+    assert len(data) % TS_PACKET_SIZE == 0
+    analyzer = TSAnalyzer()
+    analyzer.feed(data)
+    assert analyzer.sync_losses == analyzer.cc_errors == 0
+    if ring.written > capacity:
+        # 环形文件已回绕，窗口中是最近写入的整数个TS包
+        assert oldest > 0 and len(data) == ring.capacity
+    else:
+        assert oldest == 0
+        assert (analyzer.width, analyzer.height) == (720, 576)
+        assert analyzer.pcr_bitrate / 1000 == pytest.approx(2500, rel=0.05)
+
+
+def test_simulator_to_dvr_recording(loopback, sd_loop, tmp_path, capsys):
+    url = 'rtp://239.255.42.31:5431'
+    service = DVRService({'test': ('测试频道', url)}, str(tmp_path), IFACE, min_free_mb=0)
+    start = datetime.now()
+    try:
+        send_while(url, sd_loop, service.record('test', start, start + timedelta(seconds=2)))
+    finally:
+        service._executor.shutdown(wait=True)
+
+    (summary,) = service.finished
+    assert summary['error'] is None
+    assert summary['dropped_bytes'] == summary['invalid_datagrams'] == 0
+    (path,) = summary['files']
+    assert os.path.getsize(path) == summary['bytes'] > 0
+    result = analyze_file(path)
+    assert result['cc_errors'] == result['sync_losses'] == 0
+    assert (result['width'], result['height']) == (720, 576)
+    assert result['tier'] == '2'
+    assert '录制结束: 测试频道' in capsys.readouterr().out
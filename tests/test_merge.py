@@ -0,0 +1,99 @@
+import contextlib
+import io
+
+import pytest
+
+from iptv_json_cmcc import IPTV2M3U, M3UMerge
+
+CHANNELS = [{
+    'code': '02000000000000050000000000000055',
+    'title': 'CCTV-1综合',
+    'channelnum': '100',
+    'params': {},
+    'phychannels': [{
+        'bitrateType': '4',
+        'bitrateTypeName': '高清',
+        'params': {'zteurl': 'rtp://239.20.0.104:2006', 'hwurl': 'rtp://239.10.0.114:1025'}
+    }]
+}]
+
+EXTERNAL = '''#EXTM3U
+#EXTINF:-1 tvg-id="cctv1" tvg-name="CCTV1综合",CCTV-1 综合 HD
+http://example.com/cctv1.m3u8
+#EXTINF:-1 tvg-id="news" group-title="Other",Some News
+http://example.com/news.m3u8
+'''
+
+
+@pytest.fixture
+def converter():
+    converter = IPTV2M3U()
+    converter.channels = [dict(channel) for channel in CHANNELS]
+    return converter
+
+
+@pytest.fixture
+def external(tmp_path):
+    path = tmp_path / 'external.m3u'
+    path.write_text(EXTERNAL, encoding='utf-8')
+    return str(path)
+
+
+def generate(converter, method, path, merge):
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert getattr(converter, method)(str(path), merge=merge)
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_unmatched_entry_keeps_group_and_title(converter, external, tmp_path):
+    merge = M3UMerge(external, 'both')
+    output = generate(converter, 'generate_m3u', tmp_path / 'out.m3u', merge)
+    assert 'group-title="IPTV",CCTV-1综合 (高清)\nrtp://239.20.0.104:2006\n' in output
+    assert 'group-title="IPTV",CCTV-1综合 (外部源)\nhttp://example.com/cctv1.m3u8\n' in output
+    assert 'tvg-id="news" tvg-name="Some News" group-title="Other",Some News\nhttp://example.com/news.m3u8\n' in output
+
+
+def test_unmatched_entry_starts_diyp_genre(converter, external, tmp_path):
+    output = generate(converter, 'generate_diyp', tmp_path / 'out.txt', M3UMerge(external, 'cmcc'))
+    assert output.splitlines() == [
+        'IPTV频道,#genre#',
+        'CCTV-1综合,rtp://239.20.0.104:2006$高清',
+        'Other,#genre#',
+        'Some News,http://example.com/news.m3u8',
+    ]
+
+
+@pytest.mark.parametrize('method, name', [
+    ('generate_m3u', 'out.m3u'),
+    ('generate_diyp', 'out.txt'),
+    ('generate_sharded', 'index.m3u'),
+])
+def test_generators_close_spool(converter, external, tmp_path, method, name):
+    merge = M3UMerge(external, 'cmcc')
+    generate(converter, method, tmp_path / name, merge)
+    assert merge._spool is None
+    # 关闭后再次生成会重新读取外部文件
+    assert 'Some News' in generate(converter, 'generate_m3u', tmp_path / 'again.m3u', merge)
+
+
+def test_spool_closed_when_generation_fails(converter, external, tmp_path):
+    merge = M3UMerge(external, 'cmcc')
+    spools = []
+
+    def progress(current, total):
+        spools.append(merge._spool)
+        raise RuntimeError('写入失败')
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        assert not converter.generate_m3u(str(tmp_path / 'out.m3u'), progress_callback=progress, merge=merge)
+    assert spools[0] is not None
+    assert merge._spool is None
+
+
+def test_context_manager_closes(converter, external):
+    with M3UMerge(external) as merge:
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert merge.prepare(converter.channels) == 1
+        assert merge._spool is not None
+    assert merge._spool is None
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from iptv_json_cmcc import PreviewPipeline, ProxyRing, load_converter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPTIONS = {'use_zte': True, 'use_hw': False, 'quality_preference': 'high', 'udp_proxy': '', 'multi_quality': False,
+           'failover': False, 'merge': None}
+PROXIES = '192.168.1.1:4022,192.168.1.2:4022'
+
+
+@pytest.fixture(scope='module')
+def converter():
+    return load_converter(os.path.join(ROOT, 'getAllChannel2.json'))
+
+
+@pytest.fixture
+def pipeline(converter, monkeypatch):
+    pipeline = PreviewPipeline(converter, 'getAllChannel2.json')
+    # 记录流选择阶段的运行次数
+    pipeline.select_count = 0
+    select = pipeline._select
+
+    def counted(options):
+        pipeline.select_count += 1
+        return select(options)
+
+    monkeypatch.setattr(pipeline, '_select', counted)
+    return pipeline
+
+
+def options(**changes):
+    return dict(OPTIONS, **changes)
+
+
+def expected_rows(converter, **changes):
+    return [(entry.channel.get('channelnum', ''), entry.channel.get('title', 'Unknown'), entry.quality, entry.stream_url)
+            for entry in converter.iter_entries(**options(**changes))]
+
+
+def test_proxy_change_reuses_selection_and_hash_points(pipeline, monkeypatch):
+    assert pipeline.update(options()) == 'select'
+    selected = pipeline._selections[pipeline._selection_key][0]
+    assert pipeline.update(options()) is None
+
+    assert pipeline.update(options(udp_proxy=PROXIES)) == 'proxy'
+    selected_after, points = pipeline._selections[pipeline._selection_key]
+    assert selected_after is selected
+    assert points is not None
+    assert pipeline.select_count == 1
+
+    # 换一组代理时组播地址在环上的位置已经算好，不再计算哈希
+    def fail(url):
+        raise AssertionError(f"重新计算了哈希: {url}")
+
+    monkeypatch.setattr(ProxyRing, 'address_hash', fail)
+    assert pipeline.update(options(udp_proxy='192.168.1.3:4022*2,192.168.1.4:4022')) == 'proxy'
+    assert pipeline._selections[pipeline._selection_key][1] is points
+    assert pipeline.update(options(udp_proxy='192.168.1.3:4022')) == 'proxy'
+    assert pipeline.select_count == 1
+
+
+def test_quality_change_reselects(pipeline):
+    assert pipeline.update(options()) == 'select'
+    assert pipeline.update(options(quality_preference='standard')) == 'select'
+    assert pipeline.update(options(quality_preference='standard', multi_quality=True)) == 'select'
+    assert pipeline.select_count == 3
+
+
+def test_switching_back_served_from_cache(pipeline, converter):
+    pipeline.update(options())
+    high_rows = pipeline.rows
+    pipeline.update(options(quality_preference='standard'))
+    assert pipeline.rows != high_rows
+    assert pipeline.update(options()) == 'select'
+    assert pipeline.select_count == 2
+    assert pipeline.rows == high_rows
+
+
+def test_invalid_proxy_keeps_rows(pipeline):
+    pipeline.update(options())
+    rows = pipeline.rows
+    with pytest.raises(ValueError):
+        pipeline.update(options(udp_proxy='192.168.1.1:4022*x'))
+    assert pipeline.rows == rows
+
+
+@pytest.mark.parametrize('changes', [
+    {},
+    {'udp_proxy': '192.168.1.1:4022'},
+    {'udp_proxy': PROXIES},
+    {'use_zte': False, 'use_hw': True, 'quality_preference': 'standard'},
+    {'multi_quality': True, 'udp_proxy': PROXIES},
+    {'failover': True, 'udp_proxy': PROXIES},
+])
+def test_rows_match_iter_entries(pipeline, converter, changes):
+    pipeline.update(options(**changes))
+    assert pipeline.rows == expected_rows(converter, **changes)
+    # 由其他选项切换而来（使用缓存的选择结果和哈希位置）时结果相同
+    pipeline.update(options(quality_preference='any'))
+    pipeline.update(options(**changes))
+    assert pipeline.rows == expected_rows(converter, **changes)
@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+from iptv_json_cmcc import IPTV2M3U
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+HW_UNICAST = ('rtsp://183.59.156.166:554/PLTV/88888888/224/10000100000000050000000000095678/'
+              '10000100000000060000000000130001.smil')
+
+
+def phychannel(bitrate_type='', name='', fallback=None, **params):
+    result = {'bitrateType': bitrate_type, 'bitrateTypeName': name, 'params': params}
+    if fallback:
+        # rtsp单播地址不会被自动选作后备地址，需要显式给出
+        result['fallbackUrl'] = fallback
+    return result
+
+
+# 与各测试文件内容相同的getAllChannel2.json格式文档
+EQUIVALENT = {
+    'huawei_epg.json': [
+        {'code': '10000100000000050000000000088734', 'title': 'CCTV-1高清', 'channelnum': '1',
+         'icon': 'http://183.59.156.166/logo/cctv1.png', 'timeshiftAvailable': 'true', 'lookbackAvailable': 'true',
+         'phychannels': [phychannel('4', hwurl='rtp://239.10.0.114:1025', hwcode='10000100000000050000000000088734')]},
+        {'code': '10000100000000050000000000091234', 'title': 'CCTV-4K超高清', 'channelnum': '101',
+         'timeshiftAvailable': 'false', 'lookbackAvailable': 'false',
+         'phychannels': [phychannel('10', hwurl='rtp://239.10.0.250:1025', hwcode='10000100000000050000000000091234')]},
+        {'code': '10000100000000050000000000095678', 'title': '广东综艺', 'channelnum': '205',
+         'icon': 'http://183.59.156.166/logo/gdzy.png', 'timeshiftAvailable': 'false', 'lookbackAvailable': 'false',
+         'phychannels': [phychannel(fallback=HW_UNICAST, unicasturl=HW_UNICAST)]},
+    ],
+    'simple_list.json': [
+        {'code': 'cctv1', 'title': 'CCTV-1', 'channelnum': '1', 'icon': 'http://example.com/logo/cctv1.png',
+         'group': '央视', 'phychannels': [phychannel(url='http://example.com/live/cctv1.m3u8')]},
+        {'code': 'gdws', 'title': '广东卫视', 'channelnum': '20',
+         'phychannels': [phychannel(url='rtp://239.20.0.101:2000')]},
+        {'code': '本地新闻', 'title': '本地新闻', 'channelnum': '',
+         'phychannels': [phychannel(fallback='rtsp://192.168.1.10:554/news', url='rtsp://192.168.1.10:554/news')]},
+    ],
+    'flat.json': [
+        {'code': '02000000000000050000000000000055', 'title': 'CCTV-1综合', 'channelnum': '1',
+         'phychannels': [phychannel('4', '高清', zteurl='rtp://239.20.0.104:2006', hwurl='rtp://239.10.0.114:1025')]},
+        {'code': '02000000000000050000000000000101', 'title': '广东卫视', 'channelnum': '20',
+         'phychannels': [phychannel('2', hwurl='rtp://239.10.0.101:1025')]},
+        {'code': '02000000000000050000000000000300', 'title': '测试频道', 'channelnum': '300',
+         'phychannels': [phychannel(liveurl='http://example.com/live/test.m3u8')]},
+    ],
+}
+
+
+def load(path):
+    converter = IPTV2M3U()
+    converter.quiet = True
+    assert converter.load_json(str(path))
+    return converter
+
+
+def summary(converter, **options):
+    return [(entry.channel.get('code'), entry.channel.get('title'), entry.channel.get('channelnum'),
+             entry.channel.get('icon', ''), entry.channel.get('group', ''), entry.stream_url, entry.quality)
+            for entry in converter.iter_entries(**options)]
+
+
+@pytest.mark.parametrize('fixture, schema', [
+    ('huawei_epg.json', 'huawei_epg'),
+    ('simple_list.json', 'simple_list'),
+    ('flat.json', 'flat'),
+])
+def test_adapter_detected(fixture, schema):
+    assert load(os.path.join(FIXTURES, fixture)).schema == schema
+
+
+@pytest.mark.parametrize('fixture', sorted(EQUIVALENT))
+@pytest.mark.parametrize('options', [{}, {'use_zte': False, 'use_hw': True}, {'use_hw': True}])
+def test_adapter_gives_same_model_as_phychannels_document(fixture, options, tmp_path):
+    native_file = tmp_path / 'native.json'
+    native_file.write_text(json.dumps({'channels': EQUIVALENT[fixture]}, ensure_ascii=False), encoding='utf-8')
+    native = load(native_file)
+    assert native.schema == 'phychannels'
+    adapted = load(os.path.join(FIXTURES, fixture))
+
+    assert [len(channel['phychannels']) for channel in adapted.channels] == [1] * len(EQUIVALENT[fixture])
+    assert summary(adapted, **options) == summary(native, **options)
+
+
+def test_huawei_multicast_is_hw_stream_and_unicast_is_fallback():
+    channels = load(os.path.join(FIXTURES, 'huawei_epg.json')).channels
+    params = channels[0]['phychannels'][0]['params']
+    assert params['hwurl'] == 'rtp://239.10.0.114:1025'
+    assert params['unicasturl'].startswith('rtsp://')
+    assert channels[0]['phychannels'][0]['fallbackUrl'] == 'rtp://239.10.0.114:1025'
+    assert channels[2]['phychannels'][0]['fallbackUrl'] == HW_UNICAST
+    assert [channel['timeshiftAvailable'] for channel in channels] == ['true', 'false', 'false']
+
+
+def test_flat_channel_fields_are_params():
+    channel = load(os.path.join(FIXTURES, 'flat.json')).channels[0]
+    assert channel['phychannels'][0]['params']['zteurl'] == 'rtp://239.20.0.104:2006'
+    assert 'phychannels' not in channel['phychannels'][0]['params']
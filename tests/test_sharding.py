@@ -0,0 +1,60 @@
+import os
+import threading
+
+import pytest
+
+from iptv_json_cmcc import IPTV2M3U, JobCancelled, write_sharded_playlist
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def channels():
+    converter = IPTV2M3U()
+    converter.quiet = True
+    assert converter.load_json(os.path.join(ROOT, 'getAllChannel2.json'))
+    converter.normalize()
+    return converter.channels
+
+
+@pytest.fixture
+def converter(channels):
+    converter = IPTV2M3U()
+    converter.quiet = True
+    converter.channels = channels
+    return converter
+
+
+@pytest.mark.parametrize('shard_by', ['group', 'count'])
+def test_sharded_output_has_index_and_shards(converter, tmp_path, shard_by):
+    output_file = tmp_path / 'index.m3u'
+    assert converter.generate_sharded(str(output_file), 'M3U', shard_by, 50)
+    index = output_file.read_text(encoding='utf-8')
+    shards = sorted(path.name for path in tmp_path.iterdir() if path != output_file)
+    assert len(shards) > 1
+    assert all(name in index for name in shards)
+
+
+@pytest.mark.parametrize('shard_by', ['group', 'count'])
+def test_cancelled_sharding_removes_written_shards(converter, tmp_path, shard_by):
+    cancel_event = threading.Event()
+    converter.cancel_event = cancel_event
+
+    def progress(current, total):
+        # 已经写入了几个分片后取消
+        if current == total // 2:
+            cancel_event.set()
+
+    with pytest.raises(JobCancelled):
+        converter.generate_sharded(str(tmp_path / 'index.m3u'), 'M3U', shard_by, 50, progress_callback=progress)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_sharding_removes_written_shards(converter, tmp_path):
+    def entries():
+        yield from converter.iter_entries()
+        raise OSError('读取失败')
+
+    with pytest.raises(OSError):
+        write_sharded_playlist(entries(), str(tmp_path / 'index.txt'), 'diyp', 'count', 50)
+    assert list(tmp_path.iterdir()) == []
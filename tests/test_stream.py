@@ -0,0 +1,113 @@
+import struct
+
+import pytest
+
+from iptv_probe import analyze_file, measured_tier
+from iptv_simulator import AUDIO_PID, PMT_PID, VIDEO_PID, synthetic_ts
+from iptv_stream import PAT_PID, TS_PACKET_SIZE, TSAnalyzer, parse_stream_address, rtp_payload_range
+
+
+@pytest.fixture(scope='module')
+def hd_ts():
+    return synthetic_ts(1920, 1080, 8000, 'h264').data
+
+
+def packets(data):
+    return [data[position:position + TS_PACKET_SIZE] for position in range(0, len(data), TS_PACKET_SIZE)]
+
+
+def pid_of(packet):
+    return ((packet[1] & 0x1F) << 8) | packet[2]
+
+
+def analyze(data, chunk_size=None):
+    analyzer = TSAnalyzer()
+    if chunk_size is None:
+        analyzer.feed(data)
+    else:
+        # 块大小不是188的倍数，跨块的包由剩余缓冲拼接
+        for position in range(0, len(data), chunk_size):
+            analyzer.feed(memoryview(data)[position:position + chunk_size])
+    return analyzer
+
+
+@pytest.mark.parametrize('width, height, kbps, codec, name, tier', [
+    (720, 576, 2500, 'h264', 'H.264', '2'),
+    (1920, 1080, 8000, 'h264', 'H.264', '4'),
+    (3840, 2160, 25000, 'h265', 'H.265', '10'),
+])
+def test_codec_resolution_bitrate_and_tier(width, height, kbps, codec, name, tier):
+    analyzer = analyze(synthetic_ts(width, height, kbps, codec).data)
+    summary = analyzer.summary()
+    assert analyzer.video_pid == VIDEO_PID
+    assert summary['video_codec'] == name
+    assert (summary['width'], summary['height']) == (width, height)
+    assert summary['pcr_bitrate_kbps'] == pytest.approx(kbps, rel=0.01)
+    assert summary['cc_errors'] == summary['sync_losses'] == 0
+    assert measured_tier(summary) == tier
+    # 没有分辨率时按码率估计
+    assert measured_tier({'bitrate_kbps': summary['pcr_bitrate_kbps']}) == tier
+
+
+def test_pids_and_stream_types(hd_ts):
+    summary = analyze(hd_ts).summary()
+    pids = summary['pids']
+    assert {int(pid) for pid in pids} >= {PAT_PID, PMT_PID, VIDEO_PID, AUDIO_PID}
+    assert pids[str(VIDEO_PID)]['type'] == 'H.264'
+    assert pids[str(AUDIO_PID)]['type'] == 'AAC'
+    assert sum(item['packets'] for item in pids.values()) == summary['packets'] == len(hd_ts) // TS_PACKET_SIZE
+
+
+def test_odd_chunks_give_same_result(hd_ts):
+    assert analyze(hd_ts, 1000).summary() == analyze(hd_ts).summary()
+
+
+def test_dropped_packets_count_cc_errors(hd_ts):
+    items = packets(hd_ts)
+    video = [index for index, packet in enumerate(items) if pid_of(packet) == VIDEO_PID]
+    # 丢弃两个不相邻的视频包，各产生一个连续计数器错误
+    dropped = {video[100], video[500]}
+    data = b''.join(packet for index, packet in enumerate(items) if index not in dropped)
+    assert analyze(data).cc_errors == 2
+
+
+def test_duplicate_packet_is_not_cc_error(hd_ts):
+    items = packets(hd_ts)
+    index = next(index for index, packet in enumerate(items) if pid_of(packet) == AUDIO_PID)
+    data = b''.join(items[:index + 1] + [items[index]] + items[index + 1:])
+    assert analyze(data).cc_errors == 0
+
+
+def test_garbage_counts_sync_loss(hd_ts):
+    analyzer = analyze(hd_ts[:TS_PACKET_SIZE * 70] + b'\x00' * 50 + hd_ts[TS_PACKET_SIZE * 70:])
+    assert analyzer.sync_losses == 1
+    assert analyzer.packets == len(hd_ts) // TS_PACKET_SIZE
+    assert analyzer.cc_errors == 0
+
+
+def test_rtp_payload_range(hd_ts):
+    payload = hd_ts[:TS_PACKET_SIZE * 7]
+    datagram = struct.pack('>BBHII', 0x80, 33, 1, 0, 0x10000) + payload
+    assert rtp_payload_range(memoryview(datagram)) == (12, len(datagram))
+    assert rtp_payload_range(memoryview(payload)) == (0, len(payload))
+    # 带一个CSRC和扩展头
+    extended = struct.pack('>BBHII', 0x91, 33, 1, 0, 0x10000) + b'\0' * 4 + b'\0\0\0\1' + b'\0' * 4 + payload
+    assert rtp_payload_range(memoryview(extended)) == (24, len(extended))
+    assert rtp_payload_range(memoryview(b'\x00' * 20)) is None
+
+
+def test_analyze_file(hd_ts, tmp_path):
+    path = tmp_path / 'capture.ts'
+    path.write_bytes(hd_ts)
+    result = analyze_file(str(path), chunk_size=TS_PACKET_SIZE * 7 * 3 + 5)
+    assert result['tier'] == '4'
+    assert result['bitrate_kbps'] == pytest.approx(8000, rel=0.01)
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('rtp://239.20.0.104:2006', ('rtp', '239.20.0.104', 2006)),
+    ('udp://@239.20.0.104:2006', ('udp', '239.20.0.104', 2006)),
+    ('http://192.168.1.1:4022/rtp/239.20.0.104:2006', ('rtp', '239.20.0.104', 2006)),
+])
+def test_parse_stream_address(url, expected):
+    assert parse_stream_address(url) == expected
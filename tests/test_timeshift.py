@@ -0,0 +1,26 @@
+from iptv_stream import TS_PACKET_SIZE
+from iptv_timeshift import TimeshiftRing
+
+
+def packets(start, count):
+    # 每个TS包的内容为其序号，便于检查读取位置
+    return b''.join(bytes([0x47]) + (start + index).to_bytes(4, 'big') * 46 + bytes(3) for index in range(count))
+
+
+def test_ring_read_skips_data_of_write_in_flight(tmp_path):
+    ring = TimeshiftRing(str(tmp_path / 'ring.ts'), TS_PACKET_SIZE * 1000)
+    total = 1100
+    for start in range(0, total, 50):
+        ring.write(memoryview(packets(start, 50)))
+    assert ring.written == total * TS_PACKET_SIZE
+    assert ring.readable() == ring.oldest() == 100 * TS_PACKET_SIZE
+    assert ring.read(ring.oldest(), TS_PACKET_SIZE * 2) == packets(100, 2)
+    # 跨越文件末尾的读取
+    assert ring.read(ring.written - TS_PACKET_SIZE * 150, TS_PACKET_SIZE * 150) == packets(total - 150, 150)
+    assert ring.read(ring.written, TS_PACKET_SIZE) is None
+
+    # 录制线程已开始复制下一段数据，但还没有增加written
+    ring.writing = ring.written + TS_PACKET_SIZE * 50
+    assert ring.read(ring.oldest(), TS_PACKET_SIZE) is None
+    assert ring.read(ring.oldest() + TS_PACKET_SIZE * 49, TS_PACKET_SIZE) is None
+    assert ring.read(ring.readable(), TS_PACKET_SIZE) == packets(150, 1)